@@ -1,5 +1,17 @@
 from dynamics import *
 from environment import *
 from event import *
+from ratetable import *
+from networkarrays import *
+from sampling import *
+from mobility import *
+from activation import *
+from recorder import *
+from resultstore import *
+from projection import *
+from statistics import *
+from aggregation import *
+from eventtrace import *
+from checkpoint import *
 from visual import *
 from results import *
\ No newline at end of file
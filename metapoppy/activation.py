@@ -0,0 +1,80 @@
+from environment import *
+
+
+class ActivationRule(object):
+    """
+    A rule for when a patch becomes active. Rules declare the compartments and patch attributes they watch, so that an
+    inactive patch is only checked when one of these changes.
+    """
+
+    def watched_compartments(self):
+        return []
+
+    def watched_patch_attributes(self):
+        return []
+
+    def compartment_groups(self):
+        """
+        Compartment groups read by the rule, to be registered on the network
+        :return: dict of Key: group name, Value: list of compartments
+        """
+        return {}
+
+    def initially_active_patches(self, network):
+        """
+        Patches which are active as soon as the network is reset (before any updates)
+        :param network:
+        :return:
+        """
+        return []
+
+    def is_satisfied(self, network, patch_id):
+        """
+        Determine whether the patch should be active under this rule
+        :param network:
+        :param patch_id:
+        :return:
+        """
+        raise NotImplementedError
+
+
+class CompartmentActivation(ActivationRule):
+    """
+    Patch becomes active when the total of the given compartments exceeds a threshold (by default, when any are
+    present).
+    """
+
+    def __init__(self, compartments, threshold=0):
+        assert threshold >= 0, "Threshold cannot be negative (patches are empty when reset)"
+        self._compartments = compartments
+        self._threshold = threshold
+        if len(compartments) == 1:
+            self._value_key = compartments[0]
+        else:
+            self._value_key = Environment.compartment_group_name(compartments)
+
+    def watched_compartments(self):
+        return self._compartments
+
+    def compartment_groups(self):
+        if len(self._compartments) == 1:
+            return {}
+        return {self._value_key: self._compartments}
+
+    def is_satisfied(self, network, patch_id):
+        return network.get_compartment_value(patch_id, self._value_key) > self._threshold
+
+
+class PatchTypeActivation(ActivationRule):
+    """
+    All patches of the given type are always active.
+    """
+
+    def __init__(self, patch_type):
+        self._patch_type = patch_type
+
+    def initially_active_patches(self, network):
+        return network.get_patches_by_type(self._patch_type)
+
+    def is_satisfied(self, network, patch_id):
+        return network.node[patch_id][TypedEnvironment.PATCH_TYPE] == self._patch_type
@@ -0,0 +1,276 @@
+import math
+import numpy
+
+
+class WelfordAccumulator(object):
+    """
+    Running mean and variance of an array of values over many samples (Welford's algorithm), held per cell of the
+    array. Cells with no value in a sample (NaN) are skipped, so each cell has its own count. Accumulators of separate
+    sets of samples (e.g. from different worker processes) can be merged.
+    """
+
+    def __init__(self, shape):
+        self._count = numpy.zeros(shape, dtype=numpy.int64)
+        self._mean = numpy.zeros(shape, dtype=numpy.float)
+        self._m2 = numpy.zeros(shape, dtype=numpy.float)
+
+    def add(self, values):
+        """
+        Add a sample
+        :param values: Array of the shape of the accumulator (NaN where there is no value)
+        :return:
+        """
+        present = ~numpy.isnan(values)
+        self._count += present
+        delta = numpy.where(present, values - self._mean, 0.0)
+        self._mean += numpy.where(present, delta / numpy.maximum(self._count, 1), 0.0)
+        self._m2 += numpy.where(present, delta * (values - self._mean), 0.0)
+
+    def merge(self, other):
+        """
+        Add all of the samples of another accumulator (of the same shape)
+        :param other: WelfordAccumulator
+        :return:
+        """
+        count = self._count + other._count
+        safe_count = numpy.maximum(count, 1)
+        delta = other._mean - self._mean
+        self._m2 = self._m2 + other._m2 + delta ** 2 * self._count * other._count / safe_count
+        self._mean = numpy.where(count > 0, self._mean + delta * other._count / safe_count, 0.0)
+        self._count = count
+
+    def count(self):
+        return self._count
+
+    def mean(self):
+        """
+        Mean of each cell (NaN where there are no samples)
+        :return:
+        """
+        return numpy.where(self._count > 0, self._mean, numpy.nan)
+
+    def variance(self):
+        """
+        Sample variance of each cell (NaN where there are fewer than two samples)
+        :return:
+        """
+        return numpy.where(self._count > 1, self._m2 / numpy.maximum(self._count - 1, 1), numpy.nan)
+
+
+class QuantileSketch(object):
+    """
+    Mergeable sketch of the distribution of values in each cell of an array over many samples, from which quantiles can
+    be estimated to within a relative accuracy. Values are counted in logarithmically sized buckets (so the estimate of
+    a quantile is within the relative accuracy of a value in the data). Only the buckets holding values are stored, as
+    a sorted array of (cell, bucket) keys with counts, so the size depends on the spread of values rather than the
+    number of samples. Values must be non-negative; those below the minimum value (including zero) share a bucket.
+    """
+
+    def __init__(self, shape, relative_accuracy=0.01, min_value=1e-3, max_value=1e12):
+        """
+        Create a sketch
+        :param shape: Shape of the array of values
+        :param relative_accuracy: Relative accuracy of quantiles
+        :param min_value: Smallest value distinguished from zero
+        :param max_value: Largest value distinguished (larger values are counted as it)
+        """
+        self._shape = tuple(shape)
+        self._gamma = (1.0 + relative_accuracy) / (1.0 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._min_index = int(math.ceil(math.log(min_value) / self._log_gamma))
+        self._max_index = int(math.ceil(math.log(max_value) / self._log_gamma))
+        # Bucket 0 holds values below the minimum
+        self._num_buckets = self._max_index - self._min_index + 2
+        self._keys = numpy.zeros(0, dtype=numpy.int64)
+        self._counts = numpy.zeros(0, dtype=numpy.int64)
+
+    def _buckets(self, values):
+        buckets = numpy.zeros(values.shape, dtype=numpy.int64)
+        positive = values >= math.exp(self._min_index * self._log_gamma)
+        indices = numpy.ceil(numpy.log(values[positive]) / self._log_gamma).astype(numpy.int64)
+        buckets[positive] = numpy.clip(indices, self._min_index, self._max_index) - self._min_index + 1
+        return buckets
+
+    def _bucket_values(self, buckets):
+        """
+        Representative value of each bucket
+        :param buckets:
+        :return:
+        """
+        indices = buckets + self._min_index - 1
+        return numpy.where(buckets > 0, 2.0 * self._gamma ** indices / (self._gamma + 1.0), 0.0)
+
+    def _add_counts(self, keys, counts):
+        keys = numpy.concatenate([self._keys, keys])
+        counts = numpy.concatenate([self._counts, counts])
+        self._keys, inverse = numpy.unique(keys, return_inverse=True)
+        self._counts = numpy.bincount(inverse, weights=counts, minlength=len(self._keys)).astype(numpy.int64)
+
+    def add(self, values):
+        """
+        Add a sample
+        :param values: Array of the shape of the sketch (NaN where there is no value)
+        :return:
+        """
+        values = numpy.asarray(values, dtype=numpy.float).reshape(-1)
+        cells = numpy.flatnonzero(~numpy.isnan(values))
+        assert not (values[cells] < 0).any(), "Sketched values must not be negative"
+        keys = cells * self._num_buckets + self._buckets(values[cells])
+        self._add_counts(keys, numpy.ones(len(keys), dtype=numpy.int64))
+
+    def merge(self, other):
+        """
+        Add all of the samples of another sketch (of the same shape and accuracy)
+        :param other: QuantileSketch
+        :return:
+        """
+        assert other._shape == self._shape and other._gamma == self._gamma and \
+            other._num_buckets == self._num_buckets, "Sketches are not compatible"
+        self._add_counts(other._keys, other._counts)
+
+    def size(self):
+        """
+        Number of (cell, bucket) counts held
+        :return:
+        """
+        return len(self._keys)
+
+    def quantile(self, q):
+        """
+        Estimate a quantile of each cell
+        :param q: Quantile, in [0, 1]
+        :return: Array of the shape of the sketch (NaN where there are no samples)
+        """
+        num_cells = int(numpy.prod(self._shape))
+        result = numpy.full(num_cells, numpy.nan)
+        if not len(self._keys):
+            return result.reshape(self._shape)
+        cells = self._keys // self._num_buckets
+        buckets = self._keys % self._num_buckets
+        cumulative = numpy.cumsum(self._counts)
+        # Keys are sorted, so the buckets of each cell are contiguous
+        starts = numpy.flatnonzero(numpy.r_[True, cells[1:] != cells[:-1]])
+        ends = numpy.r_[starts[1:], len(cells)]
+        before = numpy.r_[0, cumulative][starts]
+        totals = cumulative[ends - 1] - before
+        # Rank of the quantile within each cell, then the first bucket reaching it
+        ranks = before + numpy.floor(q * (totals - 1)).astype(numpy.int64)
+        positions = numpy.searchsorted(cumulative, ranks, side='right')
+        result[cells[starts]] = self._bucket_values(buckets[positions])
+        return result.reshape(self._shape)
+
+
+class RepetitionAggregator(object):
+    """
+    Aggregate of the compartment values of many runs (e.g. repetitions of a parameter sample), folded in one run at a
+    time as each finishes so only the aggregate is held. Gives the mean, variance and quantiles of each compartment at
+    each patch at each record time. Runs are aligned to the record times, patches and compartments of the aggregator;
+    patches not recorded in a run (e.g. not active) are left out of the statistics for that run.
+
+    Aggregates of different sets of runs (e.g. from different worker processes) can be merged. Aggregators can be
+    pickled.
+    """
+
+    def __init__(self, times, patches, compartments, quantiles=True, relative_accuracy=0.01):
+        """
+        Create an aggregator
+        :param times: Record times
+        :param patches: Patch IDs
+        :param compartments: Compartments (or compartment groups, if recorded)
+        :param quantiles: Whether to sketch the distributions for quantiles
+        :param relative_accuracy: Relative accuracy of the quantile sketches
+        """
+        self._times = numpy.asarray(times, dtype=numpy.float)
+        self._patches = list(patches)
+        self._patch_index = {p: i for i, p in enumerate(self._patches)}
+        self._compartments = list(compartments)
+        shape = (len(self._times), len(self._patches), len(self._compartments))
+        self._moments = WelfordAccumulator(shape)
+        self._sketch = QuantileSketch(shape, relative_accuracy) if quantiles else None
+        self._num_runs = 0
+
+    def times(self):
+        return self._times
+
+    def patches(self):
+        return self._patches
+
+    def compartments(self):
+        return self._compartments
+
+    def num_runs(self):
+        return self._num_runs
+
+    def _aligned(self, run):
+        """
+        Values of a run aligned to the times, patches and compartments of the aggregator (NaN where not recorded)
+        :param run: ResultRecorder or StoredRun
+        :return:
+        """
+        values = numpy.full((len(self._times), len(self._patches), len(self._compartments)), numpy.nan)
+        run_times = numpy.round(numpy.asarray(run.times(), dtype=numpy.float), 7)
+        time_index = numpy.searchsorted(numpy.round(self._times, 7), run_times)
+        time_rows = numpy.flatnonzero((time_index < len(self._times)) &
+                                      (self._times[numpy.minimum(time_index, len(self._times) - 1)].round(7) ==
+                                       run_times))
+        run_patches = [i for i, p in enumerate(run.patches()) if p in self._patch_index]
+        run_compartments = [(j, self._compartments.index(c)) for j, c in enumerate(run.compartments())
+                            if c in self._compartments]
+        if not len(time_rows) or not run_patches or not run_compartments:
+            return values
+        run_values = numpy.asarray(run.compartment_values())[time_rows][:, run_patches][:, :, [j for j, _ in
+                                                                                            run_compartments]]
+        recorded = numpy.asarray(run.recorded())[time_rows][:, run_patches]
+        run_values = numpy.where(recorded[:, :, numpy.newaxis], run_values, numpy.nan)
+        rows = time_index[time_rows]
+        columns = [self._patch_index[run.patches()[i]] for i in run_patches]
+        values[numpy.ix_(rows, columns, [k for _, k in run_compartments])] = run_values
+        return values
+
+    def add_run(self, run):
+        """
+        Fold a finished run into the aggregate
+        :param run: Recorder of the run (ResultRecorder, or the recorder of Dynamics after do) or StoredRun
+        :return:
+        """
+        values = self._aligned(run)
+        self._moments.add(values)
+        if self._sketch is not None:
+            self._sketch.add(values)
+        self._num_runs += 1
+
+    def merge(self, other):
+        """
+        Merge the aggregate of other runs (with the same times, patches and compartments)
+        :param other: RepetitionAggregator
+        :return:
+        """
+        assert other._patches == self._patches and other._compartments == self._compartments and \
+            numpy.array_equal(other._times, self._times), "Aggregates are not of the same values"
+        self._moments.merge(other._moments)
+        if self._sketch is not None:
+            assert other._sketch is not None, "Other aggregate has no quantile sketch"
+            self._sketch.merge(other._sketch)
+        self._num_runs += other._num_runs
+
+    def count(self):
+        """
+        Number of runs in which each value was recorded
+        :return: Array of (time x patch x compartment)
+        """
+        return self._moments.count()
+
+    def mean(self):
+        return self._moments.mean()
+
+    def variance(self):
+        return self._moments.variance()
+
+    def quantile(self, q):
+        """
+        Estimated quantile of each value over the runs
+        :param q: Quantile, in [0, 1]
+        :return: Array of (time x patch x compartment)
+        """
+        assert self._sketch is not None, "Quantiles not sketched"
+        return self._sketch.quantile(q)
@@ -0,0 +1,120 @@
+import os
+import time
+import pickle
+
+
+class Checkpointer(object):
+    """
+    Writes checkpoints of a run to a directory, so that a run which is interrupted (e.g. by the node being pre-empted)
+    can be resumed. A checkpoint is written whenever the given interval of simulated time, or of wall-clock time, has
+    passed since the last (or the start of the run). Only the latest checkpoint is kept, replaced in a single step so an
+    interruption while writing leaves the previous one. The checkpoint is removed once the run is complete.
+
+    Checking whether a checkpoint is due happens at every event, so the wall clock is only read once every
+    WALL_CLOCK_STRIDE checks (a wall-clock checkpoint may be written a few events late).
+
+    A directory holds the checkpoint of a single run, so each run to be resumed needs its own directory.
+    """
+
+    FILENAME = 'checkpoint.pkl'
+
+    # Number of checks between readings of the wall clock
+    WALL_CLOCK_STRIDE = 1000
+
+    def __init__(self, directory, simulated_interval=None, wall_clock_interval=None,
+                 wall_clock_stride=WALL_CLOCK_STRIDE):
+        """
+        Create a checkpointer
+        :param directory: Directory to write the checkpoint to
+        :param simulated_interval: Interval of simulated time between checkpoints (None for no limit)
+        :param wall_clock_interval: Interval of wall-clock time (seconds) between checkpoints (None for no limit)
+        :param wall_clock_stride: Number of checks between readings of the wall clock
+        """
+        assert simulated_interval is not None or wall_clock_interval is not None, "No checkpoint interval given"
+        self._directory = directory
+        self._simulated_interval = simulated_interval
+        self._wall_clock_interval = wall_clock_interval
+        self._next_time = None
+        self._next_wall_clock = None
+        self._wall_clock_stride = wall_clock_stride
+        self._checks_to_wall_clock = wall_clock_stride
+        self._written = 0
+
+    def directory(self):
+        return self._directory
+
+    def filename(self):
+        return os.path.join(self._directory, Checkpointer.FILENAME)
+
+    def num_written(self):
+        """
+        Number of checkpoints written in the current run
+        :return:
+        """
+        return self._written
+
+    def start(self, simulated_time):
+        """
+        Start (or resume) a run at the given time
+        :param simulated_time:
+        :return:
+        """
+        self._written = 0
+        self._schedule(simulated_time)
+
+    def _schedule(self, simulated_time):
+        if self._simulated_interval is not None:
+            self._next_time = simulated_time + self._simulated_interval
+        if self._wall_clock_interval is not None:
+            self._next_wall_clock = time.time() + self._wall_clock_interval
+            self._checks_to_wall_clock = self._wall_clock_stride
+
+    def due(self, simulated_time):
+        """
+        Whether a checkpoint is due at the given time (the wall clock is only read every wall_clock_stride checks)
+        :param simulated_time:
+        :return:
+        """
+        if self._next_time is not None and simulated_time >= self._next_time:
+            return True
+        if self._next_wall_clock is None:
+            return False
+        self._checks_to_wall_clock -= 1
+        if self._checks_to_wall_clock > 0:
+            return False
+        self._checks_to_wall_clock = self._wall_clock_stride
+        return time.time() >= self._next_wall_clock
+
+    def write(self, simulated_time, state):
+        """
+        Write a checkpoint, replacing the previous one
+        :param simulated_time:
+        :param state: State of the run (must be picklable)
+        :return:
+        """
+        if not os.path.isdir(self._directory):
+            os.makedirs(self._directory)
+        filename = self.filename()
+        with open(filename + '.tmp', 'wb') as checkpoint_file:
+            pickle.dump(state, checkpoint_file, pickle.HIGHEST_PROTOCOL)
+        os.rename(filename + '.tmp', filename)
+        self._written += 1
+        self._schedule(simulated_time)
+
+    def latest(self):
+        """
+        The latest checkpoint written
+        :return: State of the run, or None if there is no checkpoint
+        """
+        if not os.path.exists(self.filename()):
+            return None
+        with open(self.filename(), 'rb') as checkpoint_file:
+            return pickle.load(checkpoint_file)
+
+    def clear(self):
+        """
+        Remove the checkpoint (the run is complete)
+        :return:
+        """
+        if os.path.exists(self.filename()):
+            os.remove(self.filename())
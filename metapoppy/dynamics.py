@@ -1,11 +1,18 @@
 import epyc
 import math
 from environment import *
-import copy
+from ratetable import *
+from wellmixed import *
+from event import FusedEvent
+from activation import *
+from recorder import *
+from statistics import *
+from eventtrace import *
+from checkpoint import *
 import numpy
-import itertools
 import heapq
 import sys
+import copy
 
 # Lambda - used to ensure that posted event is a lambda function (see PostEvent function)
 LAMBDA = lambda: 0
@@ -20,10 +27,48 @@ class Dynamics(epyc.Experiment, object):
     sample, the network is set to an empty state and then seeded using the seed values. Patches can be determined to be
     "active" based on their values.
 
+    Models may declare activation rules (e.g. a patch becomes active when it contains bacteria), in which case an
+    inactive patch is only checked for activation when a compartment or attribute watched by a rule changes, and only
+    seeded patches (plus those active from the outset) are visited when a repetition is set up. Otherwise, every update
+    to an inactive patch is checked with _patch_is_active.
+
+    Rates are held in rate tables - one per patch type for typed environments (holding only the events which can occur
+    at that type of patch), otherwise a single table for all patches.
+
+    The tables are built for each parameter sample once the event parameters are known, and (unless switched off with
+    set_optimise) the events they hold are optimised: events with a zero reaction parameter are removed (unless the
+    parameter is changed during runs - see _scheduled_parameters), events with identical state variables and
+    dependencies are fused into a single column, and columns are ordered by how often their events have fired in
+    previous runs. What was removed and fused is given by optimisation_report.
+
+    Well-mixed models (with at most WELL_MIXED_PATCHES patches) are run by a faster path: their rates are held in
+    flat lists rather than arrays (see WellMixedRateTable) and each event's updates are propagated directly as they are
+    made rather than collected into a transaction. If every event is simple (see WellMixedEngine), the compartments are
+    also held in a flat list and events are performed by a direct loop, without the network. Results are in the same
+    format. The path is chosen automatically from the size of the network, unless set with set_well_mixed.
+
     All events calculate their rates for the active patches based on the patch contents. An event/patch combination is
     chosen probabilistically based on the individual rates, and a time-step for the event to occur if chosen based on
     the total rates, as per the Gillespie Algorithm. The event is performed, the network is updated and the updates are
     propagated to recalculate the rates of events. The process continues until a time limit is reached.
+
+    The values of the active patches (and optionally the edges) are recorded at every record interval into a columnar
+    ResultRecorder (or another recorder given by set_recorder, e.g. a DeltaRecorder), available from recorder() after a
+    run. do returns them in the form of the network data, or, if a ResultStore has been set, streams them to disk in
+    chunks and returns a reference to the run. What is recorded can be restricted with an OutputProjection.
+
+    Summary statistics (see SummaryStatistic) can be updated as a run progresses instead of, or as well as, recording
+    snapshots. If any are used, the results of a run are a dict of the statistics (STATISTICS) and the snapshots
+    (SNAPSHOTS, if recorded).
+
+    A run can be traced (see set_record_trace) - every event performed is appended to a compact EventTrace, from which
+    replay reconstructs the network at any times afterwards without recalculating rates. Posted events are replayed by
+    the parameter changes they make, so must not change the network directly.
+
+    Long runs can be checkpointed (see set_checkpoint) - the state of the run (network, rate tables, active patches,
+    posted events, results so far, summary statistics and the state of the random number generator) is written at a
+    set interval of simulated or wall-clock time, and do resumes an interrupted run from its latest checkpoint. Posted
+    events must then be given by the name of a method, rather than as a lambda function.
     """
 
     INITIAL_TIME = 'initial_time'
@@ -36,6 +81,32 @@ class Dynamics(epyc.Experiment, object):
     DEFAULT_START_TIME = 0.0
     DEFAULT_RESULT_INTERVAL = 1.0
 
+    # Largest network run with the well-mixed path
+    WELL_MIXED_PATCHES = 2
+
+    # Keys of the results of a run when summary statistics are used
+    STATISTICS = 'statistics'
+    SNAPSHOTS = 'snapshots'
+
+    # Keys of the state of a run (see _run_state)
+    RUN_PARAMETERS = 'parameters'
+    RUN_TIME = 'time'
+    RUN_NEXT_RECORD_TIME = 'next_record_time'
+    RUN_NETWORK = 'network'
+    RUN_RATE_TABLES = 'rate_tables'
+    RUN_RATE_TABLE_COLUMNS = 'rate_table_columns'
+    RUN_ACTIVE_PATCHES = 'active_patches'
+    RUN_POSTED_EVENTS = 'posted_events'
+    RUN_EVENT_PARAMETERS = 'event_parameters'
+    RUN_RECORDER = 'recorder'
+    RUN_STATISTICS = 'statistics'
+    RUN_STATISTICS_TIME = 'statistics_time'
+    RUN_RNG_STATE = 'rng_state'
+
+    # Keys of the optimisation report
+    REMOVED_EVENTS = 'removed_events'
+    FUSED_EVENTS = 'fused_events'
+
     def __init__(self, network=None):
         """
         Create MetapopPy dynamics to run over the given network.
@@ -44,28 +115,49 @@ class Dynamics(epyc.Experiment, object):
         epyc.Experiment.__init__(self)
 
         # Initialise variables
-        self._network = self._rate_table = self._patch_seeding = self._edge_seeding = None
+        self._network = self._patch_seeding = self._edge_seeding = None
 
-        self._row_for_patch = {}
         self._active_patches = []
 
         # Create the events
         self._events = self._create_events()
         assert self._events, "No events created"
 
-        # Create dependency matrices
-        self._comp_dependencies = {c: [] for c in network.compartments()}
-        self._patch_att_dependencies = {a: [] for a in network.patch_attributes()}
-        self._edge_att_dependencies = {a: [] for a in network.edge_attributes()}
-
-        for col in range(len(self._events)):
-            event = self._events[col]
-            for c in event.get_dependent_compartments():
-                self._comp_dependencies[c].append(col)
-            for a in event.get_dependent_patch_attributes():
-                self._patch_att_dependencies[a].append(col)
-            for a in event.get_dependent_edge_attributes():
-                self._edge_att_dependencies[a].append(col)
+        # Activation rules, and the compartments and patch attributes they watch
+        self._activation_rules = self._create_activation_rules()
+        self._activation_compartments = set()
+        self._activation_patch_attributes = set()
+        for rule in self._activation_rules:
+            self._activation_compartments.update(rule.watched_compartments())
+            self._activation_patch_attributes.update(rule.watched_patch_attributes())
+
+        # Rate table optimisation - fused events are kept between samples (so firings are counted against the same
+        # event), as are the number of firings of each event
+        self._optimise = True
+        # Whether to use the well-mixed path (None to choose from the size of the network), and the updates memoised
+        # for it (valid for the given number of active patches)
+        self._well_mixed = None
+        self._well_mixed_plans = {}
+        self._well_mixed_plan_patches = 0
+        self._optimisation_report = {Dynamics.REMOVED_EVENTS: [], Dynamics.FUSED_EVENTS: []}
+        self._removed_reaction_parameters = set()
+        self._fused_events = {}
+        self._firing_counts = {}
+
+        # Rate tables - state variables and reaction parameters of events at the active patches. Each table compiles
+        # the dependencies of its events (within a patch and across patches) into the columns to update for a change.
+        self._rate_tables = []
+        self._rate_table_for_type = {}
+        self._rate_table_for_patch = {}
+        self._neighbour_compartments = set()
+        if network:
+            self._compile_rate_tables(network)
+
+        # Parameter dependency table - the events which require each parameter
+        self._events_for_parameter = {}
+        for event in self._events:
+            for p in event.parameter_keys():
+                self._events_for_parameter.setdefault(p, []).append(event)
 
         # Set the network prototype if one has been provided - this will be the network used for all runs.
         # If not provided, a network must be created during configure stage.
@@ -75,6 +167,20 @@ class Dynamics(epyc.Experiment, object):
         self._start_time = self.DEFAULT_START_TIME
         self._max_time = self.DEFAULT_MAX_TIME
         self._record_interval = self.DEFAULT_RESULT_INTERVAL
+        # Recorder of results (columnar, see ResultRecorder)
+        self._recorder = ResultRecorder()
+        self._output_projection = self._create_output_projection()
+        # Summary statistics updated during each run (the current time is held while they are being updated), and
+        # whether snapshots are recorded as well
+        self._statistics = self._create_summary_statistics()
+        self._statistics_time = None
+        self._record_snapshots = True
+        # Whether runs are traced, the trace of the latest run, and the trace being written (None when not tracing)
+        self._record_trace = False
+        self._trace = None
+        self._tracing = None
+        # Writer of checkpoints of each run (None if not checkpointed)
+        self._checkpointer = None
 
         # Posted events - will occur at set times
         self._posted_events = []
@@ -86,6 +192,143 @@ class Dynamics(epyc.Experiment, object):
         """
         raise NotImplementedError
 
+    def _create_activation_rules(self):
+        """
+        Create the rules for when patches become active. Default is no rules (_patch_is_active is used instead).
+        :return: List of ActivationRule
+        """
+        return []
+
+    def _create_output_projection(self):
+        """
+        Create the projection of what is recorded of each run. Default is None (everything at every active patch).
+        :return: OutputProjection
+        """
+        return None
+
+    def _create_summary_statistics(self):
+        """
+        Create the summary statistics to update during each run. Default is none.
+        :return: List of SummaryStatistic
+        """
+        return []
+
+    def _scheduled_parameters(self):
+        """
+        Parameters which may be changed during a run (with update_parameter), so the events they scale must be kept in
+        the rate tables even if their initial value is zero. Default is none.
+        :return:
+        """
+        return []
+
+    def _compile_rate_tables(self, network, events=None, optimise=False):
+        """
+        Create the rate tables for the network. A typed environment has a table for each patch type, containing only
+        the events which can occur at that type of patch. Otherwise, a single table contains all events.
+        :param network:
+        :param events: Events to hold in the tables (all events if not given)
+        :param optimise: Whether to fuse and reorder the columns of the tables
+        :return:
+        """
+        if events is None:
+            events = self._events
+        columns = self._table_columns if optimise else (lambda x: x)
+        table_class = WellMixedRateTable if self._is_well_mixed(network) else RateTable
+        if isinstance(network, TypedEnvironment):
+            self._rate_table_for_type = {t: table_class(columns([e for e in events if e.applies_to_patch_type(t)]), t)
+                                         for t in network.patch_types()}
+        else:
+            self._rate_table_for_type = {None: table_class(columns(events))}
+        self._rate_tables = self._rate_table_for_type.values()
+        self._rate_table_for_patch = {}
+        # Changes to other compartments need not be propagated to neighbours
+        self._neighbour_compartments = set(c for t in self._rate_tables for c in t.neighbour_compartments())
+
+    def _table_columns(self, events):
+        """
+        The columns of an optimised rate table holding the given events. Events which can be fused are fused and the
+        columns are ordered by the number of times their events have fired (most first).
+        :param events:
+        :return: List of events
+        """
+        columns = []
+        fusable = {}
+        for e in events:
+            key = e.fusion_key()
+            if key is None:
+                columns.append(e)
+            elif key in fusable:
+                fusable[key].append(e)
+            else:
+                fusable[key] = [e]
+                columns.append(key)
+        for i in range(len(columns)):
+            if isinstance(columns[i], tuple):
+                members = fusable[columns[i]]
+                if len(members) == 1:
+                    columns[i] = members[0]
+                else:
+                    fused = self._fused_events.setdefault(tuple(members), FusedEvent(members))
+                    if fused.reaction_parameter_keys() not in self._optimisation_report[Dynamics.FUSED_EVENTS]:
+                        self._optimisation_report[Dynamics.FUSED_EVENTS].append(fused.reaction_parameter_keys())
+                    columns[i] = fused
+        # Stable sort, so the original order is kept until events have fired
+        return sorted(columns, key=lambda e: -self._firing_counts.get(e, 0))
+
+    def _remove_unused_events(self):
+        """
+        Events whose reaction parameter is zero, and is not changed during runs, can never occur so are left out of the
+        rate tables.
+        :return: Events to be held in the rate tables
+        """
+        scheduled = set(self._scheduled_parameters())
+        events = []
+        self._removed_reaction_parameters = set()
+        for e in self._events:
+            if not e.reaction_parameter_value() and e.reaction_parameter() not in scheduled:
+                self._optimisation_report[Dynamics.REMOVED_EVENTS].append(e.reaction_parameter())
+                self._removed_reaction_parameters.add(e.reaction_parameter())
+            else:
+                events.append(e)
+        # A parameter shared with an event which is kept can still be updated
+        for e in events:
+            self._removed_reaction_parameters.discard(e.reaction_parameter())
+        return events
+
+    def set_optimise(self, optimise):
+        """
+        Set whether the events held in the rate tables are optimised (see optimisation_report)
+        :param optimise:
+        :return:
+        """
+        self._optimise = optimise
+
+    def set_well_mixed(self, well_mixed):
+        """
+        Set whether to use the well-mixed path
+        :param well_mixed: True or False, or None to choose from the size of the network
+        :return:
+        """
+        self._well_mixed = well_mixed
+
+    def _is_well_mixed(self, network):
+        """
+        Whether the dynamics on the network are run with the well-mixed path
+        :param network:
+        :return:
+        """
+        if self._well_mixed is None:
+            return len(network) <= Dynamics.WELL_MIXED_PATCHES
+        return self._well_mixed
+
+    def optimisation_report(self):
+        """
+        What was changed when optimising the rate tables for the current parameter sample
+        :return: dict of REMOVED_EVENTS: reaction parameters of the events removed, FUSED_EVENTS: list of the reaction
+        parameters of each set of events fused into a single column
+        """
+        return self._optimisation_report
+
     def required_event_parameters(self):
         """
         All parameters which are required by the model
@@ -122,6 +365,93 @@ class Dynamics(epyc.Experiment, object):
         """
         self._record_interval = record_interval
 
+    def set_recorder(self, recorder):
+        """
+        Set the recorder of results (e.g. a DeltaRecorder, to store only the values which change between record times)
+        :param recorder: ResultRecorder
+        :return:
+        """
+        self._recorder = recorder
+
+    def set_output_projection(self, projection):
+        """
+        Set the projection of what is recorded (overriding that of the model). Must be set before configure, so any
+        compartment groups it records are registered on the network.
+        :param projection: OutputProjection, or None to record everything
+        :return:
+        """
+        self._output_projection = projection
+
+    def add_summary_statistic(self, statistic):
+        """
+        Add a summary statistic to update during each run. Must be added before configure, so any compartment groups it
+        reads are registered on the network.
+        :param statistic: SummaryStatistic
+        :return:
+        """
+        self._statistics.append(statistic)
+
+    def set_record_snapshots(self, record_snapshots):
+        """
+        Set whether snapshots of the network are recorded at each record interval. If not, only the summary statistics
+        are given as the results of a run.
+        :param record_snapshots:
+        :return:
+        """
+        self._record_snapshots = record_snapshots
+
+    def set_record_trace(self, record_trace):
+        """
+        Set whether each run is traced (see trace and replay)
+        :param record_trace:
+        :return:
+        """
+        self._record_trace = record_trace
+
+    def trace(self):
+        """
+        The trace of the latest run (if traced)
+        :return: EventTrace
+        """
+        return self._trace
+
+    def set_checkpoint(self, directory, simulated_interval=None, wall_clock_interval=None):
+        """
+        Set runs to be checkpointed, at an interval of simulated time or of wall-clock time (whichever comes first). A
+        run started by do when the directory holds a checkpoint is resumed from it instead, so the directory should be
+        changed for each run (e.g. per sample and repetition).
+        :param directory: Directory to write the checkpoint to (None to stop checkpointing)
+        :param simulated_interval: Interval of simulated time between checkpoints
+        :param wall_clock_interval: Interval of wall-clock time (seconds) between checkpoints
+        :return:
+        """
+        self._checkpointer = Checkpointer(directory, simulated_interval, wall_clock_interval) \
+            if directory is not None else None
+
+    def set_record_edges(self, record_edges):
+        """
+        Set whether edge attribute values are recorded along with the patches
+        :param record_edges:
+        :return:
+        """
+        self._recorder.set_record_edges(record_edges)
+
+    def set_result_store(self, store):
+        """
+        Set a store to write the results of each run to as they are recorded (in which case the result of a run is a
+        reference to its directory in the store), or None to hold them in memory
+        :param store: ResultStore
+        :return:
+        """
+        self._recorder.set_store(store)
+
+    def recorder(self):
+        """
+        The recorder holding the results of the latest run, as arrays
+        :return: ResultRecorder
+        """
+        return self._recorder
+
     def network(self):
         """
         The current state of the network this set of dynamics is running upon
@@ -148,17 +478,48 @@ class Dynamics(epyc.Experiment, object):
         assert isinstance(self._network, Environment), "Graph must be instance of MetapopPy Network class"
         assert self._network.nodes(), "Empty network is invalid"
 
+        # Configure events
+        for e in self._events:
+            e.set_parameters(params)
+
+        # Build the rate tables for this sample, optimising the events they hold
+        self._optimisation_report = {Dynamics.REMOVED_EVENTS: [], Dynamics.FUSED_EVENTS: []}
+        if self._optimise:
+            self._compile_rate_tables(self._network, self._remove_unused_events(), optimise=True)
+        else:
+            self._removed_reaction_parameters = set()
+            self._compile_rate_tables(self._network)
+
+        # Register the compartment groups read by events and activation rules, so their sums are maintained by the
+        # network
+        for e in self._events:
+            for group, compartments in e.get_compartment_groups().iteritems():
+                self._network.add_compartment_group(group, compartments)
+        for rule in self._activation_rules:
+            for group, compartments in rule.compartment_groups().iteritems():
+                self._network.add_compartment_group(group, compartments)
+        if self._output_projection is not None:
+            for group, compartments in self._output_projection.compartment_groups().iteritems():
+                self._network.add_compartment_group(group, compartments)
+        for statistic in self._statistics:
+            for group, compartments in statistic.compartment_groups().iteritems():
+                self._network.add_compartment_group(group, compartments)
+
         # Attach the update handler to the network
-        self._network.set_handlers(lambda p, c, a: self._propagate_patch_update(p, c, a),
-                                   lambda u, v, a: self._propagate_edge_update(u, v, a))
+        if self._is_well_mixed(self._network):
+            patch_handler = lambda p, c, a: self._propagate_patch_update_well_mixed(p, c, a)
+        else:
+            patch_handler = lambda p, c, a: self._propagate_patch_update(p, c, a)
+        self._network.set_handlers(patch_handler,
+                                   lambda u, v, a: self._propagate_edge_update(u, v, a),
+                                   lambda p, e: self._propagate_change_set(p, e))
 
         # Get the initial conditions
         self._patch_seeding = self._get_initial_patch_seeding(params)
         self._edge_seeding = self._get_initial_edge_seeding(params)
 
-        # Configure events
-        for e in self._events:
-            e.set_parameters(params)
+        for t in self._rate_tables:
+            t.set_reaction_parameters()
 
         # Configure time
         if Dynamics.INITIAL_TIME in params:
@@ -188,7 +549,36 @@ class Dynamics(epyc.Experiment, object):
         # Reset the network
         self._network.reset()
 
+        if self._activation_rules:
+            # Only visit the seeded patches, and those active from the outset
+            if self._patch_seeding:
+                for n, seed in self._patch_seeding.iteritems():
+                    self._network.update_patch(n, seed.get(Environment.COMPARTMENTS, {}),
+                                               seed.get(Environment.ATTRIBUTES, {}))
+            initially_active = []
+            for rule in self._activation_rules:
+                for n in rule.initially_active_patches(self._network):
+                    if n not in self._rate_table_for_patch and n not in initially_active:
+                        initially_active.append(n)
+            self._activate_patches(initially_active)
         # Seed the network using the pre-calculated seeding
+        else:
+            self._seed_all_patches()
+
+        if self._edge_seeding:
+            for (u, v), seed in self._edge_seeding.iteritems():
+                self._network.update_edge(u, v, seed)
+
+        # Check that at least one patch is active
+        assert len(self._active_patches) > 0, "No patches are active"
+
+    def _seed_all_patches(self):
+        """
+        Seed every patch on the network - either from its seeding, or by checking if it is active. Unseeded patches
+        which are active are activated together once seeding is complete.
+        :return:
+        """
+        unseeded = []
         for n in self._network.nodes:
             # Patch has a seeding
             if self._patch_seeding and n in self._patch_seeding:
@@ -203,41 +593,115 @@ class Dynamics(epyc.Experiment, object):
                     att_seed = {}
                 self._network.update_patch(n, comp_seed, att_seed)
             # Patch does not have a seeding, need to check if it is active
-            elif n not in self._active_patches and self._patch_is_active(n):
-                self._activate_patch(n)
-
-        if self._edge_seeding:
-            for (u, v), seed in self._edge_seeding.iteritems():
-                self._network.update_edge(u, v, seed)
-
-        # Check that at least one patch is active
-        assert len(self._active_patches) > 0, "No patches are active"
+            else:
+                unseeded.append(n)
+        self._activate_patches([n for n in unseeded if n not in self._rate_table_for_patch and
+                                self._patch_is_active(n)])
 
     def _propagate_patch_update(self, patch_id, compartment_changes, patch_attribute_changes):
         """
         When a patch is changed, update the relevant entries in the rate table. This function is passed as a lambda
         function to the network, and is called whenever a change is made.
+        Events at other patches which depend on the compartments changed at this patch (at neighbours, or at every
+        patch) are also updated.
         :param patch_id:
         :param compartment_changes:
         :param patch_attribute_changes:
         :return:
         """
-        # Check if patch is active
-        # TODO - more efficient way of checking if patch is active
-        active = patch_id in self._active_patches
+        if self._statistics_time is not None and compartment_changes:
+            self._update_statistics(patch_id, compartment_changes)
+
         # If patch is already active
-        if active:
-            row = self._row_for_patch[patch_id]
+        if patch_id in self._rate_table_for_patch:
             # Determine columns (events) to update by finding events which have dependencies on the items changed
-            cols_to_update = set(itertools.chain(*[self._comp_dependencies[c] for c in compartment_changes] +
-                                                  [self._patch_att_dependencies[c] for c in patch_attribute_changes]))
-            for col in cols_to_update:
-                event = self._events[col]
-                self._rate_table[row][col] = event.calculate_rate_at_patch(self._network, patch_id)
+            rate_table = self._rate_table_for_patch[patch_id]
+            rate_table.patch_changed(patch_id)
+            cols_to_update = rate_table.patch_columns(compartment_changes, patch_attribute_changes)
+            if len(cols_to_update):
+                rate_table.update_patch(self._network, patch_id, cols_to_update)
         # Patch is not previously active but should become active from this update
-        elif self._patch_is_active(patch_id):
+        elif self._becomes_active(patch_id, compartment_changes, patch_attribute_changes):
             self._activate_patch(patch_id)
 
+        if compartment_changes:
+            # Events at neighbouring patches dependent on compartments here
+            if not self._neighbour_compartments.isdisjoint(compartment_changes):
+                for neighbour in self._network.neighbours(patch_id):
+                    if neighbour in self._rate_table_for_patch:
+                        rate_table = self._rate_table_for_patch[neighbour]
+                        cols_to_update = rate_table.neighbour_columns(compartment_changes)
+                        if len(cols_to_update):
+                            rate_table.update_patch(self._network, neighbour, cols_to_update)
+            # Events at all patches dependent on compartments here
+            for rate_table in self._rate_tables:
+                cols_to_update = rate_table.network_columns(patch_id, compartment_changes)
+                if len(cols_to_update):
+                    rate_table.update_all_patches(self._network, cols_to_update)
+
+    def _propagate_patch_update_well_mixed(self, patch_id, compartment_changes, patch_attribute_changes):
+        """
+        Propagate a patch update on the well-mixed path. With so few patches, the rows and columns to recalculate for
+        each combination of changes at a patch are worked out once and memoised, until another patch becomes active.
+        :param patch_id:
+        :param compartment_changes:
+        :param patch_attribute_changes:
+        :return:
+        """
+        if patch_id not in self._rate_table_for_patch:
+            self._propagate_patch_update(patch_id, compartment_changes, patch_attribute_changes)
+            return
+        if self._statistics_time is not None and compartment_changes:
+            self._update_statistics(patch_id, compartment_changes)
+        if len(self._rate_table_for_patch) != self._well_mixed_plan_patches:
+            self._well_mixed_plans = {}
+            self._well_mixed_plan_patches = len(self._rate_table_for_patch)
+        key = (patch_id, tuple(compartment_changes), tuple(patch_attribute_changes))
+        try:
+            plan = self._well_mixed_plans[key]
+        except KeyError:
+            updates = {}
+            rate_table = self._rate_table_for_patch[patch_id]
+            updates[patch_id] = set(rate_table.patch_columns(compartment_changes, patch_attribute_changes))
+            if compartment_changes:
+                if not self._neighbour_compartments.isdisjoint(compartment_changes):
+                    for neighbour in self._network.neighbours(patch_id):
+                        if neighbour in self._rate_table_for_patch:
+                            updates.setdefault(neighbour, set()).update(
+                                self._rate_table_for_patch[neighbour].neighbour_columns(compartment_changes))
+                for rate_table in self._rate_tables:
+                    cols = rate_table.network_columns(patch_id, compartment_changes)
+                    for p in rate_table.patches():
+                        updates.setdefault(p, set()).update(cols)
+            plan = [(self._rate_table_for_patch[p], p, tuple(sorted(cols))) for p, cols in updates.iteritems() if cols]
+            self._well_mixed_plans[key] = plan
+        network = self._network
+        for rate_table, p, cols in plan:
+            rate_table.update_patch(network, p, cols)
+
+    def _update_statistics(self, patch_id, compartment_changes):
+        """
+        Tell the summary statistics of changes to compartments at a patch
+        :param patch_id:
+        :param compartment_changes:
+        :return:
+        """
+        for statistic in self._statistics:
+            statistic.patch_changed(self._statistics_time, self._network, patch_id, compartment_changes)
+
+    def _advance_statistics(self, time):
+        """
+        Move the summary statistics forward to the given time (the network is unchanged since they were last moved).
+        Changes after the maximum time are not included in the statistics.
+        :param time:
+        :return:
+        """
+        if self._statistics_time is None:
+            return
+        for statistic in self._statistics:
+            statistic.advance(min(time, self._max_time), self._network)
+        self._statistics_time = time if time <= self._max_time else None
+
     def _propagate_edge_update(self, patch_u, patch_v, edge_attribute_changes):
         """
         If an edge has its attributes changed, propagate the update to events occurring at either end of the edge
@@ -248,76 +712,175 @@ class Dynamics(epyc.Experiment, object):
         :return: 
         """
         for patch_id in [patch_u, patch_v]:
-            # Check if patch is active
-            # TODO - more efficient way of checking if patch is active
-            active = patch_id in self._active_patches
             # If patch is already active
-            if active:
-                row = self._row_for_patch[patch_id]
+            if patch_id in self._rate_table_for_patch:
                 # Determine columns (events) to update by finding events which have dependencies on the items changed
-                cols_to_update = set(itertools.chain(*[self._edge_att_dependencies[a] for a in edge_attribute_changes]))
-                for col in cols_to_update:
-                    event = self._events[col]
-                    self._rate_table[row][col] = event.calculate_rate_at_patch(self._network, patch_id)
+                rate_table = self._rate_table_for_patch[patch_id]
+                rate_table.patch_changed(patch_id)
+                cols_to_update = rate_table.edge_columns(edge_attribute_changes)
+                if len(cols_to_update):
+                    rate_table.update_patch(self._network, patch_id, cols_to_update)
             # Patch is not previously active but should become active from this update
-            elif self._patch_is_active(patch_id):
+            elif self._becomes_active(patch_id, [], []):
+                self._activate_patch(patch_id)
+
+    def _propagate_change_set(self, patch_changes, edge_changes):
+        """
+        Propagate the changes committed by a transaction on the network. The cells (patch and event) affected by all of
+        the changes are found first, so that each is recalculated once. Patches which were not active are then checked
+        for activation.
+        :param patch_changes: dict of Key: patch ID, Value: (compartments changed, patch attributes changed)
+        :param edge_changes: dict of Key: (u, v), Value: edge attributes changed
+        :return:
+        """
+        cells = {}
+        network_cols = {}
+        inactive = []
+        for (u, v), edge_attribute_changes in edge_changes.iteritems():
+            for patch_id in [u, v]:
+                if patch_id in self._rate_table_for_patch:
+                    self._rate_table_for_patch[patch_id].patch_changed(patch_id)
+                    cols = self._rate_table_for_patch[patch_id].edge_columns(edge_attribute_changes)
+                    if len(cols):
+                        cells.setdefault(patch_id, []).append(cols)
+                else:
+                    inactive.append((patch_id, [], []))
+        for patch_id, (compartment_changes, patch_attribute_changes) in patch_changes.iteritems():
+            if self._statistics_time is not None and compartment_changes:
+                self._update_statistics(patch_id, compartment_changes)
+            if patch_id in self._rate_table_for_patch:
+                self._rate_table_for_patch[patch_id].patch_changed(patch_id)
+                cols = self._rate_table_for_patch[patch_id].patch_columns(compartment_changes,
+                                                                          patch_attribute_changes)
+                if len(cols):
+                    cells.setdefault(patch_id, []).append(cols)
+            else:
+                inactive.append((patch_id, compartment_changes, patch_attribute_changes))
+            if compartment_changes:
+                if not self._neighbour_compartments.isdisjoint(compartment_changes):
+                    for neighbour in self._network[patch_id]:
+                        if neighbour in self._rate_table_for_patch:
+                            cols = self._rate_table_for_patch[neighbour].neighbour_columns(compartment_changes)
+                            if len(cols):
+                                cells.setdefault(neighbour, []).append(cols)
+                for rate_table in self._rate_tables:
+                    cols = rate_table.network_columns(patch_id, compartment_changes)
+                    if len(cols):
+                        network_cols.setdefault(rate_table, []).append(cols)
+
+        for rate_table, col_arrays in network_cols.iteritems():
+            rate_table.update_all_patches(self._network, numpy.unique(numpy.concatenate(col_arrays)))
+        for patch_id, col_arrays in cells.iteritems():
+            cols = col_arrays[0] if len(col_arrays) == 1 else numpy.unique(numpy.concatenate(col_arrays))
+            self._rate_table_for_patch[patch_id].update_patch(self._network, patch_id, cols)
+
+        for patch_id, compartment_changes, patch_attribute_changes in inactive:
+            if patch_id not in self._rate_table_for_patch and \
+                    self._becomes_active(patch_id, compartment_changes, patch_attribute_changes):
                 self._activate_patch(patch_id)
 
     def update_parameter(self, parameter, value):
         """
         Change the value of a parameter (e.g. if time-dependent). Will update the relevant columns of the rate table
-        for all events which depend on this parameter.
+        for all events which depend on this parameter - a reaction parameter rescales its columns, any other parameter
+        recalculates the state variables of its columns.
         :param parameter:
         :param value:
         :return:
         """
+        assert parameter not in self._removed_reaction_parameters, \
+            "Parameter {0} scales events removed from the rate tables - declare it in _scheduled_parameters".format(
+                parameter)
         # params = self.parameters()
         # params[parameter] = value
-        # TODO: could be better with a parameter dependency table
-        # Loop through all events
-        for col in range(self._rate_table.shape[1]):
-            event = self._events[col]
-            # Check if changed parameter is needed by the event
-            if parameter in event.parameter_keys():
-                # Update the parameter value on the event
-                event.update_parameter(parameter, value)
-                for row in range(self._rate_table.shape[0]):
-                    # Recalculate the event rate at every patch
-                    patch_id = self._active_patches[row]
-                    self._rate_table[row][col] = event.calculate_rate_at_patch(self._network, patch_id)
+        # Update the parameter value on the events which need it
+        for event in self._events_for_parameter.get(parameter, []):
+            event.update_parameter(parameter, value)
+        if self._tracing is not None:
+            self._tracing.parameter(parameter, value)
+        for rate_table in self._rate_tables:
+            rate_table.update_parameter(self._network, parameter)
+
+    def _becomes_active(self, patch_id, compartment_changes, patch_attribute_changes):
+        """
+        Determine if an inactive patch becomes active from an update. With activation rules, only checked if the
+        update changed something the rules watch.
+        :param patch_id:
+        :param compartment_changes:
+        :param patch_attribute_changes:
+        :return:
+        """
+        if self._activation_rules and self._activation_compartments.isdisjoint(compartment_changes) and \
+                self._activation_patch_attributes.isdisjoint(patch_attribute_changes):
+            return False
+        return self._patch_is_active(patch_id)
 
     def _patch_is_active(self, patch_id):
         """
-        Determine if the given patch is active (from the network). Default is that patches are always active, can be
-        overridden to only process patches based on a given condition.
+        Determine if the given patch is active (from the network). With activation rules, a patch is active if any rule
+        is satisfied. Otherwise default is that patches are always active, can be overridden to only process patches
+        based on a given condition.
         :param patch_id:
         :return:
         """
+        if self._activation_rules:
+            return any(rule.is_satisfied(self._network, patch_id) for rule in self._activation_rules)
         return True
 
     def _activate_patch(self, patch_id):
         """
-        A patch has become active, so create a new row in the rate table for it and determine rates of events there.
+        A patch has become active, so create a new row in the rate table for its patch type and determine rates of
+        events there.
         :param patch_id:
         :return:
         """
-        # Calculate the row number
-        self._row_for_patch[patch_id] = len(self._active_patches)
         # Add to active patch list
         self._active_patches.append(patch_id)
 
         # Create a row of rates - value in each column is rate of an event at this patch
-        rates = numpy.array([e.calculate_rate_at_patch(self._network, patch_id) for e in self._events],
-                            dtype=numpy.float).reshape(1, len(self._events))
-        if self._rate_table is None:
-            # This row becomes the rate table if it's currently empty
-            self._rate_table = rates
+        if isinstance(self._network, TypedEnvironment):
+            rate_table = self._rate_table_for_type[self._network.node[patch_id][TypedEnvironment.PATCH_TYPE]]
         else:
-            # Add the rates for this patch as a new row (build a new table by concatenation)
-            self._rate_table = numpy.concatenate((self._rate_table, rates), 0)
+            rate_table = self._rate_table_for_type[None]
+        self._rate_table_for_patch[patch_id] = rate_table
+        rate_table.add_patch(self._network, patch_id)
 
         # Patch is activated, so seed it
-        # Get seeding
+        self._seed_patch(patch_id)
+
+    def _activate_patches(self, patch_ids):
+        """
+        Many patches have become active, so create their rows in the rate tables together (calculating the rates a
+        column at a time) and then seed each of them.
+        :param patch_ids:
+        :return:
+        """
+        if len(patch_ids) < 2:
+            for patch_id in patch_ids:
+                self._activate_patch(patch_id)
+            return
+        patches_for_table = {}
+        for patch_id in patch_ids:
+            self._active_patches.append(patch_id)
+            if isinstance(self._network, TypedEnvironment):
+                rate_table = self._rate_table_for_type[self._network.node[patch_id][TypedEnvironment.PATCH_TYPE]]
+            else:
+                rate_table = self._rate_table_for_type[None]
+            self._rate_table_for_patch[patch_id] = rate_table
+            patches_for_table.setdefault(rate_table, []).append(patch_id)
+        for rate_table, patches in patches_for_table.iteritems():
+            rate_table.add_patches(self._network, patches)
+        for patch_id in patch_ids:
+            self._seed_patch(patch_id)
+
+    def _seed_patch(self, patch_id):
+        """
+        Seed a newly activated patch
+        :param patch_id:
+        :return:
+        """
+        if self._tracing is not None:
+            self._tracing.activation(patch_id)
         seeding = self._seed_activated_patch(patch_id, self.parameters())
         if Environment.COMPARTMENTS in seeding:
             comp_seeding = seeding[Environment.COMPARTMENTS]
@@ -335,24 +898,64 @@ class Dynamics(epyc.Experiment, object):
 
     def post_event(self, t, event, attributes):
         """
-        Post a event to occur at a set time at a given patch
+        Post a event to occur at a set time at a given patch. The event is either a lambda function or the name of a
+        method of the dynamics (which, unlike a lambda, can be checkpointed), called with the attributes.
         :param t: time to occur
         :param event: the event occurring
         :return:
         """
-        assert isinstance(event, type(LAMBDA)) and event.__name__ == LAMBDA.__name__, \
-            "Posted event must be a lambda function"
+        if isinstance(event, basestring):
+            assert callable(getattr(self, event, None)), "Posted event {0} is not a method".format(event)
+        else:
+            assert isinstance(event, type(LAMBDA)) and event.__name__ == LAMBDA.__name__, \
+                "Posted event must be a lambda function"
         heapq.heappush(self._posted_events, (t, event, attributes))
 
-    def _record_results(self, current_data, record_time, debug=False):
+    def _remove_posted_events(self, name):
+        """
+        Remove the posted events of the given name which have not yet occurred
+        :param name: Name of the method posted
+        :return:
+        """
+        self._posted_events = [e for e in self._posted_events if e[1] != name]
+        heapq.heapify(self._posted_events)
+
+    def _record_results(self, record_time, debug=False):
+        """
+        Record the values of all active patches (and edges, if set) at the given time
+        :param record_time:
+        :param debug:
+        :return:
+        """
+        if not self._record_snapshots:
+            return
         if debug:
             sys.stdout.write("\rt: {0}".format(record_time))
             sys.stdout.flush()
-        # TODO - we don't record edges / non-active patches
-        current_data[record_time] = {}
-        for p in self._active_patches:
-            current_data[record_time][p] = copy.deepcopy(self._network.node[p])
-        return current_data
+        self._recorder.record(record_time, self._network, self._active_patches)
+
+    def _total_rate(self):
+        """
+        Total rate of all events at all active patches, across all rate tables
+        :return:
+        """
+        return sum(t.total() for t in self._rate_tables)
+
+    def _choose_event(self, r):
+        """
+        Choose a patch and event with probability proportional to its rate. First chooses a rate table based on its
+        total, then a patch and event within the table.
+        :param r: Value in range [0, total rate)
+        :return: (patch ID, event)
+        """
+        for rate_table in self._rate_tables:
+            table_total = rate_table.total()
+            if r < table_total:
+                return rate_table.choose(r)
+            r -= table_total
+        # Rounding has taken the value beyond the final table, so choose from the last table with a non-zero total
+        rate_table = [t for t in self._rate_tables if t.total() > 0][-1]
+        return rate_table.choose(rate_table.total())
 
     def do(self, params):
         """
@@ -362,20 +965,73 @@ class Dynamics(epyc.Experiment, object):
         :param params:
         :return:
         """
-        results = {}
-
-        time = self._start_time
+        time, next_record_interval = self._start_run(params)
+        time, next_record_interval, total_network_rate = self._simulate(params, time, next_record_interval)
+        if self._checkpointer is not None:
+            self._checkpointer.clear()
+        return self._finish_run(time, total_network_rate)
 
-        results = self._record_results(results, time)
-        # Avoid rounding issues with time interval by rounding to 7 decimal places
-        next_record_interval = round(time + self._record_interval, 7)
+    def _start_run(self, params):
+        """
+        Start a run - record the initial state and reset the summary statistics, or resume from the latest checkpoint
+        :param params:
+        :return: (time, next time to record results)
+        """
+        checkpoint = self._checkpointer.latest() if self._checkpointer is not None else None
+        if checkpoint is not None:
+            # Resume an interrupted run
+            time, next_record_interval = self._restore_run_state(checkpoint, params)
+        else:
+            time = self._start_time
+            self._recorder.set_projection(self._output_projection)
+            self._recorder.reset(self._network)
+            self._record_results(time)
+            if self._statistics:
+                for statistic in self._statistics:
+                    statistic.reset(time, self._network, self._active_patches)
+                self._statistics_time = time
+            # Avoid rounding issues with time interval by rounding to 7 decimal places
+            next_record_interval = round(time + self._record_interval, 7)
+
+        self._start_trace(time)
+        if self._checkpointer is not None:
+            self._checkpointer.start(time)
+        return time, next_record_interval
+
+    def _start_trace(self, time):
+        """
+        Start the trace of a run (if traced) from the current state
+        :param time:
+        :return:
+        """
+        if self._record_trace:
+            self._trace = EventTrace(self._network, self._events, self._active_patches, self._parameter_values(),
+                                     numpy.random.get_state(), time)
+            self._tracing = self._trace
 
-        total_network_rate = numpy.sum(self._rate_table)
+    def _simulate(self, params, time, next_record_interval, stop_time=None):
+        """
+        Perform events until the maximum time (or the stop time, if given and sooner)
+        :param params:
+        :param time: Current time
+        :param next_record_interval: Next time to record results
+        :param stop_time: Time to stop at (the run stops once the time has reached it)
+        :return: (time, next time to record results, total rate)
+        """
+        total_network_rate = self._total_rate()
         assert total_network_rate, "No events possible at start of simulation"
 
-        num_events = len(self._events)
+        engine = self._well_mixed_engine()
+        if engine is not None:
+            return self._simulate_well_mixed(engine, time, next_record_interval, stop_time)
+        well_mixed = self._is_well_mixed(self._network)
 
         while time < self._max_time and not self._end_simulation(time):
+            if stop_time is not None and time >= stop_time:
+                break
+            if self._checkpointer is not None and self._checkpointer.due(time):
+                self._checkpointer.write(time, self._run_state(params, time, next_record_interval))
+
             # Calculate the timestep delta
             dt = (1.0 / total_network_rate) * math.log(1.0 / numpy.random.random())
 
@@ -383,47 +1039,333 @@ class Dynamics(epyc.Experiment, object):
             if self._posted_events:
                 next_time = self._posted_events[0][0]
                 if time + dt > next_time:
-                    next_time, next_event, next_atts = heapq.heappop(self._posted_events)
-                    # Perform the event
-                    if len(next_atts) > 0:
-                        next_event(next_atts)
-                    else:
-                        next_event()
                     # Time progresses to the time of posted event
-                    time = next_time
+                    time = self._perform_posted_event()
                     # Event has been executed, go to next loop
                     # NOTE: cannot continue processing events as this event may have changed rates of dynamic events
-                    total_network_rate = numpy.sum(self._rate_table)
+                    total_network_rate = self._total_rate()
                     continue
 
             # Choose an event and patch based on the values in the rate table
-            # TODO - numpy multinomial is faster than numpy choice (in python 2, maybe not in 3?)
-            index_choice = numpy.random.multinomial(1, self._rate_table.flatten() / total_network_rate).argmax()
-            # Given the index, find the patch (row) and event (column) this refers to
-            patch_id = self._active_patches[index_choice / num_events]
-            event = self._events[index_choice % num_events]
-
-            # Perform the event. Handler will propagate the effects of any network updates
-            event.perform(self._network, patch_id)
+            patch_id, event = self._choose_event(numpy.random.random() * total_network_rate)
+            self._firing_counts[event] = self._firing_counts.get(event, 0) + 1
+            self._advance_statistics(time + dt)
+            if self._tracing is not None:
+                self._tracing.event(time + dt, event, patch_id)
+
+            # Perform the event. Handler will propagate the effects of all network updates once the event is complete
+            # (or as they are made, for well-mixed models)
+            if well_mixed:
+                event.perform(self._network, patch_id)
+            else:
+                with self._network.transaction():
+                    event.perform(self._network, patch_id)
 
             # Move simulated time forward
             time += dt
 
             # Record results if interval(s) exceeded
-            while time >= next_record_interval and next_record_interval <= self._max_time:
-                self._record_results(results, next_record_interval)
-                # Avoid rounding issues
-                next_record_interval = round(next_record_interval + self._record_interval, 7)
+            next_record_interval = self._record_due(time, next_record_interval)
 
             # Get the total rate by summing rates of all events at all patches
-            total_network_rate = numpy.sum(self._rate_table)
+            total_network_rate = self._total_rate()
 
             # If no events can occur, then end
             if total_network_rate == 0:
                 break
 
+        return time, next_record_interval, total_network_rate
+
+    def _well_mixed_engine(self):
+        """
+        Direct event loop for the run, if the model is well-mixed with a single rate table of simple events (see
+        WellMixedEngine) and nothing needs the network after every event (checkpoints, a trace, summary statistics or
+        an end condition)
+        :return: WellMixedEngine, or None if the run must use the rate tables
+        """
+        if not self._is_well_mixed(self._network) or len(self._rate_tables) != 1 or self._checkpointer is not None or \
+                self._tracing is not None or self._statistics_time is not None or \
+                type(self)._end_simulation.__func__ is not Dynamics._end_simulation.__func__:
+            return None
+        return WellMixedEngine.compile(self._rate_tables[0], self._network.compartments())
+
+    def _simulate_well_mixed(self, engine, time, next_record_interval, stop_time):
+        """
+        Perform events with the direct event loop until the maximum time (or the stop time, if given and sooner),
+        breaking off to record results and perform posted events
+        :param engine: WellMixedEngine
+        :param time: Current time
+        :param next_record_interval: Next time to record results
+        :param stop_time: Time to stop at
+        :return: (time, next time to record results, total rate)
+        """
+        while True:
+            posted_time = self._posted_events[0][0] if self._posted_events else None
+            time, reason = engine.run(self._network, time, self._max_time, next_record_interval, posted_time,
+                                      stop_time, self._firing_counts)
+            if reason == WellMixedEngine.POSTED_EVENT:
+                time = self._perform_posted_event()
+            elif reason == WellMixedEngine.RECORD:
+                next_record_interval = self._record_due(time, next_record_interval)
+                if self._total_rate() == 0:
+                    break
+            else:
+                break
+        return time, next_record_interval, self._total_rate()
+
+    def _perform_posted_event(self):
+        """
+        Perform the next posted event (updates are propagated together once it is complete)
+        :return: Time of the posted event
+        """
+        next_time, next_event, next_atts = heapq.heappop(self._posted_events)
+        if isinstance(next_event, basestring):
+            next_event = getattr(self, next_event)
+        self._advance_statistics(next_time)
+        if self._tracing is not None:
+            self._tracing.posted_event(next_time)
+        with self._network.transaction():
+            if len(next_atts) > 0:
+                next_event(next_atts)
+            else:
+                next_event()
+        return next_time
+
+    def _record_due(self, time, next_record_interval):
+        """
+        Record results at every record interval up to the current time
+        :param time: Current time
+        :param next_record_interval: Next time to record results
+        :return: Next time to record results after those recorded
+        """
+        while time >= next_record_interval and next_record_interval <= self._max_time:
+            self._record_results(next_record_interval)
+            # Avoid rounding issues
+            next_record_interval = round(next_record_interval + self._record_interval, 7)
+        return next_record_interval
+
+    def _finish_run(self, time, total_network_rate):
+        """
+        Finish a run, giving its results
+        :param time: Time the run ended
+        :param total_network_rate: Total rate at the end
+        :return: Results of the run
+        """
+        if self._statistics_time is not None:
+            # Network is unchanged until the end of the run (or the maximum time, if no more events can occur)
+            self._advance_statistics(self._max_time if total_network_rate == 0 else time)
+            self._statistics_time = None
+        self._tracing = None
+
+        if not self._statistics:
+            return self._recorder.results()
+        results = {Dynamics.STATISTICS: {s.name(): s.value() for s in self._statistics}}
+        if self._record_snapshots:
+            results[Dynamics.SNAPSHOTS] = self._recorder.results()
         return results
 
+    def _run_state(self, params, time, next_record_interval):
+        """
+        Copy of the state of the run in progress, from which it can be continued (see _restore_run_state)
+        :param params: Parameters of the run
+        :param time: Current time
+        :param next_record_interval: Next time to record results
+        :return: dict of the state (picklable if the network and statistics are)
+        """
+        assert all(isinstance(e, basestring) for _, e, _ in self._posted_events), \
+            "Posted events must be given by name to copy the state of a run"
+        return {Dynamics.RUN_PARAMETERS: dict(params),
+                Dynamics.RUN_TIME: time,
+                Dynamics.RUN_NEXT_RECORD_TIME: next_record_interval,
+                Dynamics.RUN_NETWORK: self._network.checkpoint(),
+                Dynamics.RUN_RATE_TABLES: {t: table.checkpoint() for t, table in self._rate_table_for_type.iteritems()},
+                # Columns are ordered by the events fired in this process, so may be ordered differently on restore
+                Dynamics.RUN_RATE_TABLE_COLUMNS: {t: [self._column_key(e) for e in table.events()]
+                                                  for t, table in self._rate_table_for_type.iteritems()},
+                Dynamics.RUN_ACTIVE_PATCHES: list(self._active_patches),
+                Dynamics.RUN_POSTED_EVENTS: copy.deepcopy(self._posted_events),
+                Dynamics.RUN_EVENT_PARAMETERS: self._parameter_values(),
+                Dynamics.RUN_RECORDER: self._recorder.checkpoint(),
+                Dynamics.RUN_STATISTICS: copy.deepcopy(self._statistics),
+                Dynamics.RUN_STATISTICS_TIME: self._statistics_time,
+                Dynamics.RUN_RNG_STATE: numpy.random.get_state()}
+
+    def _column_key(self, event):
+        """
+        Key of a column of the rate tables which is the same in any process - the indices of its events in the model
+        :param event: Event of the column (may be fused)
+        :return: Tuple of indices
+        """
+        members = event.events() if isinstance(event, FusedEvent) else [event]
+        return tuple(self._events.index(e) for e in members)
+
+    def _restore_run_state(self, state, params=None, fork=False):
+        """
+        Return to a copy of the state of a run (on the network of the run, configured with its parameters)
+        :param state: Result of _run_state
+        :param params: Parameters of the run (checked against those of the state, if given)
+        :param fork: Whether the run is a fork of the state (so results written to a store go to a new run)
+        :return: (time, next time to record results)
+        """
+        assert params is None or state[Dynamics.RUN_PARAMETERS] == params, \
+            "State is of a run with different parameters"
+        self._network.restore(state[Dynamics.RUN_NETWORK])
+        self._rate_table_for_patch = {}
+        for t, table_state in state[Dynamics.RUN_RATE_TABLES].iteritems():
+            rate_table = self._rate_table_for_type[t]
+            keys = state[Dynamics.RUN_RATE_TABLE_COLUMNS][t]
+            events = {self._column_key(e): e for e in rate_table.events()}
+            assert sorted(events) == sorted(keys), "State is of a run with different events"
+            if [self._column_key(e) for e in rate_table.events()] != keys:
+                # Columns ordered differently (by the events fired in another process) - hold them in the order of the
+                # run, so it continues with the same choices
+                rate_table = rate_table.__class__([events[k] for k in keys], t)
+                self._rate_table_for_type[t] = rate_table
+            rate_table.restore(table_state)
+            for p in rate_table.patches():
+                self._rate_table_for_patch[p] = rate_table
+        self._rate_tables = self._rate_table_for_type.values()
+        self._well_mixed_plans = {}
+        self._active_patches = list(state[Dynamics.RUN_ACTIVE_PATCHES])
+        self._posted_events = copy.deepcopy(state[Dynamics.RUN_POSTED_EVENTS])
+        self._set_event_parameters(state[Dynamics.RUN_EVENT_PARAMETERS])
+        self._recorder.restore(state[Dynamics.RUN_RECORDER], fork)
+        self._statistics = copy.deepcopy(state[Dynamics.RUN_STATISTICS])
+        self._statistics_time = state[Dynamics.RUN_STATISTICS_TIME]
+        numpy.random.set_state(state[Dynamics.RUN_RNG_STATE])
+        return state[Dynamics.RUN_TIME], state[Dynamics.RUN_NEXT_RECORD_TIME]
+
+    def burn_in(self, params, burn_in_time):
+        """
+        Run the shared first part of a set of runs (e.g. before an intervention) once, up to the burn-in time, and
+        give a snapshot of the run in memory, from which any number of runs can be continued with fork. Called in
+        place of do, after setUp.
+        :param params: Parameters of the burn-in
+        :param burn_in_time: Time to run to (the snapshot is taken once it is reached)
+        :return: Snapshot of the run
+        """
+        assert self._checkpointer is None, "Burn-in runs cannot be checkpointed"
+        time, next_record_interval = self._start_run(params)
+        time, next_record_interval, _ = self._simulate(params, time, next_record_interval, burn_in_time)
+        self._tracing = None
+        return self._run_state(params, time, next_record_interval)
+
+    def fork(self, snapshot, params=None, seed=None):
+        """
+        Continue a run from a burn-in snapshot to the maximum time, with a fresh stream of random numbers and
+        (optionally) different parameters from the burn-in. Event parameters which differ from those of the burn-in are
+        updated as with update_parameter (so reaction parameters of zero must be declared in _scheduled_parameters),
+        and the model can change anything else that depends on the parameters (e.g. the events it has posted) in
+        _set_up_fork. The snapshot is not changed, so can be forked again.
+        :param snapshot: Result of burn_in
+        :param params: Parameters of the continuation (None for those of the burn-in)
+        :param seed: Seed of the random number generator (None to seed from the operating system)
+        :return: Results of the whole run (burn-in and continuation), as from do
+        """
+        assert self._checkpointer is None, "Forked runs cannot be checkpointed"
+        if params is None:
+            params = snapshot[Dynamics.RUN_PARAMETERS]
+        time, next_record_interval = self._restore_run_state(snapshot, fork=True)
+        numpy.random.seed(seed)
+        # Only parameters changed from the burn-in, so values the model has changed during it are kept otherwise
+        burn_in_params = snapshot[Dynamics.RUN_PARAMETERS]
+        for p in self._events_for_parameter:
+            if p in params and params[p] != burn_in_params.get(p):
+                self.update_parameter(p, params[p])
+        self._set_up_fork(params, time)
+        self._start_trace(time)
+        time, next_record_interval, total_network_rate = self._simulate(params, time, next_record_interval)
+        return self._finish_run(time, total_network_rate)
+
+    def _set_up_fork(self, params, time):
+        """
+        Set up a run forked from a burn-in with the given parameters, after its event parameters have been updated
+        (e.g. replacing events posted for the burn-in parameters). Default does nothing.
+        :param params: Parameters of the fork
+        :param time: Time of the snapshot
+        :return:
+        """
+        pass
+
+    def _parameter_values(self):
+        """
+        Current value of every parameter of the events
+        :return: dict of Key: parameter, Value: value
+        """
+        return {p: events[0].parameter_value(p) for p, events in self._events_for_parameter.iteritems()}
+
+    def replay(self, trace, times):
+        """
+        Reconstruct the network at the given times from the trace of a run, by performing its events again from the
+        start state (drawing the same random numbers) without calculating any rates. The state at a time includes all
+        events up to and including that time, so the trajectory can be resampled at any interval. Must be given a trace
+        from a run of these dynamics, configured with the parameters of the run, and not called during a run - the
+        network is left in the replayed state (the parameters and the random number generator are restored).
+        :param trace: EventTrace
+        :param times: Times to record the network at
+        :return: ResultRecorder holding the network at each time (subject to the output projection)
+        """
+        network = self._network
+        recorder = ResultRecorder()
+        recorder.set_projection(self._output_projection)
+        handlers = network.handlers()
+        parameters = self._parameter_values()
+        rng_state = numpy.random.get_state()
+        network.set_handlers(None, None, None)
+        try:
+            trace.restore(network)
+            recorder.reset(network)
+            self._set_event_parameters(trace.parameters())
+            numpy.random.set_state(trace.rng_state())
+            columns = []
+            for key in trace.column_keys():
+                members = tuple(self._events[i] for i in key)
+                columns.append(members[0] if len(members) == 1 else
+                               self._fused_events.setdefault(members, FusedEvent(list(members))))
+            patches = trace.patches()
+            updates = trace.parameter_updates()
+            active_patches = list(trace.initial_active_patches())
+            records = trace.records()
+            record_times = records['time'].tolist()
+            record_columns = records['column'].tolist()
+            record_patches = records['patch'].tolist()
+            i = 0
+            for t in sorted(times):
+                while i < len(record_times) and record_times[i] <= t:
+                    column = record_columns[i]
+                    if column >= 0:
+                        # Draws for the time-step and the choice of event
+                        numpy.random.random()
+                        numpy.random.random()
+                        with network.transaction():
+                            columns[column].perform(network, patches[record_patches[i]])
+                    elif column == EventTrace.ACTIVATION:
+                        active_patches.append(patches[record_patches[i]])
+                        self._seed_patch(patches[record_patches[i]])
+                    elif column == EventTrace.POSTED_EVENT:
+                        # Draw for the time-step
+                        numpy.random.random()
+                    else:
+                        parameter, value = updates[record_patches[i]]
+                        self._set_event_parameters({parameter: value})
+                    i += 1
+                recorder.record(t, network, active_patches)
+        finally:
+            network.set_handlers(*handlers)
+            self._set_event_parameters(parameters)
+            numpy.random.set_state(rng_state)
+        return recorder
+
+    def _set_event_parameters(self, parameters):
+        """
+        Set the values of parameters on the events (without updating the rate tables)
+        :param parameters: dict of Key: parameter, Value: value
+        :return:
+        """
+        for p, value in parameters.iteritems():
+            for event in self._events_for_parameter.get(p, []):
+                event.update_parameter(p, value)
+
     def _end_simulation(self, t):
         """
         Function to end simulation.Can be overridden to end on a certain condition.
@@ -441,10 +1383,12 @@ class Dynamics(epyc.Experiment, object):
         # Perform the default tear-down
         epyc.Experiment.tearDown(self)
 
-        # Reset rate table and lookups
-        self._rate_table = None
+        # Reset rate tables and lookups
+        for rate_table in self._rate_tables:
+            rate_table.clear()
+        self._rate_table_for_patch = {}
         self._active_patches = []
-        self._row_for_patch = {}
 
         # Reset posted events
         self._posted_events = []
+        self._tracing = None
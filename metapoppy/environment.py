@@ -1,16 +1,111 @@
 import networkx
+import numpy
+import contextlib
+from sampling import AliasSampler
+from mobility import MobilityKernel
+
+
+class ChangeSet(object):
+    """
+    The net changes made to the patches and edges of an environment during a transaction.
+    """
+
+    def __init__(self):
+        self._compartment_changes = {}
+        self._attribute_changes = {}
+        self._edge_changes = {}
+
+    def add_patch_changes(self, patch_id, compartment_changes, attribute_changes):
+        """
+        Record changes made to a patch
+        :param patch_id:
+        :param compartment_changes: dict of Key: compartment, Value: amount changed (or None if no compartments changed)
+        :param attribute_changes: dict of Key: attribute, Value: amount changed (or None if no attributes changed)
+        :return:
+        """
+        for changes, recorded in [(compartment_changes, self._compartment_changes),
+                                  (attribute_changes, self._attribute_changes)]:
+            if changes:
+                patch_changes = recorded.setdefault(patch_id, {})
+                for k, change in changes.iteritems():
+                    patch_changes[k] = patch_changes.get(k, 0) + change
+
+    def add_edge_changes(self, u, v, attribute_changes):
+        """
+        Record changes made to an edge
+        :param u:
+        :param v:
+        :param attribute_changes: dict of Key: attribute, Value: amount changed
+        :return:
+        """
+        key = (v, u) if (v, u) in self._edge_changes else (u, v)
+        edge_changes = self._edge_changes.setdefault(key, {})
+        for k, change in attribute_changes.iteritems():
+            edge_changes[k] = edge_changes.get(k, 0) + change
+
+    def compartment_changes(self):
+        """
+        Net compartment changes
+        :return: dict of Key: patch ID, Value: dict of Key: compartment, Value: net amount changed (non-zero)
+        """
+        return self._net(self._compartment_changes)
+
+    def attribute_changes(self):
+        """
+        Net patch attribute changes
+        :return: dict of Key: patch ID, Value: dict of Key: attribute, Value: net amount changed (non-zero)
+        """
+        return self._net(self._attribute_changes)
+
+    def edge_changes(self):
+        """
+        Net edge attribute changes
+        :return: dict of Key: (u, v), Value: dict of Key: attribute, Value: net amount changed (non-zero)
+        """
+        return self._net(self._edge_changes)
+
+    @staticmethod
+    def _net(changes):
+        net = {}
+        for key, key_changes in changes.iteritems():
+            non_zero = {k: c for k, c in key_changes.iteritems() if c}
+            if non_zero:
+                net[key] = non_zero
+        return net
+
+    def is_empty(self):
+        return not (self.compartment_changes() or self.attribute_changes() or self.edge_changes())
 
 
 class Environment(networkx.Graph):
     """
     A networked metapopulation. Extends networkX graph, adding data for patch subpopulations and
     environmental attributes.
+
+    Named groups of compartments can be registered on the environment. The sum of each group at every patch (and
+    across the whole network) is maintained as patches are updated, so reading the value of a group is a single lookup
+    rather than a sum over its compartments.
+
+    The neighbours and degree of every patch are tabulated when the environment is reset (the structure is assumed not
+    to change after this). Movement destinations are chosen from the neighbours using a mobility kernel - uniform by
+    default, or weighted (e.g. gravity or radiation models), in which case an alias table is kept for each patch and
+    rebuilt only when the attributes the kernel depends upon change.
+
+    Updates can be grouped into a transaction, in which case changes are applied immediately but recorded in a change
+    set, and propagated (to the handlers) once when the transaction is committed - each patch and edge is notified once
+    with the union of what has changed there. Compartments are only checked to be non-negative on commit, and if
+    invalid (or if the transaction fails) the changes are rolled back.
     """
 
     COMPARTMENTS = 'compartments'
     ATTRIBUTES = 'attributes'
     POSITION = 'position'
 
+    # Keys of a checkpoint of the network
+    PATCHES = 'patches'
+    EDGES = 'edges'
+    GROUPS = 'groups'
+
     def __init__(self, compartments, patch_attributes, edge_attributes, template=None):
         """
         Create the environment
@@ -23,6 +118,24 @@ class Environment(networkx.Graph):
         self._edge_attributes = edge_attributes
         self._patch_handler = None
         self._edge_handler = None
+        self._change_set_handler = None
+        # Transaction in progress - change set of the transaction and depth of nesting
+        self._change_set = None
+        self._transaction_depth = 0
+        self._rolling_back = False
+        # Compartment groups - group name to compartments, and compartment to the groups containing it
+        self._compartment_groups = {}
+        self._groups_for_compartment = {}
+        # Sums of each group - per patch (Key: patch ID, Value: dict of Key: group, Value: sum) and network-wide
+        self._group_values = {}
+        self._group_totals = {}
+        # Neighbour tables (built on reset) and mobility kernel
+        self._neighbours = {}
+        self._degrees = {}
+        self._mobility_kernel = None
+        self._mobility_patch_attributes = set()
+        self._mobility_edge_attributes = set()
+        self._mobility_samplers = {}
         networkx.Graph.__init__(self)
 
         if template:
@@ -50,16 +163,184 @@ class Environment(networkx.Graph):
         """
         return self._edge_attributes
 
-    def set_handlers(self, patch_handler, edge_handler):
+    @staticmethod
+    def compartment_group_name(compartments):
+        """
+        Standard name for the group of the given compartments
+        :param compartments:
+        :return:
+        """
+        return '+'.join(compartments)
+
+    def compartment_groups(self):
+        """
+        Get function for compartment groups
+        :return: dict of Key: group name, Value: list of compartments
+        """
+        return self._compartment_groups
+
+    def add_compartment_group(self, group, compartments):
+        """
+        Register a named group of compartments. The sum of the compartments is maintained at every patch (and over the
+        network) from then on, and can be read with get_compartment_value (or get_group_total).
+        :param group: Name of group (must not be a compartment)
+        :param compartments: List of compartments in group
+        :return:
+        """
+        if group in self._compartment_groups:
+            assert set(self._compartment_groups[group]) == set(compartments), \
+                "Group {0} already exists with different compartments".format(group)
+            return
+        assert group not in self._compartments, "Group {0} cannot have the name of a compartment".format(group)
+        assert all(c in self._compartments for c in compartments), \
+            "Group {0} contains invalid compartments {1}".format(group, compartments)
+        self._compartment_groups[group] = list(compartments)
+        for c in compartments:
+            self._groups_for_compartment.setdefault(c, []).append(group)
+        # Calculate the current sums of the group (patches are empty if they have not yet been reset)
+        self._group_totals[group] = 0
+        for n, data in self.nodes(data=True):
+            value = sum(data[Environment.COMPARTMENTS][c] for c in compartments) \
+                if Environment.COMPARTMENTS in data else 0
+            self._group_values.setdefault(n, {})[group] = value
+            self._group_totals[group] += value
+
+    def set_mobility_kernel(self, kernel):
+        """
+        Set the kernel used to weight the neighbours of a patch as destinations for movement (None for uniform)
+        :param kernel: MobilityKernel
+        :return:
+        """
+        assert kernel is None or isinstance(kernel, MobilityKernel), "Kernel must be a MobilityKernel"
+        self._mobility_kernel = kernel
+        if kernel:
+            self._mobility_patch_attributes = set(kernel.patch_attributes())
+            self._mobility_edge_attributes = set(kernel.edge_attributes())
+        else:
+            self._mobility_patch_attributes = set()
+            self._mobility_edge_attributes = set()
+        self._mobility_samplers = {}
+
+    def mobility_kernel(self):
+        return self._mobility_kernel
+
+    def set_handlers(self, patch_handler, edge_handler, change_set_handler=None):
         """
         Given a lambda function as an update handler, assign it to the network. Function will be called when an update
         is performed
         :param patch_handler: function to call when a patch is updated
         :param edge_handler: function to call when an edge is updated
+        :param change_set_handler: function to call with the changes when a transaction is committed (if not given,
+        the patch and edge handlers are called for each patch and edge changed)
         :return:
         """
         self._patch_handler = patch_handler
         self._edge_handler = edge_handler
+        self._change_set_handler = change_set_handler
+
+    def handlers(self):
+        """
+        The update handlers assigned to the network
+        :return: (patch handler, edge handler, change set handler)
+        """
+        return self._patch_handler, self._edge_handler, self._change_set_handler
+
+    def in_transaction(self):
+        return self._change_set is not None
+
+    def begin_transaction(self):
+        """
+        Begin a transaction - updates are recorded and not propagated until the transaction is committed. Nested
+        transactions are part of the outermost transaction.
+        :return:
+        """
+        if self._change_set is None:
+            self._change_set = ChangeSet()
+        self._transaction_depth += 1
+
+    def commit_transaction(self):
+        """
+        Commit the transaction. Validates that no compartment has dropped below zero (rolling back and raising
+        ValueError if so), then propagates the net changes to the handlers.
+        :return:
+        """
+        if self._change_set is None:
+            return
+        self._transaction_depth -= 1
+        if self._transaction_depth:
+            return
+        change_set = self._change_set
+        compartment_changes = change_set.compartment_changes()
+        invalid = [(p, c) for p, changes in compartment_changes.iteritems() for c in changes
+                   if self._node[p][Environment.COMPARTMENTS][c] < 0]
+        if invalid:
+            self.rollback_transaction()
+            raise ValueError("Compartments cannot drop below zero {0}".format(invalid))
+        self._change_set = None
+
+        attribute_changes = change_set.attribute_changes()
+        edge_changes = change_set.edge_changes()
+        patches_changed = set(compartment_changes) | set(attribute_changes)
+        if self._change_set_handler and (edge_changes or len(patches_changed) > 1):
+            patch_changes = {p: (compartment_changes.get(p, {}).keys(), attribute_changes.get(p, {}).keys())
+                             for p in patches_changed}
+            self._change_set_handler(patch_changes, {e: a.keys() for e, a in edge_changes.iteritems()})
+        else:
+            # Changes at a single patch (or no change set handler) are passed to the individual handlers. Edges first,
+            # so they are current when the patch updates are propagated
+            if self._edge_handler:
+                for (u, v), changes in edge_changes.iteritems():
+                    self._edge_handler(u, v, changes.keys())
+            if self._patch_handler:
+                for p in patches_changed:
+                    self._patch_handler(p, compartment_changes.get(p, {}).keys(),
+                                        attribute_changes.get(p, {}).keys())
+
+    def rollback_transaction(self):
+        """
+        Abandon the transaction, reverting all changes made during it. Handlers are not notified (the changes were
+        never propagated).
+        :return:
+        """
+        change_set = self._change_set
+        self._change_set = None
+        self._transaction_depth = 0
+        if change_set is None:
+            return
+        self._rolling_back = True
+        try:
+            self._revert(change_set)
+        finally:
+            self._rolling_back = False
+
+    def _revert(self, change_set):
+        """
+        Revert the changes in a change set. Patches are reverted directly (any patch changes which caused edge changes
+        are recorded separately, and reverted with the edges).
+        :param change_set:
+        :return:
+        """
+        for (u, v), changes in change_set.edge_changes().iteritems():
+            self.update_edge(u, v, {a: -c for a, c in changes.iteritems()})
+        compartment_changes = change_set.compartment_changes()
+        attribute_changes = change_set.attribute_changes()
+        for p in set(compartment_changes) | set(attribute_changes):
+            Environment.update_patch(self, p, {c: -x for c, x in compartment_changes.get(p, {}).iteritems()},
+                                     {a: -x for a, x in attribute_changes.get(p, {}).iteritems()})
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Context for a transaction - committed at the end, or rolled back if an exception occurs
+        :return:
+        """
+        self.begin_transaction()
+        try:
+            yield self
+        except:
+            self.rollback_transaction()
+            raise
+        self.commit_transaction()
 
     def reset(self):
         """
@@ -68,6 +349,36 @@ class Environment(networkx.Graph):
         """
         self._reset_patches()
         self._reset_edges()
+        self._reset_compartment_groups()
+        self._build_neighbour_tables()
+
+    def checkpoint(self):
+        """
+        Copy of the values of the network which change during a run (compartments, attributes and the sums of
+        compartment groups), to be restored with restore
+        :return:
+        """
+        return {Environment.PATCHES: {n: (dict(d[Environment.COMPARTMENTS]), dict(d[Environment.ATTRIBUTES]))
+                                      for n, d in self._node.iteritems()},
+                Environment.EDGES: [(u, v, dict(d)) for u, v, d in self.edges(data=True)],
+                Environment.GROUPS: ({n: dict(v) for n, v in self._group_values.iteritems()},
+                                     dict(self._group_totals))}
+
+    def restore(self, state):
+        """
+        Return the network to the values of a checkpoint. Handlers are not notified.
+        :param state: Result of checkpoint
+        :return:
+        """
+        for n, (compartment_values, attribute_values) in state[Environment.PATCHES].iteritems():
+            self._node[n][Environment.COMPARTMENTS] = dict(compartment_values)
+            self._node[n][Environment.ATTRIBUTES] = dict(attribute_values)
+        for u, v, edge_values in state[Environment.EDGES]:
+            self.get_edge_data(u, v).update(edge_values)
+        group_values, group_totals = state[Environment.GROUPS]
+        self._group_values = {n: dict(v) for n, v in group_values.iteritems()}
+        self._group_totals = dict(group_totals)
+        self._mobility_samplers = {}
 
     def _reset_patches(self):
         """
@@ -78,6 +389,24 @@ class Environment(networkx.Graph):
                                                 Environment.ATTRIBUTES: {a: 0.0 for a in self._patch_attributes}}
                                             for n in self.nodes})
 
+    def _reset_compartment_groups(self):
+        """
+        Reset the sums of all compartment groups to zero.
+        :return:
+        """
+        self._group_values = {n: {g: 0 for g in self._compartment_groups} for n in self.nodes}
+        self._group_totals = {g: 0 for g in self._compartment_groups}
+
+    def _build_neighbour_tables(self):
+        """
+        Tabulate the neighbours and degree of every patch, and clear the mobility alias tables (attributes have been
+        reset).
+        :return:
+        """
+        self._neighbours = {n: list(nbrs) for n, nbrs in self._adj.iteritems()}
+        self._degrees = {n: len(nbrs) for n, nbrs in self._neighbours.iteritems()}
+        self._mobility_samplers = {}
+
     def _reset_edges(self):
         """
         Reset all edges to zero attribute values.
@@ -87,17 +416,48 @@ class Environment(networkx.Graph):
 
     def get_compartment_value(self, patch_id, compartment):
         """
-        Get function for finding a compartment value (or values) at a patch
+        Get function for finding a compartment value (or values) at a patch. If given a registered compartment group,
+        returns the maintained sum of the group.
         :param patch_id:
-        :param compartment:
+        :param compartment: Compartment, group name or list of compartments
         :return:
         """
         if isinstance(compartment, list):
             data = self._node[patch_id][Environment.COMPARTMENTS]
             return sum([data[c] for c in compartment])
+        elif compartment in self._compartment_groups:
+            return self._group_values[patch_id][compartment]
         else:
             return self._node[patch_id][Environment.COMPARTMENTS][compartment]
 
+    def set_compartment_values(self, patch_id, values):
+        """
+        Set compartments of a patch to the given values, maintaining the sums of any groups containing them. Handlers
+        are not notified, so anything dependent on the values must be kept up to date by the caller (see
+        WellMixedEngine).
+        :param patch_id:
+        :param values: dict of Key: compartment, Value: new value
+        :return:
+        """
+        data = self._node[patch_id][Environment.COMPARTMENTS]
+        for comp, value in values.iteritems():
+            change = value - data[comp]
+            if change:
+                data[comp] = value
+                if comp in self._groups_for_compartment:
+                    group_values = self._group_values[patch_id]
+                    for group in self._groups_for_compartment[comp]:
+                        group_values[group] += change
+                        self._group_totals[group] += change
+
+    def get_group_total(self, group):
+        """
+        Get function for the sum of a compartment group over all patches on the network
+        :param group:
+        :return:
+        """
+        return self._group_totals[group]
+
     def get_attribute_value(self, patch_id, attribute):
         """
         Get function for finding an environmental attribute value at a patch
@@ -111,6 +471,43 @@ class Environment(networkx.Graph):
         else:
             return self._node[patch_id][Environment.ATTRIBUTES][attribute]
 
+    def neighbours(self, patch_id):
+        """
+        Get function for the neighbours of a patch (tabulated on reset)
+        :param patch_id:
+        :return: List of patch IDs
+        """
+        return self._neighbours[patch_id]
+
+    def patch_degree(self, patch_id):
+        """
+        Get function for the number of neighbours of a patch (tabulated on reset)
+        :param patch_id:
+        :return:
+        """
+        return self._degrees[patch_id]
+
+    def choose_neighbour(self, patch_id):
+        """
+        Choose a neighbour of the patch as a destination for movement, weighted by the mobility kernel (uniformly if
+        no kernel set)
+        :param patch_id:
+        :return: Neighbouring patch ID, or None if no neighbour can be chosen
+        """
+        if not self._mobility_kernel:
+            degree = self._degrees[patch_id]
+            if not degree:
+                return None
+            return self._neighbours[patch_id][int(numpy.random.random() * degree)]
+        if patch_id not in self._mobility_samplers:
+            neighbours = self._neighbours[patch_id]
+            weights = self._mobility_kernel.weights(self, patch_id, neighbours)
+            self._mobility_samplers[patch_id] = AliasSampler(neighbours, weights) if sum(weights) > 0 else None
+        sampler = self._mobility_samplers[patch_id]
+        if sampler is None:
+            return None
+        return sampler.sample()
+
     def update_patch(self, patch_id, compartment_changes=None, attribute_changes=None):
         """
         Update the given patch with the given changes. If a handler is attached, this will be called with the changes
@@ -121,16 +518,31 @@ class Environment(networkx.Graph):
         :return:
         """
         patch_data = self._node[patch_id]
+        change_set = self._change_set
         if compartment_changes:
             for comp, change in compartment_changes.iteritems():
                 patch_data[Environment.COMPARTMENTS][comp] += change
-                assert patch_data[Environment.COMPARTMENTS][comp] >= 0, \
+                # Transactions are validated on commit
+                assert change_set is not None or patch_data[Environment.COMPARTMENTS][comp] >= 0, \
                     "Compartment {0} cannot drop below zero {1} {2}".format(comp, patch_id, patch_data)
+                # Maintain the sums of any groups containing the compartment
+                if comp in self._groups_for_compartment:
+                    group_values = self._group_values[patch_id]
+                    for group in self._groups_for_compartment[comp]:
+                        group_values[group] += change
+                        self._group_totals[group] += change
         if attribute_changes:
             for attr, change in attribute_changes.iteritems():
                 patch_data[Environment.ATTRIBUTES][attr] += change
-        # Propagate the changes
-        if self._patch_handler:
+            # Mobility weights from this patch and its neighbours are now out of date
+            if self._mobility_samplers and not self._mobility_patch_attributes.isdisjoint(attribute_changes):
+                self._mobility_samplers.pop(patch_id, None)
+                for n in self._neighbours[patch_id]:
+                    self._mobility_samplers.pop(n, None)
+        # Propagate the changes (or record them if in a transaction)
+        if change_set is not None:
+            change_set.add_patch_changes(patch_id, compartment_changes, attribute_changes)
+        elif self._patch_handler and not self._rolling_back:
             if not compartment_changes:
                 compartment_changes = {}
             if not attribute_changes:
@@ -148,8 +560,14 @@ class Environment(networkx.Graph):
         edge = self.get_edge_data(u, v)
         for attr, change in attribute_changes.iteritems():
             edge[attr] += change
-        # If a handler exists, propagate the updates
-        if self._edge_handler:
+        # Mobility weights from either end are now out of date
+        if self._mobility_samplers and not self._mobility_edge_attributes.isdisjoint(attribute_changes):
+            self._mobility_samplers.pop(u, None)
+            self._mobility_samplers.pop(v, None)
+        # If a handler exists, propagate the updates (or record them if in a transaction)
+        if self._change_set is not None:
+            self._change_set.add_edge_changes(u, v, attribute_changes)
+        elif self._edge_handler and not self._rolling_back:
             self._edge_handler(u, v, attribute_changes.keys())
 
 
@@ -192,6 +610,13 @@ class TypedEnvironment(Environment):
         if patch_type not in self._attribute_by_type:
             self._attribute_by_type[patch_type] = []
 
+    def patch_types(self):
+        """
+        All patch types which have been assigned to patches
+        :return:
+        """
+        return self._patch_types.keys()
+
     def get_patches_by_type(self, patch_type, data=False):
         """
         Return a list of patch IDs of the given type
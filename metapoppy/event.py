@@ -1,3 +1,4 @@
+import numpy
 from .environment import *
 
 
@@ -14,6 +15,17 @@ class Event(object):
     Patches must define the compartments and attributes their state variable functions are dependent upon (needed to
     propagate patch updates). They must also define the parameter keys that are required for state variable calculation
     (to be updated when the parameters update).
+
+    Events whose state variable at a patch depends on the contents of other patches must also declare these
+    cross-patch dependencies: compartments at neighbouring patches, compartments at specific (hub) patches, or
+    compartments at any patch on the network (i.e. network-wide aggregates).
+
+    Events which read the sum of several compartments can declare them as a compartment group, which is registered on
+    the network so the sum is maintained as patches are updated.
+
+    Events may also provide a vectorised form of the state variable function, which evaluates it at many patches at
+    once from a NetworkArrays view (used when building or recalculating whole columns of a rate table). Events which
+    do not provide one fall back to calculating the state variable at each patch in turn.
     """
 
     def __init__(self, dependent_compartments, dependent_patch_attributes, dependent_edge_attributes):
@@ -23,6 +35,12 @@ class Event(object):
         self._dependent_compartments = dependent_compartments
         self._dependent_patch_attributes = dependent_patch_attributes
         self._dependent_edge_attributes = dependent_edge_attributes
+        # Cross-patch dependencies - none by default, subclasses add to these
+        self._dependent_neighbour_compartments = []
+        self._dependent_hub_compartments = {}
+        self._dependent_network_compartments = []
+        # Compartment groups - none by default, subclasses add to these (see _compartment_group)
+        self._compartment_groups = {}
         self._reaction_parameter_key, self._parameter_keys = self._define_parameter_keys()
         self._parameters = {}
         if self._parameter_keys:
@@ -38,15 +56,80 @@ class Event(object):
     def get_dependent_edge_attributes(self):
         return self._dependent_edge_attributes
 
+    def get_dependent_neighbour_compartments(self):
+        """
+        Compartments at neighbouring patches which the state variable at a patch depends upon
+        :return:
+        """
+        return self._dependent_neighbour_compartments
+
+    def get_dependent_hub_compartments(self):
+        """
+        Compartments at specific patches which the state variable at every patch depends upon
+        :return: dict of Key: hub patch ID, Value: list of compartments
+        """
+        return self._dependent_hub_compartments
+
+    def get_dependent_network_compartments(self):
+        """
+        Compartments whose value at any patch on the network the state variable at every patch depends upon
+        :return:
+        """
+        return self._dependent_network_compartments
+
+    def get_compartment_groups(self):
+        """
+        Compartment groups whose sums are read by the event, to be registered on the network
+        :return: dict of Key: group name, Value: list of compartments
+        """
+        return self._compartment_groups
+
+    def _compartment_group(self, compartments):
+        """
+        Declare a group of compartments whose sum is read by the event. A single compartment needs no group.
+        :param compartments: List of compartments
+        :return: Name of the group (or the compartment), to pass to get_compartment_value
+        """
+        if len(compartments) == 1:
+            return compartments[0]
+        group = Environment.compartment_group_name(compartments)
+        self._compartment_groups[group] = compartments
+        return group
+
     def _define_parameter_keys(self):
         raise NotImplementedError
 
     def reaction_parameter(self):
         return self._reaction_parameter_key
 
+    def reaction_parameter_value(self):
+        return self._reaction_parameter
+
+    def applies_to_patch_type(self, patch_type):
+        """
+        Whether this event can occur at patches of the given type. Standard events can occur at any patch.
+        :param patch_type:
+        :return:
+        """
+        return True
+
     def parameter_keys(self):
         return [self._reaction_parameter_key] + self._parameter_keys
 
+    def reaction_parameter_keys(self):
+        """
+        Parameters which scale the rate of the event (without changing its state variable)
+        :return:
+        """
+        return [self._reaction_parameter_key]
+
+    def state_variable_parameter_keys(self):
+        """
+        Parameters used to calculate the state variable of the event
+        :return:
+        """
+        return self._parameter_keys
+
     def set_parameters(self, parameter_values):
         """
         Given a set of parameter values upon experiment configure, assign these to the event
@@ -60,6 +143,11 @@ class Event(object):
         for p in self._parameters:
             self._parameters[p] = parameter_values[p]
 
+    def parameter_value(self, parameter):
+        if parameter == self._reaction_parameter_key:
+            return self._reaction_parameter
+        return self._parameters[parameter]
+
     def update_parameter(self, parameter, value):
         if parameter == self._reaction_parameter_key:
             self._reaction_parameter = value
@@ -74,7 +162,16 @@ class Event(object):
         :param patch_id:
         :return:
         """
-        return self._reaction_parameter * self._calculate_state_variable_at_patch(network, patch_id)
+        return self._reaction_parameter * self.calculate_state_variable_at_patch(network, patch_id)
+
+    def calculate_state_variable_at_patch(self, network, patch_id):
+        """
+        Calculate the state variable of this event at this patch (i.e. the rate without the reaction parameter).
+        :param network:
+        :param patch_id:
+        :return:
+        """
+        return self._calculate_state_variable_at_patch(network, patch_id)
 
     def _calculate_state_variable_at_patch(self, network, patch_id):
         """
@@ -86,6 +183,103 @@ class Event(object):
         """
         raise NotImplementedError
 
+    def calculate_rates(self, network_arrays, patch_indices):
+        """
+        Calculate the rate of this event at many patches at once
+        :param network_arrays: NetworkArrays view of the network
+        :param patch_indices: Array of indices of the patches (within the view) to calculate at
+        :return: Array of rates, one per index
+        """
+        return self._reaction_parameter * self.calculate_state_variables(network_arrays, patch_indices)
+
+    def calculate_state_variables(self, network_arrays, patch_indices):
+        """
+        Calculate the state variable of this event at many patches at once
+        :param network_arrays: NetworkArrays view of the network
+        :param patch_indices: Array of indices of the patches (within the view) to calculate at
+        :return: Array of state variables, one per index
+        """
+        return self._calculate_state_variables(network_arrays, patch_indices)
+
+    def _calculate_state_variables(self, network_arrays, patch_indices):
+        """
+        Determine the state variable at many patches at once. Can be overridden with a vectorised form of
+        _calculate_state_variable_at_patch, otherwise calculated at each patch in turn.
+        :param network_arrays:
+        :param patch_indices:
+        :return:
+        """
+        network = network_arrays.network()
+        patches = network_arrays.patches()
+        return numpy.array([self._calculate_state_variable_at_patch(network, patches[i]) for i in patch_indices],
+                           dtype=numpy.float)
+
+    def _state_variable_signature(self):
+        """
+        Description of the state variable function (e.g. ('compartment', c) for the value of compartment c), such that
+        events with equal signatures always have equal state variables. None if the event cannot be fused with others.
+        A signature of Environment.COMPARTMENTS followed only by compartments denotes the product of the compartments,
+        and ('constant',) denotes 1 (see WellMixedEngine).
+        :return:
+        """
+        return None
+
+    def state_variable_signature(self):
+        """
+        Signature of the state variable function. Only valid if the state variable function has not been overridden
+        since the signature was declared (e.g. by a subclass), otherwise None.
+        :return:
+        """
+        signature = self._state_variable_signature()
+        if signature is None:
+            return None
+        mro = type(self).__mro__
+        signature_class = next(c for c in mro if '_state_variable_signature' in c.__dict__)
+        function_class = next(c for c in mro if '_calculate_state_variable_at_patch' in c.__dict__)
+        if not issubclass(signature_class, function_class):
+            return None
+        return signature
+
+    def fusion_key(self):
+        """
+        Key shared by events which can be fused into a single rate table column - those with the same state variable
+        signature and dependencies. None if the event cannot be fused.
+        :return:
+        """
+        signature = self.state_variable_signature()
+        if signature is None:
+            return None
+        return (signature, tuple(sorted(self._dependent_compartments)),
+                tuple(sorted(self._dependent_patch_attributes)), tuple(sorted(self._dependent_edge_attributes)),
+                tuple(sorted(self._dependent_neighbour_compartments)),
+                tuple(sorted((h, tuple(sorted(c))) for h, c in self._dependent_hub_compartments.iteritems())),
+                tuple(sorted(self._dependent_network_compartments)), tuple(sorted(self._compartment_groups)),
+                tuple(sorted(self.state_variable_parameter_keys())))
+
+    def _compartment_changes(self):
+        """
+        Changes made to the compartments of the patch every time the event is performed, if performing the event does
+        nothing else (so it can be performed without the network, see WellMixedEngine). None if not.
+        :return: dict of Key: compartment, Value: amount changed
+        """
+        return None
+
+    def compartment_changes(self):
+        """
+        Fixed changes made by performing the event. Only valid if perform has not been overridden since the changes
+        were declared (e.g. by a subclass), otherwise None.
+        :return:
+        """
+        changes = self._compartment_changes()
+        if changes is None:
+            return None
+        mro = type(self).__mro__
+        changes_class = next(c for c in mro if '_compartment_changes' in c.__dict__)
+        perform_class = next(c for c in mro if 'perform' in c.__dict__)
+        if not issubclass(changes_class, perform_class):
+            return None
+        return changes
+
     def perform(self, network, patch_id):
         """
         Event is performed at a patch, updating it (and other patches). Must be overridden as specific to each event
@@ -97,6 +291,96 @@ class Event(object):
         raise NotImplementedError
 
 
+class FusedEvent(Event):
+    """
+    Several events with identical state variables and dependencies, held as a single column of a rate table. The
+    reaction parameter is the sum of those of the events, and when performed, one of the events is chosen with
+    probability proportional to its reaction parameter.
+    """
+
+    def __init__(self, events):
+        assert len(set(e.fusion_key() for e in events)) == 1 and events[0].fusion_key() is not None, \
+            "Only events with identical state variables and dependencies can be fused"
+        self._events = events
+        first = events[0]
+        Event.__init__(self, first.get_dependent_compartments(), first.get_dependent_patch_attributes(),
+                       first.get_dependent_edge_attributes())
+        self._dependent_neighbour_compartments = first.get_dependent_neighbour_compartments()
+        self._dependent_hub_compartments = first.get_dependent_hub_compartments()
+        self._dependent_network_compartments = first.get_dependent_network_compartments()
+        self._compartment_groups = first.get_compartment_groups()
+
+    def _define_parameter_keys(self):
+        return None, []
+
+    def events(self):
+        return self._events
+
+    def reaction_parameter(self):
+        return '+'.join(e.reaction_parameter() for e in self._events)
+
+    def reaction_parameter_value(self):
+        return sum(e.reaction_parameter_value() for e in self._events)
+
+    def reaction_parameter_keys(self):
+        return [e.reaction_parameter() for e in self._events]
+
+    def state_variable_parameter_keys(self):
+        return self._events[0].state_variable_parameter_keys()
+
+    def parameter_keys(self):
+        return self.reaction_parameter_keys() + self.state_variable_parameter_keys()
+
+    def applies_to_patch_type(self, patch_type):
+        return all(e.applies_to_patch_type(patch_type) for e in self._events)
+
+    def set_parameters(self, parameter_values):
+        for e in self._events:
+            e.set_parameters(parameter_values)
+
+    def update_parameter(self, parameter, value):
+        for e in self._events:
+            if parameter in e.parameter_keys():
+                e.update_parameter(parameter, value)
+
+    def calculate_rate_at_patch(self, network, patch_id):
+        return self.reaction_parameter_value() * self.calculate_state_variable_at_patch(network, patch_id)
+
+    def calculate_rates(self, network_arrays, patch_indices):
+        return self.reaction_parameter_value() * self.calculate_state_variables(network_arrays, patch_indices)
+
+    def calculate_state_variable_at_patch(self, network, patch_id):
+        return self._events[0].calculate_state_variable_at_patch(network, patch_id)
+
+    def _calculate_state_variable_at_patch(self, network, patch_id):
+        return self._events[0]._calculate_state_variable_at_patch(network, patch_id)
+
+    def calculate_state_variables(self, network_arrays, patch_indices):
+        return self._events[0].calculate_state_variables(network_arrays, patch_indices)
+
+    def _calculate_state_variables(self, network_arrays, patch_indices):
+        return self._events[0]._calculate_state_variables(network_arrays, patch_indices)
+
+    def fusion_key(self):
+        return self._events[0].fusion_key()
+
+    def choose_event(self):
+        """
+        Choose one of the events, with probability proportional to its reaction parameter
+        :return:
+        """
+        r = numpy.random.random() * self.reaction_parameter_value()
+        for e in self._events:
+            r -= e.reaction_parameter_value()
+            if r < 0:
+                return e
+        # Rounding has taken the value beyond the final event, so choose the last with a non-zero reaction parameter
+        return [e for e in self._events if e.reaction_parameter_value() > 0][-1]
+
+    def perform(self, network, patch_id):
+        self.choose_event().perform(network, patch_id)
+
+
 class PatchTypeEvent(Event):
     """
     An event which can only occur at a specific type of patch. Rate will always be zero if calculated at a patch which
@@ -106,18 +390,38 @@ class PatchTypeEvent(Event):
         self._patch_type = patch_type
         Event.__init__(self, dependent_compartments, dependent_attributes, dependent_edge_attributes)
 
-    def calculate_rate_at_patch(self, network, patch_id):
+    def patch_type(self):
+        return self._patch_type
+
+    def applies_to_patch_type(self, patch_type):
+        return patch_type == self._patch_type
+
+    def calculate_state_variable_at_patch(self, network, patch_id):
         """
-        Calculate rate. Zero if at the wrong patch type, otherwise, same as Event.
+        Calculate state variable. Zero if at the wrong patch type, otherwise, same as Event.
         :param network:
         :param patch_id:
         :return:
         """
         if network.node[patch_id][TypedEnvironment.PATCH_TYPE] == self._patch_type:
-            return Event.calculate_rate_at_patch(self, network, patch_id)
+            return self._calculate_state_variable_at_patch(network, patch_id)
         else:
             return 0.0
 
+    def calculate_state_variables(self, network_arrays, patch_indices):
+        """
+        Calculate state variables. Zero at patches of the wrong type, otherwise, same as Event.
+        :param network_arrays:
+        :param patch_indices:
+        :return:
+        """
+        patch_indices = numpy.asarray(patch_indices, dtype=numpy.int)
+        matching = network_arrays.patch_types()[patch_indices] == self._patch_type
+        state_variables = numpy.zeros(len(patch_indices), dtype=numpy.float)
+        if numpy.any(matching):
+            state_variables[matching] = self._calculate_state_variables(network_arrays, patch_indices[matching])
+        return state_variables
+
     def _define_parameter_keys(self):
         raise NotImplementedError
 
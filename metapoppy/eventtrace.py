@@ -0,0 +1,179 @@
+import struct
+import pickle
+import numpy
+from event import FusedEvent
+
+
+class EventTrace(object):
+    """
+    Compact binary trace of a run - every event performed, as a fixed-size record of (time, event column, patch row)
+    appended to a byte buffer, along with what is needed to replay them exactly: the state of the network and the
+    state of the random number generator at the start of the run, the values of the parameters, and records of the
+    patches activated (and seeded), posted events fired and parameters changed during the run. Events which draw random
+    numbers when performed (e.g. choosing a destination or a bacterium to ingest) draw the same numbers on replay, as
+    the generator is restored and advanced by the same draws as the run.
+
+    Records share a format - events have their column (index into the events of the trace) in the column field,
+    other records have a negative kind there. Patch rows index the patches of the trace (all patches of the network).
+    """
+
+    # Kinds of record which are not events (held in the column field)
+    ACTIVATION = -1
+    POSTED_EVENT = -2
+    PARAMETER = -3
+
+    RECORD = struct.Struct('<dii')
+    DTYPE = numpy.dtype([('time', '<f8'), ('column', '<i4'), ('patch', '<i4')])
+
+    def __init__(self, network, events, active_patches, parameters, rng_state, start_time):
+        """
+        Start a trace of a run
+        :param network: Network at the start of the run
+        :param events: Events of the model (events performed are given as indices into this list)
+        :param active_patches: Patches active at the start of the run
+        :param parameters: dict of Key: parameter, Value: value at the start of the run
+        :param rng_state: State of the random number generator at the start of the run
+        :param start_time:
+        """
+        self._patches = list(network.nodes())
+        self._patch_rows = {p: i for i, p in enumerate(self._patches)}
+        # Values are copied as held (rather than as updates), since updates add to values and may be propagated
+        self._initial_state = network.checkpoint()
+        self._active_patches = list(active_patches)
+        self._parameters = dict(parameters)
+        self._rng_state = rng_state
+        self._start_time = start_time
+        self._model_events = events
+        # Columns of the trace - each given by the indices of the model events it is (several for a fused event)
+        self._columns = {}
+        self._column_keys = []
+        self._parameter_updates = []
+        self._buffer = bytearray()
+        self._time = start_time
+
+    def patches(self):
+        return self._patches
+
+    def initial_active_patches(self):
+        return self._active_patches
+
+    def parameters(self):
+        return self._parameters
+
+    def rng_state(self):
+        return self._rng_state
+
+    def start_time(self):
+        return self._start_time
+
+    def column_keys(self):
+        """
+        Model events of each column of the trace
+        :return: List of tuples of indices into the events of the model
+        """
+        return self._column_keys
+
+    def parameter_updates(self):
+        return self._parameter_updates
+
+    def _append(self, time, column, patch_row):
+        self._buffer += EventTrace.RECORD.pack(time, column, patch_row)
+
+    def event(self, time, event, patch_id):
+        """
+        An event is about to be performed
+        :param time: Time of the event
+        :param event: Event (column of a rate table)
+        :param patch_id:
+        :return:
+        """
+        try:
+            column = self._columns[event]
+        except KeyError:
+            members = event.events() if isinstance(event, FusedEvent) else [event]
+            column = self._columns[event] = len(self._column_keys)
+            self._column_keys.append(tuple(self._model_events.index(e) for e in members))
+        self._time = time
+        self._append(time, column, self._patch_rows[patch_id])
+
+    def activation(self, patch_id):
+        """
+        A patch has been activated and is about to be seeded
+        :param patch_id:
+        :return:
+        """
+        self._append(self._time, EventTrace.ACTIVATION, self._patch_rows[patch_id])
+
+    def posted_event(self, time):
+        """
+        A posted event is about to be performed
+        :param time:
+        :return:
+        """
+        self._time = time
+        self._append(time, EventTrace.POSTED_EVENT, -1)
+
+    def parameter(self, parameter, value):
+        """
+        A parameter has been changed
+        :param parameter:
+        :param value:
+        :return:
+        """
+        self._append(self._time, EventTrace.PARAMETER, len(self._parameter_updates))
+        self._parameter_updates.append((parameter, value))
+
+    def __len__(self):
+        return len(self._buffer) // EventTrace.RECORD.size
+
+    def nbytes(self):
+        return len(self._buffer)
+
+    def records(self):
+        """
+        All records of the trace
+        :return: Structured array of (time, column, patch)
+        """
+        return numpy.frombuffer(bytes(self._buffer), dtype=EventTrace.DTYPE)
+
+    def times(self):
+        """
+        Times of the events performed
+        :return:
+        """
+        records = self.records()
+        return records['time'][records['column'] >= 0]
+
+    def restore(self, network):
+        """
+        Return the network to its state at the start of the run (handlers should be detached)
+        :param network:
+        :return:
+        """
+        network.restore(self._initial_state)
+
+    def __getstate__(self):
+        # Events are only needed while tracing
+        state = self.__dict__.copy()
+        state['_model_events'] = None
+        state['_columns'] = {}
+        state['_buffer'] = bytes(self._buffer)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._buffer = bytearray(self._buffer)
+
+    def save(self, filename):
+        """
+        Write the trace to a file (patch IDs and parameter values must be picklable)
+        :param filename:
+        :return:
+        """
+        with open(filename, 'wb') as trace_file:
+            pickle.dump(self, trace_file, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(filename):
+        with open(filename, 'rb') as trace_file:
+            return pickle.load(trace_file)
@@ -0,0 +1,102 @@
+class MobilityKernel(object):
+    """
+    Weights given to the neighbours of a patch as destinations for movement from that patch. The default kernel
+    weights all neighbours equally.
+
+    Kernels must define the patch and edge attributes their weights depend upon, so that the environment can rebuild
+    the weights of a patch when these change.
+    """
+
+    def patch_attributes(self):
+        """
+        Patch attributes (at the patch or its neighbours) which the weights depend upon
+        :return:
+        """
+        return []
+
+    def edge_attributes(self):
+        """
+        Edge attributes (of the edges of the patch) which the weights depend upon
+        :return:
+        """
+        return []
+
+    def weights(self, network, patch_id, neighbours):
+        """
+        Calculate the weight of each neighbour as a destination from the patch
+        :param network:
+        :param patch_id:
+        :param neighbours: List of neighbouring patches
+        :return: List of weights, one per neighbour
+        """
+        return [1.0] * len(neighbours)
+
+
+class GravityKernel(MobilityKernel):
+    """
+    Gravity model - the weight of a neighbour is its mass raised to a power, divided by the distance to it raised to a
+    power. Mass is a patch attribute, distance an edge attribute (all distances are 1 if not given).
+    """
+
+    def __init__(self, mass_attribute, distance_attribute=None, mass_exponent=1.0, distance_exponent=2.0):
+        self._mass_attribute = mass_attribute
+        self._distance_attribute = distance_attribute
+        self._mass_exponent = mass_exponent
+        self._distance_exponent = distance_exponent
+
+    def patch_attributes(self):
+        return [self._mass_attribute]
+
+    def edge_attributes(self):
+        if self._distance_attribute:
+            return [self._distance_attribute]
+        return []
+
+    def weights(self, network, patch_id, neighbours):
+        weights = []
+        for n in neighbours:
+            w = network.get_attribute_value(n, self._mass_attribute) ** self._mass_exponent
+            if self._distance_attribute:
+                w /= network.get_edge_data(patch_id, n)[self._distance_attribute] ** self._distance_exponent
+            weights.append(w)
+        return weights
+
+
+class RadiationKernel(MobilityKernel):
+    """
+    Radiation model - the weight of neighbour j from patch i is m_i m_j / ((m_i + s_ij)(m_i + m_j + s_ij)), where m is
+    the mass (a patch attribute) and s_ij is the total mass of the other neighbours of i which are closer than j (by the
+    distance edge attribute). The intervening population is taken over the neighbours of the patch rather than over
+    all space.
+    """
+
+    def __init__(self, mass_attribute, distance_attribute):
+        self._mass_attribute = mass_attribute
+        self._distance_attribute = distance_attribute
+
+    def patch_attributes(self):
+        return [self._mass_attribute]
+
+    def edge_attributes(self):
+        return [self._distance_attribute]
+
+    def weights(self, network, patch_id, neighbours):
+        m_i = network.get_attribute_value(patch_id, self._mass_attribute)
+        distances = [network.get_edge_data(patch_id, n)[self._distance_attribute] for n in neighbours]
+        masses = [network.get_attribute_value(n, self._mass_attribute) for n in neighbours]
+        weights = [0.0] * len(neighbours)
+        # Visit neighbours nearest first, accumulating the mass of those closer than the current one. Neighbours at
+        # equal distance do not intervene for each other.
+        order = sorted(range(len(neighbours)), key=lambda x: distances[x])
+        s = 0.0
+        index = 0
+        while index < len(order):
+            tied = [order[index]]
+            while index + len(tied) < len(order) and distances[order[index + len(tied)]] == distances[tied[0]]:
+                tied.append(order[index + len(tied)])
+            for j in tied:
+                denominator = (m_i + s) * (m_i + masses[j] + s)
+                weights[j] = (m_i * masses[j]) / denominator if denominator else 0.0
+            s += sum(masses[j] for j in tied)
+            index += len(tied)
+        return weights
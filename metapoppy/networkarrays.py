@@ -0,0 +1,118 @@
+import numpy
+from environment import *
+
+
+class NetworkArrays(object):
+    """
+    Columnar view of the values at a list of patches on a network, for evaluating the state variables of events at
+    many patches at once (see Event.calculate_rates). Each column (a compartment, compartment group, attribute, etc.)
+    is an array with one entry per patch, in the order of the patches given. Columns are read from the network the
+    first time they are requested and then held, so after the network changes the view must be told which patches have
+    changed (see refresh) before it is used again.
+    """
+
+    def __init__(self, network, patches):
+        """
+        Create a view of the network
+        :param network:
+        :param patches: List of patch IDs
+        """
+        self._network = network
+        self._patches = list(patches)
+        self._columns = {}
+        self._functions = {}
+
+    def network(self):
+        return self._network
+
+    def patches(self):
+        return self._patches
+
+    def __len__(self):
+        return len(self._patches)
+
+    def values(self, key, function, dtype=numpy.float):
+        """
+        Column of values given by a function of each patch (read once, then held under the key)
+        :param key:
+        :param function: Function of (network, patch ID)
+        :param dtype: Type of the array
+        :return: Array of values
+        """
+        try:
+            return self._columns[key]
+        except KeyError:
+            column = numpy.array([function(self._network, p) for p in self._patches], dtype=dtype)
+            self._columns[key] = column
+            self._functions[key] = function
+            return column
+
+    def add_patches(self, patches):
+        """
+        Extend the view with more patches, reading the held columns at the new patches only
+        :param patches: List of patch IDs
+        :return:
+        """
+        patches = list(patches)
+        for key, column in self._columns.iteritems():
+            function = self._functions[key]
+            self._columns[key] = numpy.concatenate(
+                (column, numpy.array([function(self._network, p) for p in patches], dtype=column.dtype)))
+        self._patches += patches
+
+    def refresh(self, indices):
+        """
+        Re-read the held columns at the given patches (e.g. after their values on the network have changed)
+        :param indices: Indices of the patches (within the view) to re-read
+        :return:
+        """
+        for key, column in self._columns.iteritems():
+            function = self._functions[key]
+            for i in indices:
+                column[i] = function(self._network, self._patches[i])
+
+    def compartment(self, compartment):
+        """
+        Values of a compartment (or registered compartment group)
+        :param compartment:
+        :return:
+        """
+        return self.values((Environment.COMPARTMENTS, compartment),
+                           lambda network, p: network.get_compartment_value(p, compartment))
+
+    def attribute(self, attribute):
+        """
+        Values of a patch attribute (zero at patches which do not hold the attribute, e.g. patches of another type)
+        :param attribute:
+        :return:
+        """
+        return self.values((Environment.ATTRIBUTES, attribute),
+                           lambda network, p: network.node[p][Environment.ATTRIBUTES].get(attribute, 0.0))
+
+    def degree(self):
+        """
+        Number of neighbours of each patch
+        :return:
+        """
+        return self.values('degree', lambda network, p: network.patch_degree(p))
+
+    def patch_types(self):
+        """
+        Type of each patch (as an object array)
+        :return:
+        """
+        return self.values(TypedEnvironment.PATCH_TYPE,
+                           lambda network, p: network.node[p][TypedEnvironment.PATCH_TYPE], dtype=object)
+
+def safe_divide(numerator, denominator):
+    """
+    Element-wise division, giving zero wherever the denominator is zero
+    :param numerator: Array
+    :param denominator: Array
+    :return:
+    """
+    numerator, denominator = numpy.broadcast_arrays(numpy.asarray(numerator, dtype=numpy.float),
+                                                    numpy.asarray(denominator, dtype=numpy.float))
+    result = numpy.zeros(numerator.shape, dtype=numpy.float)
+    numpy.divide(numerator, denominator, out=result, where=denominator != 0)
+    return result
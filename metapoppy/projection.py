@@ -0,0 +1,97 @@
+from environment import *
+
+
+class OutputProjection(object):
+    """
+    Declares what is recorded of a run. Each selection gives, for the patches of a patch type (or all patches), the
+    compartments, compartment groups (recorded as their sum) and patch attributes to record. Patches not covered by any
+    selection are not recorded, and the recorder only reads the values selected.
+
+    e.g. OutputProjection().select('a', compartment_groups={'total': ['x', 'y']}, patch_attributes=[]).select('b')
+    records only the total of x and y at patches of type a, and everything at patches of type b.
+    """
+
+    def __init__(self):
+        self._selections = []
+
+    def select(self, patch_type=None, compartments=None, compartment_groups=None, patch_attributes=None):
+        """
+        Add a selection. A patch uses the first selection which covers it.
+        :param patch_type: Type of patches selected (None for all patches)
+        :param compartments: Compartments to record (None for all)
+        :param compartment_groups: dict of Key: group name, Value: list of compartments, to record the sums of
+        :param patch_attributes: Patch attributes to record (None for all held at the patch)
+        :return: This projection
+        """
+        self._selections.append((patch_type, compartments, compartment_groups or {}, patch_attributes))
+        return self
+
+    def compartment_groups(self):
+        """
+        All compartment groups recorded, to be registered on the network
+        :return: dict of Key: group name, Value: list of compartments
+        """
+        groups = {}
+        for _, _, selection_groups, _ in self._selections:
+            groups.update(selection_groups)
+        return groups
+
+    def _selection(self, network, patch_id):
+        patch_type = network.node[patch_id].get(TypedEnvironment.PATCH_TYPE)
+        for selection in self._selections:
+            if selection[0] is None or selection[0] == patch_type:
+                return selection
+        return None
+
+    def is_recorded(self, network, patch_id):
+        return self._selection(network, patch_id) is not None
+
+    def compartments_at_patch(self, network, patch_id):
+        """
+        Compartments and compartment groups recorded at the patch
+        :param network:
+        :param patch_id:
+        :return: List of compartments and group names
+        """
+        _, compartments, groups, _ = self._selection(network, patch_id)
+        if compartments is None:
+            compartments = network.compartments()
+        return list(compartments) + sorted(groups.keys())
+
+    def attributes_at_patch(self, network, patch_id):
+        """
+        Patch attributes recorded at the patch
+        :param network:
+        :param patch_id:
+        :return:
+        """
+        attributes = network.node[patch_id].get(Environment.ATTRIBUTES, {})
+        selected = self._selection(network, patch_id)[3]
+        if selected is None:
+            return [a for a in network.patch_attributes() if a in attributes]
+        return [a for a in selected if a in attributes]
+
+    def compartment_columns(self, network):
+        """
+        All compartments and groups recorded at any patch
+        :param network:
+        :return:
+        """
+        columns = []
+        for _, compartments, groups, _ in self._selections:
+            for c in list(network.compartments() if compartments is None else compartments) + sorted(groups.keys()):
+                if c not in columns:
+                    columns.append(c)
+        return columns
+
+    def attribute_columns(self, network):
+        """
+        All patch attributes recorded at any patch
+        :param network:
+        :return:
+        """
+        columns = set()
+        for p in network.nodes():
+            if self.is_recorded(network, p):
+                columns.update(self.attributes_at_patch(network, p))
+        return [a for a in network.patch_attributes() if a in columns]
@@ -0,0 +1,421 @@
+import numpy
+from networkarrays import NetworkArrays
+
+
+class RateTable(object):
+    """
+    Rates of events at the active patches of a network, held in factorised form.
+
+    The rate of every event at a patch is the event's reaction parameter (a single value, constant across patches)
+    multiplied by its state variable at the patch. The table stores the state variables (one row per active patch, one
+    column per event) and the reaction parameters (one value per column) separately, alongside the rates (their
+    product). An index from parameter key to the columns which depend on it is built upon creation, so a change in a
+    reaction parameter is a single rescale of the affected columns, and a change in any other parameter only
+    recalculates the state variables of the columns which use it.
+
+    The dependencies of the events (on compartments, attributes and edges at their own patch and on compartments at
+    other patches) are also compiled upon creation into arrays of column numbers. The columns affected by a set of
+    changes are looked up once and memoised, so propagating an update does not rebuild them.
+
+    A table may be restricted to patches of a single type, in which case it only holds the events which can occur at
+    that type of patch (so no patch type checks are needed when calculating state variables).
+
+    Bulk operations (adding many patches at once, recalculating columns at every patch) evaluate each column with the
+    vectorised state variable function of its event. The columnar view of the network these use is held between bulk
+    operations: patches whose values change are marked (see patch_changed) and only those rows are re-read.
+    """
+
+    # Dependency types
+    COMPARTMENT = 'compartment'
+    PATCH_ATTRIBUTE = 'patch_attribute'
+    EDGE_ATTRIBUTE = 'edge_attribute'
+    NEIGHBOUR_COMPARTMENT = 'neighbour_compartment'
+    NETWORK_COMPARTMENT = 'network_compartment'
+    HUB_COMPARTMENT = 'hub_compartment'
+
+    NO_COLUMNS = numpy.array([], dtype=numpy.int)
+
+    # Keys of a checkpoint of the table
+    PATCHES = 'patches'
+    STATE_VARIABLES = 'state_variables'
+    RATES = 'rates'
+    REACTION_PARAMETERS = 'reaction_parameters'
+
+    # Number of rows allocated whenever the table runs out of space
+    ROW_CHUNK = 32
+
+    def __init__(self, events, patch_type=None):
+        """
+        Create an empty rate table for the given events
+        :param events: List of events, one per column
+        :param patch_type: Type of patch the rows of the table belong to (None if the patches are not typed)
+        """
+        self._events = events
+        self._num_events = len(events)
+        self._patch_type = patch_type
+        if patch_type is not None:
+            assert all(e.applies_to_patch_type(patch_type) for e in events), \
+                "All events must be able to occur at patch type {0}".format(patch_type)
+        # Every event in the table applies to the patches, so use the state variable function directly
+        self._state_variable_functions = [e._calculate_state_variable_at_patch for e in events]
+        self._state_variables_functions = [e._calculate_state_variables for e in events]
+
+        self._patches = []
+        self._row_for_patch = {}
+        # Columnar view of the network at the rows (built on first use), and the rows whose values have changed since
+        self._network_arrays = None
+        self._changed_rows = set()
+
+        self._reaction_parameters = numpy.zeros(self._num_events, dtype=numpy.float)
+        self._state_variables = numpy.zeros((RateTable.ROW_CHUNK, self._num_events), dtype=numpy.float)
+        self._rates = numpy.zeros((RateTable.ROW_CHUNK, self._num_events), dtype=numpy.float)
+
+        # Parameter dependency index - parameter key to columns whose reaction parameter is the key, and parameter key
+        # to columns whose state variable calculation uses the key
+        reaction_parameter_columns = {}
+        state_variable_parameter_columns = {}
+        for col in range(self._num_events):
+            event = self._events[col]
+            for k in event.reaction_parameter_keys():
+                reaction_parameter_columns.setdefault(k, []).append(col)
+            for k in event.state_variable_parameter_keys():
+                state_variable_parameter_columns.setdefault(k, []).append(col)
+        self._reaction_parameter_columns = {k: numpy.array(v, dtype=numpy.int) for k, v in
+                                            reaction_parameter_columns.iteritems()}
+        self._state_variable_parameter_columns = {k: numpy.array(v, dtype=numpy.int) for k, v in
+                                                  state_variable_parameter_columns.iteritems()}
+
+        # Dependency index - for each dependency type, the key changed (e.g. compartment) to the columns which must be
+        # recalculated. Hub dependencies are keyed by (hub patch ID, compartment).
+        dependencies = {t: {} for t in [RateTable.COMPARTMENT, RateTable.PATCH_ATTRIBUTE, RateTable.EDGE_ATTRIBUTE,
+                                        RateTable.NEIGHBOUR_COMPARTMENT, RateTable.NETWORK_COMPARTMENT,
+                                        RateTable.HUB_COMPARTMENT]}
+        for col in range(self._num_events):
+            event = self._events[col]
+            for dep_type, keys in [(RateTable.COMPARTMENT, event.get_dependent_compartments()),
+                                   (RateTable.PATCH_ATTRIBUTE, event.get_dependent_patch_attributes()),
+                                   (RateTable.EDGE_ATTRIBUTE, event.get_dependent_edge_attributes()),
+                                   (RateTable.NEIGHBOUR_COMPARTMENT, event.get_dependent_neighbour_compartments()),
+                                   (RateTable.NETWORK_COMPARTMENT, event.get_dependent_network_compartments()),
+                                   (RateTable.HUB_COMPARTMENT,
+                                    [(h, c) for h, comps in event.get_dependent_hub_compartments().iteritems()
+                                     for c in comps])]:
+                for k in keys:
+                    cols = dependencies[dep_type].setdefault(k, [])
+                    if col not in cols:
+                        cols.append(col)
+        self._dependencies = {t: {k: numpy.array(v, dtype=numpy.int) for k, v in deps.iteritems()}
+                              for t, deps in dependencies.iteritems()}
+        self._hub_patches = set(h for h, _ in self._dependencies[RateTable.HUB_COMPARTMENT])
+        # Memoised columns for a set of changed keys
+        self._column_cache = {t: {} for t in self._dependencies}
+
+    def events(self):
+        return self._events
+
+    def patch_type(self):
+        return self._patch_type
+
+    def patches(self):
+        """
+        Patches with a row in the table, in row order
+        :return:
+        """
+        return self._patches
+
+    def row_for_patch(self, patch_id):
+        return self._row_for_patch[patch_id]
+
+    def has_patch(self, patch_id):
+        return patch_id in self._row_for_patch
+
+    def state_variables(self):
+        """
+        View of the state variables of all active patches (rows) and events (columns)
+        :return:
+        """
+        return self._state_variables[:len(self._patches)]
+
+    def reaction_parameters(self):
+        return self._reaction_parameters
+
+    def rates(self):
+        """
+        View of the rates of all events (columns) at all active patches (rows)
+        :return:
+        """
+        return self._rates[:len(self._patches)]
+
+    def total(self):
+        """
+        Sum of the rates of all events at all active patches
+        :return:
+        """
+        return numpy.sum(self._rates[:len(self._patches)])
+
+    def set_reaction_parameters(self):
+        """
+        Read the reaction parameter of every event (e.g. after configuration) and rescale all rates
+        :return:
+        """
+        self._reaction_parameters = numpy.array([e.reaction_parameter_value() for e in self._events],
+                                                dtype=numpy.float)
+        rows = len(self._patches)
+        self._rates[:rows] = self._state_variables[:rows] * self._reaction_parameters
+
+    def add_patch(self, network, patch_id):
+        """
+        Add a row to the table for the patch and calculate the state variable of every event there
+        :param network:
+        :param patch_id:
+        :return: Row number of the patch
+        """
+        row = len(self._patches)
+        self._reserve_rows(row + 1)
+        self._row_for_patch[patch_id] = row
+        self._patches.append(patch_id)
+        if self._network_arrays is not None:
+            self._network_arrays.add_patches([patch_id])
+
+        self._state_variables[row] = [f(network, patch_id) for f in self._state_variable_functions]
+        self._rates[row] = self._state_variables[row] * self._reaction_parameters
+        return row
+
+    def add_patches(self, network, patch_ids):
+        """
+        Add a row to the table for each of the patches and calculate the state variables of every event there, a
+        column at a time
+        :param network:
+        :param patch_ids: List of patch IDs
+        :return:
+        """
+        first_row = len(self._patches)
+        self._reserve_rows(first_row + len(patch_ids))
+        for patch_id in patch_ids:
+            self._row_for_patch[patch_id] = len(self._patches)
+            self._patches.append(patch_id)
+        if self._network_arrays is not None:
+            self._network_arrays.add_patches(patch_ids)
+        self._calculate_columns(network, range(self._num_events), first_row)
+
+    def _reserve_rows(self, rows):
+        """
+        Allocate chunks of rows until the table has space for the given number of rows
+        :param rows:
+        :return:
+        """
+        if rows > self._state_variables.shape[0]:
+            chunks = -(-(rows - self._state_variables.shape[0]) // RateTable.ROW_CHUNK)
+            extra = numpy.zeros((chunks * RateTable.ROW_CHUNK, self._num_events), dtype=numpy.float)
+            self._state_variables = numpy.concatenate((self._state_variables, extra), 0)
+            self._rates = numpy.concatenate((self._rates, extra), 0)
+
+    def _calculate_columns(self, network, cols, first_row=0):
+        """
+        Recalculate the state variables (and hence rates) of the given columns at every row from the first row onwards
+        :param network:
+        :param cols:
+        :param first_row:
+        :return:
+        """
+        rows = len(self._patches)
+        if rows <= first_row:
+            return
+        network_arrays = self._current_network_arrays(network)
+        indices = numpy.arange(first_row, rows)
+        functions = self._state_variables_functions
+        for col in cols:
+            self._state_variables[first_row:rows, col] = functions[col](network_arrays, indices)
+            self._rates[first_row:rows, col] = self._state_variables[first_row:rows, col] * \
+                                               self._reaction_parameters[col]
+
+    def _current_network_arrays(self, network):
+        """
+        Columnar view of the network at every row, re-reading only the rows which have changed since last used
+        :param network:
+        :return:
+        """
+        if self._network_arrays is None or self._network_arrays.network() is not network:
+            self._network_arrays = NetworkArrays(network, self._patches)
+        elif self._changed_rows:
+            self._network_arrays.refresh(self._changed_rows)
+        self._changed_rows.clear()
+        return self._network_arrays
+
+    def patch_changed(self, patch_id):
+        """
+        Values (compartments, attributes or edges) at the patch have changed on the network, so its row of the columnar
+        view must be re-read before next used
+        :param patch_id:
+        :return:
+        """
+        if self._network_arrays is not None:
+            self._changed_rows.add(self._row_for_patch[patch_id])
+
+    def _columns(self, dep_type, keys):
+        """
+        Columns dependent on any of the keys, for the given dependency type. Compiled once per combination of keys and
+        memoised.
+        :param dep_type:
+        :param keys:
+        :return: Array of column numbers
+        """
+        cache_key = tuple(keys)
+        cache = self._column_cache[dep_type]
+        if cache_key not in cache:
+            dependencies = self._dependencies[dep_type]
+            col_arrays = [dependencies[k] for k in cache_key if k in dependencies]
+            if col_arrays:
+                cache[cache_key] = numpy.unique(numpy.concatenate(col_arrays))
+            else:
+                cache[cache_key] = RateTable.NO_COLUMNS
+        return cache[cache_key]
+
+    def patch_columns(self, compartments, patch_attributes):
+        """
+        Columns to recalculate at a patch when the given compartments and attributes have changed there
+        :param compartments:
+        :param patch_attributes:
+        :return:
+        """
+        if not patch_attributes:
+            return self._columns(RateTable.COMPARTMENT, compartments)
+        elif not compartments:
+            return self._columns(RateTable.PATCH_ATTRIBUTE, patch_attributes)
+        return numpy.union1d(self._columns(RateTable.COMPARTMENT, compartments),
+                             self._columns(RateTable.PATCH_ATTRIBUTE, patch_attributes))
+
+    def edge_columns(self, edge_attributes):
+        """
+        Columns to recalculate at both ends of an edge when the given edge attributes have changed
+        :param edge_attributes:
+        :return:
+        """
+        return self._columns(RateTable.EDGE_ATTRIBUTE, edge_attributes)
+
+    def neighbour_compartments(self):
+        """
+        Compartments at a patch which events at its neighbours depend on
+        :return:
+        """
+        return self._dependencies[RateTable.NEIGHBOUR_COMPARTMENT].keys()
+
+    def neighbour_columns(self, compartments):
+        """
+        Columns to recalculate at the neighbours of a patch when the given compartments have changed at the patch
+        :param compartments:
+        :return:
+        """
+        return self._columns(RateTable.NEIGHBOUR_COMPARTMENT, compartments)
+
+    def network_columns(self, patch_id, compartments):
+        """
+        Columns to recalculate at every patch when the given compartments have changed at the given patch (either
+        because the patch is a hub for an event or because an event depends on the network-wide values)
+        :param patch_id:
+        :param compartments:
+        :return:
+        """
+        cols = self._columns(RateTable.NETWORK_COMPARTMENT, compartments)
+        if patch_id in self._hub_patches:
+            cols = numpy.union1d(cols, self._columns(RateTable.HUB_COMPARTMENT, [(patch_id, c) for c in compartments]))
+        return cols
+
+    def update_patch(self, network, patch_id, cols):
+        """
+        Recalculate the state variables (and hence rates) of the given columns at the patch
+        :param network:
+        :param patch_id:
+        :param cols: Iterable of column numbers
+        :return:
+        """
+        row = self._row_for_patch[patch_id]
+        if self._network_arrays is not None:
+            self._changed_rows.add(row)
+        state_variables = self._state_variables[row]
+        rates = self._rates[row]
+        functions = self._state_variable_functions
+        for col in cols:
+            sv = functions[col](network, patch_id)
+            state_variables[col] = sv
+            rates[col] = sv * self._reaction_parameters[col]
+
+    def update_all_patches(self, network, cols):
+        """
+        Recalculate the state variables (and hence rates) of the given columns at every patch
+        :param network:
+        :param cols:
+        :return:
+        """
+        if len(self._patches) == 1:
+            self.update_patch(network, self._patches[0], cols)
+        else:
+            self._calculate_columns(network, cols)
+
+    def update_parameter(self, network, parameter):
+        """
+        A parameter value has changed on the events. Columns where it is the reaction parameter are rescaled. Columns
+        where it is used to calculate the state variable are recalculated at every active patch.
+        :param network:
+        :param parameter:
+        :return:
+        """
+        rows = len(self._patches)
+        if parameter in self._reaction_parameter_columns:
+            cols = self._reaction_parameter_columns[parameter]
+            self._reaction_parameters[cols] = [self._events[c].reaction_parameter_value() for c in cols]
+            self._rates[:rows, cols] = self._state_variables[:rows, cols] * self._reaction_parameters[cols]
+        if parameter in self._state_variable_parameter_columns:
+            self.update_all_patches(network, self._state_variable_parameter_columns[parameter])
+
+    def choose(self, r):
+        """
+        Choose a patch and event, with probability proportional to its rate.
+        :param r: Value in range [0, total rate)
+        :return: (patch ID, event)
+        """
+        rows = len(self._patches)
+        flat_rates = self._rates[:rows].ravel()
+        index = numpy.searchsorted(numpy.cumsum(flat_rates), r, side='right')
+        # Guard against rounding taking the index beyond the final cell with a non-zero rate
+        if index >= flat_rates.size:
+            index = numpy.flatnonzero(flat_rates)[-1]
+        return self._patches[index // self._num_events], self._events[index % self._num_events]
+
+    def clear(self):
+        """
+        Remove all rows
+        :return:
+        """
+        self._patches = []
+        self._row_for_patch = {}
+        self._network_arrays = None
+        self._changed_rows.clear()
+        self._state_variables[:] = 0.0
+        self._rates[:] = 0.0
+
+    def checkpoint(self):
+        """
+        Copy of the rows of the table and the reaction parameters, to be restored with restore
+        :return:
+        """
+        rows = len(self._patches)
+        return {RateTable.PATCHES: list(self._patches),
+                RateTable.STATE_VARIABLES: self._state_variables[:rows].copy(),
+                RateTable.RATES: self._rates[:rows].copy(),
+                RateTable.REACTION_PARAMETERS: self._reaction_parameters.copy()}
+
+    def restore(self, state):
+        """
+        Replace the rows of the table and the reaction parameters with those of a checkpoint
+        :param state: Result of checkpoint
+        :return:
+        """
+        self.clear()
+        patches = state[RateTable.PATCHES]
+        self._reserve_rows(len(patches))
+        self._patches = list(patches)
+        self._row_for_patch = {p: i for i, p in enumerate(patches)}
+        self._state_variables[:len(patches)] = state[RateTable.STATE_VARIABLES]
+        self._rates[:len(patches)] = state[RateTable.RATES]
+        self._reaction_parameters = state[RateTable.REACTION_PARAMETERS].copy()
@@ -0,0 +1,540 @@
+import numpy
+import copy
+from environment import *
+from resultstore import *
+from projection import *
+
+
+class ResultRecorder(object):
+    """
+    Columnar store of the results of a run. Compartment values (counts) are held in a preallocated integer array of
+    shape (time x patch x compartment) and patch attribute values in one of shape (time x patch x attribute), both
+    doubled in size whenever more times are recorded or more patches become active than they can hold. Anything else held at a patch (e.g. its patch type) does not
+    change during a run, so is stored once per patch.
+
+    Only active patches are recorded. A patch which becomes active mid-run is added as a new (sparse) column, with the
+    times at which it was recorded marked in a mask. Edge attribute values can also be recorded, in an array of shape
+    (time x edge x edge attribute).
+
+    Results are given in the same nested dictionary form as the network data ({time: {patch: data}}) by results().
+
+    If given a ResultStore, the recorder only holds one chunk of times in memory: when full, the chunk is passed to the
+    store to be written to disk, and results() gives only a reference to the run's directory in the store.
+
+    If given an OutputProjection, only the patches, compartments (and compartment groups) and attributes it selects
+    are read and recorded.
+    """
+
+    CHUNK_SIZE = 64
+
+    # Key of the edge values at each time in results() (only present when edges are recorded)
+    EDGES = 'edges'
+
+    def __init__(self, record_edges=False, chunk_size=CHUNK_SIZE, store=None):
+        """
+        Create a recorder
+        :param record_edges: Whether to record edge attribute values
+        :param chunk_size: Number of times (and patches) the arrays initially hold, and number of times in each chunk
+        written to the store
+        :param store: ResultStore to write results to (None to hold them in memory)
+        """
+        self._record_edges = record_edges
+        self._store = store
+        self._projection = None
+        self._chunk_size = chunk_size
+        self._compartments = []
+        self._patch_attributes = []
+        self._edge_attributes = []
+        self.reset()
+
+    def reset(self, network=None):
+        """
+        Clear all recorded values, ready to record a run on the network
+        :param network:
+        :return:
+        """
+        self._times = numpy.zeros(self._chunk_size, dtype=numpy.float)
+        self._num_times = 0
+        self._patches = []
+        self._patch_index = {}
+        self._patch_data = []
+        self._patch_compartment_columns = []
+        self._patch_attribute_columns = []
+        self._excluded_patches = set()
+        self._edges = []
+        if network is not None:
+            if self._projection is not None:
+                self._compartments = self._projection.compartment_columns(network)
+                self._patch_attributes = self._projection.attribute_columns(network)
+            else:
+                self._compartments = list(network.compartments())
+                patch_attributes = set()
+                for p in network.nodes():
+                    patch_attributes.update(network.node[p].get(Environment.ATTRIBUTES, {}).keys())
+                self._patch_attributes = [a for a in network.patch_attributes() if a in patch_attributes]
+            self._edge_attributes = list(network.edge_attributes())
+            if self._record_edges:
+                self._edges = list(network.edges())
+            if self._store is not None:
+                self._store.open(self._compartments, self._patch_attributes, self._edge_attributes, self._edges)
+        self._compartment_values = numpy.zeros((self._chunk_size, self._chunk_size, len(self._compartments)),
+                                               dtype=numpy.int64)
+        self._attribute_values = numpy.full((self._chunk_size, self._chunk_size, len(self._patch_attributes)),
+                                            numpy.nan, dtype=numpy.float)
+        self._recorded = numpy.zeros((self._chunk_size, self._chunk_size), dtype=numpy.bool)
+        self._edge_values = numpy.zeros((self._chunk_size, len(self._edges), len(self._edge_attributes)),
+                                        dtype=numpy.float)
+
+    def set_record_edges(self, record_edges):
+        """
+        Set whether to record edge attribute values (takes effect from the next reset)
+        :param record_edges:
+        :return:
+        """
+        self._record_edges = record_edges
+
+    def set_store(self, store):
+        """
+        Set the store to write results to, or None to hold them in memory (takes effect from the next reset)
+        :param store: ResultStore
+        :return:
+        """
+        self._store = store
+
+    def store(self):
+        return self._store
+
+    def set_projection(self, projection):
+        """
+        Set the projection of what to record, or None to record everything (takes effect from the next reset)
+        :param projection: OutputProjection
+        :return:
+        """
+        self._projection = projection
+
+    def projection(self):
+        return self._projection
+
+    def _flush(self):
+        """
+        Pass the times held to the store, and clear them from memory
+        :return:
+        """
+        n = self._num_times
+        num_patches = len(self._patches)
+        arrays = {ResultStore.TIMES: self._times[:n].copy(),
+                  ResultStore.COMPARTMENT_VALUES: self._compartment_values[:n, :num_patches].copy(),
+                  ResultStore.ATTRIBUTE_VALUES: self._attribute_values[:n, :num_patches].copy(),
+                  ResultStore.RECORDED: self._recorded[:n, :num_patches].copy(),
+                  ResultStore.EDGE_VALUES: self._edge_values[:n].copy()}
+        self._store.write_chunk(arrays, self._patches, self._patch_data,
+                                [[c, a] for c, a in zip(self._patch_compartment_columns,
+                                                        self._patch_attribute_columns)])
+        self._num_times = 0
+        self._compartment_values[:n] = 0
+        self._attribute_values[:n] = numpy.nan
+        self._recorded[:n] = False
+        self._edge_values[:n] = 0.0
+
+    def _grow(self, num_times, num_patches):
+        """
+        Grow the arrays (doubling them, so the copying is linear over a run) to hold at least the given number of times
+        and patches
+        :param num_times:
+        :param num_patches:
+        :return:
+        """
+        time_capacity, patch_capacity = self._recorded.shape
+        if num_times <= time_capacity and num_patches <= patch_capacity:
+            return
+        while time_capacity < num_times:
+            time_capacity *= 2
+        while patch_capacity < num_patches:
+            patch_capacity *= 2
+
+        def grown(array, shape, fill):
+            new_array = numpy.full(shape, fill, dtype=array.dtype)
+            new_array[tuple(slice(0, n) for n in array.shape)] = array
+            return new_array
+
+        self._times = grown(self._times, (time_capacity,), 0.0)
+        self._compartment_values = grown(self._compartment_values,
+                                         (time_capacity, patch_capacity, len(self._compartments)), 0)
+        self._attribute_values = grown(self._attribute_values,
+                                       (time_capacity, patch_capacity, len(self._patch_attributes)), numpy.nan)
+        self._recorded = grown(self._recorded, (time_capacity, patch_capacity), False)
+        self._edge_values = grown(self._edge_values, (time_capacity, len(self._edges), len(self._edge_attributes)),
+                                  0.0)
+
+    def _add_patch(self, network, patch_id):
+        """
+        Add a column for a newly active patch, storing its static data
+        :param network:
+        :param patch_id:
+        :return:
+        """
+        if self._projection is not None and not self._projection.is_recorded(network, patch_id):
+            self._excluded_patches.add(patch_id)
+            return
+        self._patch_index[patch_id] = len(self._patches)
+        self._patches.append(patch_id)
+        data = network.node[patch_id]
+        self._patch_data.append({k: v for k, v in data.iteritems()
+                                 if k not in (Environment.COMPARTMENTS, Environment.ATTRIBUTES)})
+        if self._projection is not None:
+            compartments = self._projection.compartments_at_patch(network, patch_id)
+            self._patch_compartment_columns.append([self._compartments.index(c) for c in compartments])
+            attributes = self._projection.attributes_at_patch(network, patch_id)
+        else:
+            # All compartments
+            self._patch_compartment_columns.append(None)
+            attributes = data.get(Environment.ATTRIBUTES, {})
+        self._patch_attribute_columns.append([i for i, a in enumerate(self._patch_attributes) if a in attributes])
+
+    def record(self, time, network, patches):
+        """
+        Record the values of the patches on the network
+        :param time:
+        :param network:
+        :param patches: IDs of the patches to record (i.e. active patches)
+        :return:
+        """
+        if self._store is not None and self._num_times == self._chunk_size:
+            self._flush()
+        for patch_id in patches:
+            if patch_id not in self._patch_index and patch_id not in self._excluded_patches:
+                self._add_patch(network, patch_id)
+        if self._excluded_patches:
+            patches = [p for p in patches if p not in self._excluded_patches]
+        self._grow(self._num_times + 1, len(self._patches))
+
+        t = self._num_times
+        self._times[t] = time
+        if patches:
+            indices = [self._patch_index[p] for p in patches]
+            compartments = self._compartments
+            nodes = [network.node[p] for p in patches]
+            if self._projection is not None:
+                compartment_values = self._compartment_values[t]
+                for i, p in zip(indices, patches):
+                    columns = self._patch_compartment_columns[i]
+                    compartment_values[i, columns] = [network.get_compartment_value(p, compartments[c])
+                                                      for c in columns]
+            else:
+                self._compartment_values[t, indices] = [[n[Environment.COMPARTMENTS][c] for c in compartments]
+                                                        for n in nodes]
+            if self._patch_attributes:
+                attribute_values = self._attribute_values[t]
+                patch_attributes = self._patch_attributes
+                for i, n in zip(indices, nodes):
+                    attributes = n[Environment.ATTRIBUTES]
+                    columns = self._patch_attribute_columns[i]
+                    attribute_values[i, columns] = [attributes[patch_attributes[c]] for c in columns]
+            self._recorded[t, indices] = True
+        if self._edges:
+            edge_attributes = self._edge_attributes
+            self._edge_values[t] = [[network.get_edge_data(u, v)[a] for a in edge_attributes]
+                                    for u, v in self._edges]
+        self._num_times += 1
+
+    def times(self):
+        """
+        Times recorded (only those not yet passed to the store, if there is one)
+        :return:
+        """
+        return self._times[:self._num_times]
+
+    def patches(self):
+        return self._patches
+
+    def patch_index(self, patch_id):
+        return self._patch_index[patch_id]
+
+    def patch_data(self, patch_id):
+        """
+        Data held at the patch which does not change during a run (e.g. its patch type)
+        :param patch_id:
+        :return:
+        """
+        return self._patch_data[self._patch_index[patch_id]]
+
+    def compartments(self):
+        return self._compartments
+
+    def patch_attributes(self):
+        return self._patch_attributes
+
+    def edges(self):
+        return self._edges
+
+    def edge_attributes(self):
+        return self._edge_attributes
+
+    def compartment_values(self):
+        """
+        Recorded compartment values (zero where a patch was not recorded)
+        :return: Array of shape (time x patch x compartment)
+        """
+        return self._compartment_values[:self._num_times, :len(self._patches)]
+
+    def attribute_values(self):
+        """
+        Recorded patch attribute values (NaN where a patch was not recorded, or does not hold the attribute)
+        :return: Array of shape (time x patch x attribute)
+        """
+        return self._attribute_values[:self._num_times, :len(self._patches)]
+
+    def recorded(self):
+        """
+        Mask of which patches were recorded at each time
+        :return: Boolean array of shape (time x patch)
+        """
+        return self._recorded[:self._num_times, :len(self._patches)]
+
+    def edge_values(self):
+        """
+        Recorded edge attribute values
+        :return: Array of shape (time x edge x edge attribute)
+        """
+        return self._edge_values[:self._num_times]
+
+    def nbytes(self):
+        """
+        Memory used by the values recorded
+        :return: Number of bytes
+        """
+        return sum(a.nbytes for a in [self.times(), self.compartment_values(), self.attribute_values(), self.recorded(),
+                                      self.edge_values()])
+
+    def snapshot(self, index):
+        """
+        Values recorded at one time, in the form of the network data
+        :param index: Index of the record time
+        :return: dict of Key: patch ID, Value: patch data
+        """
+        num_patches = len(self._patches)
+        return self._snapshot(self._compartment_values[index, :num_patches], self._attribute_values[index, :num_patches],
+                              self._recorded[index, :num_patches], self._edge_values[index])
+
+    def _snapshot(self, compartment_values, attribute_values, recorded, edge_values):
+        """
+        Convert the values at one time to the form of the network data
+        :param compartment_values: Array of (patch x compartment)
+        :param attribute_values: Array of (patch x attribute)
+        :param recorded: Boolean array of which patches were recorded
+        :param edge_values: Array of (edge x edge attribute)
+        :return:
+        """
+        snapshot = {}
+        for i in numpy.flatnonzero(recorded):
+            data = dict(self._patch_data[i])
+            columns = self._patch_compartment_columns[i]
+            if columns is None:
+                data[Environment.COMPARTMENTS] = dict(zip(self._compartments, compartment_values[i].tolist()))
+            else:
+                data[Environment.COMPARTMENTS] = {self._compartments[c]: compartment_values[i, c].item()
+                                                  for c in columns}
+            data[Environment.ATTRIBUTES] = {self._patch_attributes[c]: attribute_values[i, c].item()
+                                            for c in self._patch_attribute_columns[i]}
+            snapshot[self._patches[i]] = data
+        if self._record_edges:
+            snapshot[ResultRecorder.EDGES] = [[u, v, dict(zip(self._edge_attributes, values))]
+                                              for (u, v), values in zip(self._edges, edge_values.tolist())]
+        return snapshot
+
+    def results(self):
+        """
+        All recorded values, in the form of the network data. If writing to a store, the remaining times are written
+        and the run closed instead.
+        :return: dict of Key: time, Value: dict of Key: patch ID, Value: patch data (or of Key: ResultStore.STORE,
+        Value: directory of the run)
+        """
+        if self._store is not None:
+            if self._num_times:
+                self._flush()
+            self._store.close()
+            return {ResultStore.STORE: self._store.path()}
+        return {self._times[t].item(): self.snapshot(t) for t in range(self._num_times)}
+
+    def checkpoint(self):
+        """
+        Copy of everything recorded so far (if writing to a store, the times in memory and the point the store has
+        reached), to be restored with restore
+        :return:
+        """
+        state = copy.deepcopy({k: v for k, v in self.__dict__.iteritems() if k != '_store'})
+        state[ResultStore.STORE] = self._store.checkpoint() if self._store is not None else None
+        return state
+
+    def restore(self, state, fork=False):
+        """
+        Return to a checkpoint, resuming writing to the store (if any) from the point it had reached
+        :param state: Result of checkpoint
+        :param fork: Whether to write to a new run in the store (a copy of the run up to the checkpoint), leaving the
+        original to be restored again
+        :return:
+        """
+        store = self._store
+        assert (store is None) == (state[ResultStore.STORE] is None), "Checkpoint does not match the store set"
+        self.__dict__.update(copy.deepcopy({k: v for k, v in state.iteritems() if k != ResultStore.STORE}))
+        self._store = store
+        if store is not None:
+            store.resume(state[ResultStore.STORE], fork)
+
+
+class DeltaRecorder(ResultRecorder):
+    """
+    Recorder which stores, at each record time, only the values which have changed since the previous time (as the
+    indices and new values of the changed cells), with a full copy of the values (a keyframe) every KEYFRAME_INTERVAL
+    times. Between record times most patches change in only a few compartments, and inactive patches not at all, so
+    this is far smaller than a full snapshot per time. The values at any time are reconstructed from the keyframe
+    before it and the changes since.
+
+    Values are held in memory only (the recorder cannot write to a ResultStore).
+    """
+
+    KEYFRAME_INTERVAL = 32
+
+    def __init__(self, record_edges=False, chunk_size=ResultRecorder.CHUNK_SIZE, keyframe_interval=KEYFRAME_INTERVAL):
+        """
+        Create a recorder
+        :param record_edges: Whether to record edge attribute values
+        :param chunk_size: Number of patches the arrays initially hold
+        :param keyframe_interval: Number of record times between keyframes
+        """
+        self._keyframe_interval = keyframe_interval
+        ResultRecorder.__init__(self, record_edges, chunk_size)
+
+    def reset(self, network=None):
+        ResultRecorder.reset(self, network)
+        self._frame_times = []
+        # Per record time, either a keyframe (list of arrays) or the changes (list of (indices, values))
+        self._frames = []
+        self._previous = None
+
+    def set_store(self, store):
+        assert store is None, "Delta recorder cannot write to a store"
+
+    def record(self, time, network, patches):
+        # The arrays of the base recorder hold only the current values, which are compared with the previous values
+        self._num_times = 0
+        self._compartment_values[0] = 0
+        self._attribute_values[0] = numpy.nan
+        self._recorded[0] = False
+        ResultRecorder.record(self, time, network, patches)
+        num_patches = len(self._patches)
+        current = [self._compartment_values[0, :num_patches], self._attribute_values[0, :num_patches],
+                   self._recorded[0, :num_patches], self._edge_values[0]]
+
+        if len(self._frame_times) % self._keyframe_interval == 0:
+            self._frames.append([a.copy() for a in current])
+        else:
+            self._frames.append([DeltaRecorder._changes(p, c) for p, c in zip(self._previous, current)])
+        self._frame_times.append(time)
+        self._previous = [a.copy() for a in current]
+
+    @staticmethod
+    def _changes(previous, current):
+        """
+        Cells of the current values which differ from the previous values (which may have fewer patches)
+        :param previous:
+        :param current:
+        :return: (tuple of index arrays, array of changed values)
+        """
+        changed = numpy.ones(current.shape, dtype=numpy.bool)
+        region = tuple(slice(0, n) for n in previous.shape)
+        changed[region] = previous != current[region]
+        if current.dtype.kind == 'f':
+            # NaN (no value) is unchanged if still NaN
+            changed[region] &= ~(numpy.isnan(previous) & numpy.isnan(current[region]))
+        indices = tuple(i.astype(numpy.int32) for i in numpy.nonzero(changed))
+        return indices, current[indices]
+
+    def _frame(self, index):
+        """
+        Reconstruct the values at a record time, from the keyframe before it and the changes since
+        :param index: Index of the record time
+        :return: List of arrays (compartment values, attribute values, recorded, edge values)
+        """
+        keyframe = index - index % self._keyframe_interval
+        state = self._padded(self._frames[keyframe])
+        for f in range(keyframe + 1, index + 1):
+            DeltaRecorder._apply(state, self._frames[f])
+        return state
+
+    def _padded(self, frame):
+        """
+        Copy of the arrays of a keyframe, extended to all patches (edge values are fixed in size)
+        :param frame:
+        :return:
+        """
+        num_patches = len(self._patches)
+        padded = []
+        for array, fill in zip(frame, [0, numpy.nan, False]):
+            extended = numpy.full((num_patches,) + array.shape[1:], fill, dtype=array.dtype)
+            extended[:array.shape[0]] = array
+            padded.append(extended)
+        padded.append(frame[3].copy())
+        return padded
+
+    @staticmethod
+    def _apply(state, changes):
+        for array, (indices, values) in zip(state, changes):
+            array[indices] = values
+
+    def times(self):
+        return numpy.array(self._frame_times, dtype=numpy.float)
+
+    def _all_frames(self):
+        """
+        Values at every record time in turn (each applied to the last, so each array is only valid until the next)
+        :return: Generator of lists of arrays
+        """
+        state = None
+        for index, frame in enumerate(self._frames):
+            if index % self._keyframe_interval == 0:
+                state = self._padded(frame)
+            else:
+                DeltaRecorder._apply(state, frame)
+            yield state
+
+    def _stacked(self, array_index):
+        return numpy.array([frame[array_index].copy() for frame in self._all_frames()])
+
+    def compartment_values(self):
+        if not self._frames:
+            return ResultRecorder.compartment_values(self)
+        return self._stacked(0)
+
+    def attribute_values(self):
+        if not self._frames:
+            return ResultRecorder.attribute_values(self)
+        return self._stacked(1)
+
+    def recorded(self):
+        if not self._frames:
+            return ResultRecorder.recorded(self)
+        return self._stacked(2)
+
+    def edge_values(self):
+        if not self._frames:
+            return ResultRecorder.edge_values(self)
+        return self._stacked(3)
+
+    def nbytes(self):
+        total = 0
+        for index, frame in enumerate(self._frames):
+            if index % self._keyframe_interval == 0:
+                total += sum(a.nbytes for a in frame)
+            else:
+                total += sum(sum(i.nbytes for i in indices) + values.nbytes for indices, values in frame)
+        return total + len(self._frame_times) * numpy.dtype(numpy.float).itemsize
+
+    def snapshot(self, index):
+        return self._snapshot(*self._frame(index))
+
+    def results(self):
+        results = {}
+        for index, frame in enumerate(self._all_frames()):
+            results[self._frame_times[index]] = self._snapshot(*frame)
+        return results
@@ -1,18 +1,58 @@
+import os
 import json
+import numpy
+from resultstore import ResultStore
+from dynamics import Dynamics
+from environment import Environment, TypedEnvironment
+from recorder import ResultRecorder
+
+try:
+    import pandas
+except ImportError:
+    # Long-format results are given as a dict of arrays instead of a DataFrame
+    pandas = None
+
 
-# TODO - repetitions
 class MetapoppyOutput(object):
     def __init__(self, data):
         self.parameters = data['parameters']
-        self.timesteps = [float(k) for k in data['results'].keys()]
+        results = data['results']
+        # Runs with summary statistics hold the snapshots (if recorded) alongside the statistics
+        self.statistics = results.get(Dynamics.STATISTICS, {})
+        if Dynamics.STATISTICS in results:
+            results = results.get(Dynamics.SNAPSHOTS, {})
+        self.timesteps = [float(k) for k in results.keys()]
         self.timesteps.sort()
-        self.data = [data['results'][str(t)] for t in self.timesteps]
+        self.data = [results[str(t)] for t in self.timesteps]
 
     def all_data_by_compartments(self):
         comps = self.data[0].values()[0]['compartments'].keys()
         comps.sort()
         return self.timesteps, {c: self.data_by_compartment(c) for c in comps}
 
+    def _arrays(self):
+        """
+        Values of every compartment at every patch as arrays, as held by ResultRecorder and StoredRun
+        :return: (times, patches, patch types, compartments, array of (time x patch x compartment) values (NaN where
+        not recorded))
+        """
+        patches = sorted(set(p for d in self.data for p in d if p != ResultRecorder.EDGES))
+        patch_index = {p: i for i, p in enumerate(patches)}
+        patch_types = [None] * len(patches)
+        compartments = sorted(set(c for d in self.data for p, v in d.iteritems() if p != ResultRecorder.EDGES
+                                  for c in v[Environment.COMPARTMENTS]))
+        compartment_index = {c: k for k, c in enumerate(compartments)}
+        values = numpy.full((len(self.timesteps), len(patches), len(compartments)), numpy.nan)
+        for j, d in enumerate(self.data):
+            for p, v in d.iteritems():
+                if p == ResultRecorder.EDGES:
+                    continue
+                i = patch_index[p]
+                patch_types[i] = v.get(TypedEnvironment.PATCH_TYPE, patch_types[i])
+                for c, value in v[Environment.COMPARTMENTS].iteritems():
+                    values[j, i, compartment_index[c]] = value
+        return numpy.asarray(self.timesteps, dtype=numpy.float), patches, patch_types, compartments, values
+
     def data_by_compartment(self, compartment):
         nodes = set([item for sublist in [d.keys() for d in self.data] for item in sublist])
         c_data = {k: [] for k in nodes}
@@ -26,7 +66,310 @@ class MetapoppyOutput(object):
         return c_data
 
 
+class StoredRun(object):
+    """
+    Lazy reader of a run written to a ResultStore. Only the index is read when the run is opened. The arrays of each
+    chunk are memory-mapped when first needed, so selecting values only reads the parts of the files required, and a
+    selection within one chunk by a single compartment (or attribute) is a view of the file rather than a copy.
+
+    Values are indexed by time (record index), patch and compartment (or attribute). Patches which became active part
+    way through the run have no values before then (zero for compartments, NaN for attributes, not recorded).
+    """
+
+    def __init__(self, path, parameters=None):
+        """
+        Open a run
+        :param path: Directory of the run in the store
+        :param parameters: Parameters of the run (if known)
+        """
+        self.parameters = parameters
+        self._path = path
+        with open(os.path.join(path, ResultStore.INDEX_FILENAME)) as index_file:
+            self._index = json.load(index_file)
+        # JSON gives tuple patch IDs (and edges) as lists
+        self._patches = [tuple(p) if isinstance(p, list) else p for p in self._index[ResultStore.PATCHES]]
+        self._patch_index = {p: i for i, p in enumerate(self._patches)}
+        self._compartment_index = {c: i for i, c in enumerate(self._index[ResultStore.COMPARTMENTS])}
+        self._attribute_index = {a: i for i, a in enumerate(self._index[ResultStore.PATCH_ATTRIBUTES])}
+        self._chunks = [name for name, _ in self._index[ResultStore.CHUNKS]]
+        self._chunk_starts = numpy.cumsum([0] + [n for _, n in self._index[ResultStore.CHUNKS]]).tolist()
+        self._arrays = {}
+        self._times = None
+
+    def path(self):
+        return self._path
+
+    def is_complete(self):
+        """
+        Whether the run finished (otherwise only the chunks written before it stopped are available)
+        :return:
+        """
+        return self._index[ResultStore.COMPLETE]
+
+    def __len__(self):
+        return self._chunk_starts[-1]
+
+    def patches(self):
+        return self._patches
+
+    def compartments(self):
+        return self._index[ResultStore.COMPARTMENTS]
+
+    def patch_attributes(self):
+        return self._index[ResultStore.PATCH_ATTRIBUTES]
+
+    def edges(self):
+        return [tuple(e) for e in self._index[ResultStore.EDGES]]
+
+    def edge_attributes(self):
+        return self._index[ResultStore.EDGE_ATTRIBUTES]
+
+    def patch_data(self, patch_id):
+        """
+        Data held at the patch which does not change during a run (e.g. its patch type)
+        :param patch_id:
+        :return:
+        """
+        return self._index[ResultStore.PATCH_DATA][self._patch_index[patch_id]]
+
+    def _array(self, chunk, name):
+        """
+        Memory-mapped array of a chunk (opened on first use)
+        :param chunk: Index of chunk
+        :param name: Name of array (ResultStore.TIMES, etc.)
+        :return:
+        """
+        key = (chunk, name)
+        if key not in self._arrays:
+            filename = os.path.join(self._path, ResultStore.ARRAY_FILENAME.format(self._chunks[chunk], name))
+            self._arrays[key] = numpy.load(filename, mmap_mode='r')
+        return self._arrays[key]
+
+    def times(self):
+        if self._times is None:
+            self._times = numpy.concatenate([numpy.zeros(0)] + [self._array(c, ResultStore.TIMES)
+                                                                for c in range(len(self._chunks))])
+        return self._times
+
+    def _select(self, name, column, width, patches, start, stop, fill):
+        """
+        Select values of an array over a range of times, reading only the chunks in the range
+        :param name: Name of array
+        :param column: Index (or list of indices) of the last axis, or None for all
+        :param width: Size of the last axis (None if the array has none)
+        :param patches: Patch IDs, or None for all
+        :param start: First record index
+        :param stop: Record index to stop before (None for the end)
+        :param fill: Value of patches not yet active in a chunk
+        :return: Array of (time x patch [x column])
+        """
+        stop = len(self) if stop is None else stop
+        patch_indices = None if patches is None else [self._patch_index[p] for p in patches]
+        num_patches = len(self._patches) if patch_indices is None else len(patch_indices)
+        pieces = []
+        for c in range(len(self._chunks)):
+            first, last = self._chunk_starts[c], self._chunk_starts[c + 1]
+            if last <= start or first >= stop:
+                continue
+            array = self._array(c, name)[max(start - first, 0):min(stop, last) - first]
+            if column is not None:
+                array = array[..., column]
+            chunk_patches = array.shape[1]
+            if patch_indices is not None and all(i < chunk_patches for i in patch_indices):
+                array = array[:, patch_indices]
+            elif patch_indices is not None or chunk_patches < num_patches:
+                # Some patches were not yet active in this chunk
+                selected = range(num_patches) if patch_indices is None else patch_indices
+                padded = numpy.full((array.shape[0], num_patches) + array.shape[2:], fill, dtype=array.dtype)
+                present = [j for j, i in enumerate(selected) if i < chunk_patches]
+                padded[:, present] = array[:, [selected[j] for j in present]]
+                array = padded
+            pieces.append(array)
+        if not pieces:
+            if width is None or isinstance(column, int):
+                return numpy.zeros((0, num_patches))
+            return numpy.zeros((0, num_patches, width if column is None else len(column)))
+        if len(pieces) == 1:
+            return pieces[0]
+        return numpy.concatenate(pieces)
+
+    def compartment_values(self, compartments=None, patches=None, start=0, stop=None):
+        """
+        Compartment values over a range of record times
+        :param compartments: A compartment (giving an array of time x patch), a list of compartments or None for all
+        (giving an array of time x patch x compartment)
+        :param patches: List of patch IDs, or None for all
+        :param start: First record index
+        :param stop: Record index to stop before (None for the end)
+        :return:
+        """
+        if compartments is None:
+            column = None
+        elif isinstance(compartments, list):
+            column = [self._compartment_index[c] for c in compartments]
+        else:
+            column = self._compartment_index[compartments]
+        return self._select(ResultStore.COMPARTMENT_VALUES, column, len(self.compartments()), patches, start, stop, 0.0)
+
+    def attribute_values(self, attributes=None, patches=None, start=0, stop=None):
+        """
+        Patch attribute values over a range of record times (NaN where not held). Arguments as compartment_values.
+        :return:
+        """
+        if attributes is None:
+            column = None
+        elif isinstance(attributes, list):
+            column = [self._attribute_index[a] for a in attributes]
+        else:
+            column = self._attribute_index[attributes]
+        return self._select(ResultStore.ATTRIBUTE_VALUES, column, len(self.patch_attributes()), patches, start, stop, numpy.nan)
+
+    def recorded(self, patches=None, start=0, stop=None):
+        """
+        Mask of which patches were recorded at each record time
+        :return: Boolean array of (time x patch)
+        """
+        return self._select(ResultStore.RECORDED, None, None, patches, start, stop, False)
+
+    def edge_values(self, start=0, stop=None):
+        """
+        Edge attribute values over a range of record times (if edges were recorded)
+        :return: Array of (time x edge x edge attribute)
+        """
+        stop = len(self) if stop is None else stop
+        pieces = [self._array(c, ResultStore.EDGE_VALUES)[max(start - self._chunk_starts[c], 0):
+                                                          min(stop, self._chunk_starts[c + 1]) - self._chunk_starts[c]]
+                  for c in range(len(self._chunks))
+                  if self._chunk_starts[c + 1] > start and self._chunk_starts[c] < stop]
+        if not pieces:
+            return numpy.zeros((0, len(self.edges()), len(self.edge_attributes())))
+        return pieces[0] if len(pieces) == 1 else numpy.concatenate(pieces)
+
+    def all_data_by_compartments(self):
+        """
+        Values of every compartment at every patch, as given by MetapoppyOutput
+        :return: (times, dict of Key: compartment, Value: dict of Key: patch ID, Value: list of values)
+        """
+        values = self.compartment_values()
+        return self.times().tolist(), {c: {p: values[:, i, j].tolist() for i, p in enumerate(self._patches)}
+                                       for j, c in enumerate(self.compartments())}
+
+
+def _run_output(data, json_filename):
+    """
+    Output of a run from an epyc result - a StoredRun if its results were written to a store
+    :param data: epyc result of the run
+    :param json_filename: File the result was read from (store paths may be relative to its directory)
+    :return:
+    """
+    results = data['results']
+    if ResultStore.STORE in results:
+        path = results[ResultStore.STORE]
+        if not os.path.isabs(path) and not os.path.exists(path):
+            path = os.path.join(os.path.dirname(os.path.abspath(json_filename)), path)
+        return StoredRun(path, data['parameters'])
+    return MetapoppyOutput(data)
+
+
+def _object_array(items):
+    """
+    1-D array of objects (patch IDs may be tuples, which numpy.array would make into a 2-D array)
+    :param items:
+    :return:
+    """
+    array = numpy.empty(len(items), dtype=object)
+    for i, item in enumerate(items):
+        array[i] = item
+    return array
+
+
+def _run_arrays(run, compartments=None):
+    """
+    Values of compartments at every patch of a run
+    :param run: MetapoppyOutput, StoredRun or ResultRecorder (of a finished run)
+    :param compartments: Compartments to include (None for all)
+    :return: (times, patches, patch types, compartments, array of (time x patch x compartment) values (NaN where not
+    recorded))
+    """
+    if isinstance(run, MetapoppyOutput):
+        times, patches, patch_types, run_compartments, values = run._arrays()
+    else:
+        times = numpy.asarray(run.times(), dtype=numpy.float)
+        patches = list(run.patches())
+        patch_types = [run.patch_data(p).get(TypedEnvironment.PATCH_TYPE) for p in patches]
+        run_compartments = list(run.compartments())
+    columns = range(len(run_compartments)) if compartments is None else \
+        [k for k, c in enumerate(run_compartments) if c in compartments]
+    if isinstance(run, StoredRun):
+        # Each chunk is cut down to the selected compartments before the chunks are joined
+        values = run.compartment_values(None if compartments is None else [run_compartments[k] for k in columns])
+    elif isinstance(run, MetapoppyOutput):
+        values = values[:, :, columns]
+    else:
+        values = run.compartment_values()[:, :, columns]
+    # Copy, as values not recorded are set to NaN
+    values = numpy.array(values, dtype=numpy.float)
+    if not isinstance(run, MetapoppyOutput):
+        values[~numpy.asarray(run.recorded())] = numpy.nan
+    return times, patches, patch_types, [run_compartments[k] for k in columns], values
+
+
+def long_format(runs, compartments=None, as_data_frame=None):
+    """
+    Compartment values of many runs in long format - one row for each value of each compartment at each patch at each
+    record time of each run, with the columns of MetapoppyResultSet.LONG_FORMAT_COLUMNS. Patches are only included at
+    the times they were recorded. Rows of each run are selected from its arrays of values in one step (rather than
+    row by row), so this is quick even for many runs.
+    :param runs: List (of parameter samples) of lists (of repetitions) of runs (MetapoppyOutput, StoredRun or
+    ResultRecorder), e.g. MetapoppyResultSet.runs
+    :param compartments: Compartments to include (None for all)
+    :param as_data_frame: Whether to give a pandas DataFrame (requires pandas), or a dict of Key: column, Value: array
+    (None for a DataFrame if pandas is installed)
+    :return:
+    """
+    if as_data_frame is None:
+        as_data_frame = pandas is not None
+    if as_data_frame and pandas is None:
+        raise ImportError("pandas is required for results as a DataFrame")
+
+    # Empty columns of each type, so the columns have their types even with no runs
+    pieces = [{MetapoppyResultSet.SAMPLE: numpy.zeros(0, dtype=numpy.int64),
+               MetapoppyResultSet.REPETITION: numpy.zeros(0, dtype=numpy.int64),
+               MetapoppyResultSet.TIME: numpy.zeros(0),
+               MetapoppyResultSet.PATCH: _object_array([]),
+               MetapoppyResultSet.PATCH_TYPE: _object_array([]),
+               MetapoppyResultSet.COMPARTMENT: _object_array([]),
+               MetapoppyResultSet.VALUE: numpy.zeros(0)}]
+    for sample, repetitions in enumerate(runs):
+        for repetition, run in enumerate(repetitions):
+            times, patches, patch_types, run_compartments, values = _run_arrays(run, compartments)
+            t, p, c = numpy.nonzero(~numpy.isnan(values))
+            pieces.append({MetapoppyResultSet.SAMPLE: numpy.full(len(t), sample, dtype=numpy.int64),
+                           MetapoppyResultSet.REPETITION: numpy.full(len(t), repetition, dtype=numpy.int64),
+                           MetapoppyResultSet.TIME: times[t],
+                           MetapoppyResultSet.PATCH: _object_array(patches)[p],
+                           MetapoppyResultSet.PATCH_TYPE: _object_array(patch_types)[p],
+                           MetapoppyResultSet.COMPARTMENT: _object_array(run_compartments)[c],
+                           MetapoppyResultSet.VALUE: values[t, p, c]})
+
+    columns = {k: numpy.concatenate([piece[k] for piece in pieces]) for k in MetapoppyResultSet.LONG_FORMAT_COLUMNS}
+    if not as_data_frame:
+        return columns
+    return pandas.DataFrame(columns, columns=MetapoppyResultSet.LONG_FORMAT_COLUMNS)
+
+
 class MetapoppyResultSet(object):
+
+    # Columns of the long format
+    SAMPLE = 'sample'
+    REPETITION = 'repetition'
+    TIME = 'time'
+    PATCH = 'patch'
+    PATCH_TYPE = 'patch_type'
+    COMPARTMENT = 'compartment'
+    VALUE = 'value'
+    LONG_FORMAT_COLUMNS = [SAMPLE, REPETITION, TIME, PATCH, PATCH_TYPE, COMPARTMENT, VALUE]
+
     def __init__(self, json_filename):
         with open(json_filename) as data_file:
             json_file = json.load(data_file)
@@ -35,13 +378,29 @@ class MetapoppyResultSet(object):
         self.repetitions = len(data[0])
         print '{0}: {1} parameter variations with {2} repetitions'.format(self.__class__.__name__,
                                                                           self.param_variations, self.repetitions)
-        self.results = []
+        # Every repetition of every parameter sample (runs written to a store are opened lazily)
+        self.runs = [[_run_output(d, json_filename) for d in sample] for sample in data]
+        # First repetition of each sample
+        self.results = [sample[0] for sample in self.runs]
 
-        if self.repetitions > 1:
-            pass
-        else:
-            for d in [n[0] for n in data]:
-                self.results.append(MetapoppyOutput(d))
+    def run(self, sample, repetition=0):
+        """
+        Output of one run
+        :param sample: Index of parameter sample
+        :param repetition: Index of repetition
+        :return: MetapoppyOutput, or StoredRun if the results were written to a store
+        """
+        return self.runs[sample][repetition]
 
     def all_data_by_compartments(self):
-        return [(o.parameters, o.all_data_by_compartments()) for o in self.results]
\ No newline at end of file
+        return [(o.parameters, o.all_data_by_compartments()) for o in self.results]
+
+    def long_format(self, compartments=None, as_data_frame=None):
+        """
+        Compartment values of every run in long format (see long_format)
+        :param compartments: Compartments to include (None for all)
+        :param as_data_frame: Whether to give a pandas DataFrame, or a dict of arrays (None for a DataFrame if pandas is
+        installed)
+        :return:
+        """
+        return long_format(self.runs, compartments, as_data_frame)
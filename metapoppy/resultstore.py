@@ -0,0 +1,210 @@
+import os
+import json
+import copy
+import shutil
+import uuid
+import threading
+import Queue
+import numpy
+
+
+class ResultStore(object):
+    """
+    On-disk store for the results of runs. Each run is written to its own directory as a sequence of fixed-size chunks
+    of recorded times (one NumPy .npy file per array, so they can be memory-mapped when read), plus an index (JSON) of
+    the chunks, the compartments, attributes and edges recorded, and the patches with their static data. Patch IDs must
+    therefore be JSON serialisable. Runs are read with StoredRun (see results).
+
+    Chunks are written by a background thread, so that writing overlaps with the simulation. The queue of chunks
+    waiting to be written is bounded, so the simulation waits if it gets too far ahead of the disk. The index is
+    rewritten after every chunk, so a run which crashes part way through keeps all chunks written up to that point.
+    """
+
+    INDEX_FILENAME = 'index.json'
+    CHUNK_NAME = 'chunk_{0:05d}'
+    ARRAY_FILENAME = '{0}_{1}.npy'
+    RUN_DIRECTORY = 'run_{0}'
+
+    # Keys of the index
+    COMPARTMENTS = 'compartments'
+    PATCH_ATTRIBUTES = 'patch_attributes'
+    EDGE_ATTRIBUTES = 'edge_attributes'
+    EDGES = 'edges'
+    PATCHES = 'patches'
+    PATCH_DATA = 'patch_data'
+    PATCH_COLUMNS = 'patch_columns'
+    CHUNKS = 'chunks'
+    COMPLETE = 'complete'
+
+    # Arrays held in each chunk
+    TIMES = 'times'
+    COMPARTMENT_VALUES = 'compartment_values'
+    ATTRIBUTE_VALUES = 'attribute_values'
+    RECORDED = 'recorded'
+    EDGE_VALUES = 'edge_values'
+
+    # Key of the run directory in the result of a run
+    STORE = 'result_store'
+
+    DEFAULT_QUEUE_SIZE = 4
+
+    def __init__(self, directory, queue_size=DEFAULT_QUEUE_SIZE):
+        """
+        Create a store, writing runs under the given directory
+        :param directory:
+        :param queue_size: Maximum number of chunks waiting to be written
+        """
+        self._directory = directory
+        self._queue_size = queue_size
+        self._path = None
+        self._index = None
+        self._queue = None
+        self._writer = None
+        self._error = None
+
+    def directory(self):
+        return self._directory
+
+    def path(self):
+        """
+        Directory of the current (or latest) run
+        :return:
+        """
+        return self._path
+
+    def open(self, compartments, patch_attributes, edge_attributes, edges):
+        """
+        Start writing a new run, in a new directory
+        :param compartments: Compartments recorded (in the order of the compartment values)
+        :param patch_attributes: Patch attributes recorded
+        :param edge_attributes: Edge attributes recorded
+        :param edges: Edges recorded
+        :return: Directory of the run
+        """
+        if self._writer is not None:
+            self.close()
+        self._path = os.path.join(self._directory, ResultStore.RUN_DIRECTORY.format(uuid.uuid4().hex))
+        os.makedirs(self._path)
+        self._index = {ResultStore.COMPARTMENTS: list(compartments),
+                       ResultStore.PATCH_ATTRIBUTES: list(patch_attributes),
+                       ResultStore.EDGE_ATTRIBUTES: list(edge_attributes),
+                       ResultStore.EDGES: [list(e) for e in edges],
+                       ResultStore.PATCHES: [],
+                       ResultStore.PATCH_DATA: [],
+                       ResultStore.PATCH_COLUMNS: [],
+                       ResultStore.CHUNKS: [],
+                       ResultStore.COMPLETE: False}
+        self._error = None
+        self._write_index()
+        self._start_writer()
+        return self._path
+
+    def _start_writer(self):
+        self._queue = Queue.Queue(self._queue_size)
+        self._writer = threading.Thread(target=self._write_chunks)
+        self._writer.daemon = True
+        self._writer.start()
+
+    def write_chunk(self, arrays, patches, patch_data, patch_columns):
+        """
+        Queue a chunk of recorded times to be written (waits if the queue is full). Arrays must not be changed once
+        queued.
+        :param arrays: dict of Key: array name (TIMES, COMPARTMENT_VALUES, etc.), Value: array
+        :param patches: All patches recorded so far (the columns of the arrays)
+        :param patch_data: Static data of each patch
+        :param patch_columns: Compartment columns (None for all) and attribute columns recorded at each patch
+        :return:
+        """
+        assert self._writer is not None, "Store is not open"
+        self._raise_error()
+        self._queue.put((arrays, list(patches), list(patch_data), list(patch_columns)))
+
+    def close(self):
+        """
+        Wait for all queued chunks to be written and mark the run as complete
+        :return:
+        """
+        if self._writer is None:
+            return
+        self._queue.put(None)
+        self._writer.join()
+        self._writer = None
+        self._raise_error()
+        self._index[ResultStore.COMPLETE] = True
+        self._write_index()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _write_chunks(self):
+        """
+        Body of the writer thread - write chunks as they are queued until given None
+        :return:
+        """
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            if self._error is not None:
+                # Discard chunks after a failure, so the simulation is not left waiting on the queue
+                self._queue.task_done()
+                continue
+            try:
+                arrays, patches, patch_data, patch_columns = item
+                chunk = ResultStore.CHUNK_NAME.format(len(self._index[ResultStore.CHUNKS]))
+                for name, array in arrays.iteritems():
+                    numpy.save(os.path.join(self._path, ResultStore.ARRAY_FILENAME.format(chunk, name)), array)
+                self._index[ResultStore.PATCHES] = patches
+                self._index[ResultStore.PATCH_DATA] = patch_data
+                self._index[ResultStore.PATCH_COLUMNS] = patch_columns
+                self._index[ResultStore.CHUNKS].append([chunk, len(arrays[ResultStore.TIMES])])
+                self._write_index()
+            except Exception as e:
+                self._error = e
+            self._queue.task_done()
+
+    def checkpoint(self):
+        """
+        Wait for all queued chunks to be written, and give the run directory and index, so that writing can be resumed
+        from this point with resume
+        :return:
+        """
+        assert self._writer is not None, "Store is not open"
+        self._queue.join()
+        self._raise_error()
+        return self._path, copy.deepcopy(self._index)
+
+    def resume(self, state, fork=False):
+        """
+        Resume writing a run from a checkpoint. Chunks written after the checkpoint are replaced.
+        :param state: Result of checkpoint
+        :param fork: Whether to copy the chunks written up to the checkpoint to a new run and write to that instead
+        :return:
+        """
+        if self._writer is not None:
+            self.close()
+        self._path, self._index = state[0], copy.deepcopy(state[1])
+        if fork:
+            source = self._path
+            self._path = os.path.join(self._directory, ResultStore.RUN_DIRECTORY.format(uuid.uuid4().hex))
+            os.makedirs(self._path)
+            for chunk, _ in self._index[ResultStore.CHUNKS]:
+                for name in os.listdir(source):
+                    if name.startswith(chunk + '_'):
+                        shutil.copy(os.path.join(source, name), self._path)
+        self._error = None
+        self._write_index()
+        self._start_writer()
+
+    def _write_index(self):
+        """
+        Write the index, replacing the previous one in a single step
+        :return:
+        """
+        filename = os.path.join(self._path, ResultStore.INDEX_FILENAME)
+        with open(filename + '.tmp', 'w') as index_file:
+            json.dump(self._index, index_file)
+        os.rename(filename + '.tmp', filename)
@@ -0,0 +1,190 @@
+import numpy
+
+
+class FenwickSampler(object):
+    """
+    Weighted sampler over a changing set of keys. Weights are held in a Fenwick (binary indexed) tree, so changing the
+    weight of a key and drawing a key with probability proportional to its weight are both O(log n).
+
+    Keys are held in the order they are added. A key cannot be removed, but can have its weight set to zero.
+    """
+
+    # Initial capacity of the tree (doubled whenever it runs out of space)
+    INITIAL_CAPACITY = 16
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """
+        Remove all keys
+        :return:
+        """
+        self._keys = []
+        self._index = {}
+        self._weights = []
+        self._tree = [0.0] * (FenwickSampler.INITIAL_CAPACITY + 1)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def keys(self):
+        return self._keys
+
+    def weight(self, key):
+        return self._weights[self._index[key]]
+
+    def _capacity(self):
+        return len(self._tree) - 1
+
+    def _rebuild(self, capacity):
+        """
+        Rebuild the tree from the weights with the given capacity, in O(capacity)
+        :param capacity:
+        :return:
+        """
+        tree = [0.0] * (capacity + 1)
+        for i, w in enumerate(self._weights):
+            tree[i + 1] = w
+        for i in range(1, capacity + 1):
+            parent = i + (i & -i)
+            if parent <= capacity:
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _add_to(self, position, delta):
+        tree = self._tree
+        capacity = len(tree) - 1
+        i = position + 1
+        while i <= capacity:
+            tree[i] += delta
+            i += i & -i
+
+    def set_weight(self, key, weight):
+        """
+        Set the weight of a key, adding the key if not already present
+        :param key:
+        :param weight: Non-negative weight
+        :return:
+        """
+        assert weight >= 0, "Weight cannot be negative"
+        if key in self._index:
+            position = self._index[key]
+            delta = weight - self._weights[position]
+            if not delta:
+                return
+            self._weights[position] = weight
+        else:
+            position = len(self._keys)
+            self._index[key] = position
+            self._keys.append(key)
+            self._weights.append(weight)
+            if position == self._capacity():
+                # Out of space - double capacity (includes the new weight)
+                self._rebuild(self._capacity() * 2)
+                return
+            delta = weight
+        self._add_to(position, delta)
+
+    def total(self):
+        """
+        Sum of all weights
+        :return:
+        """
+        tree = self._tree
+        total = 0.0
+        i = len(self._keys)
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def sample(self, r=None):
+        """
+        Choose a key with probability proportional to its weight
+        :param r: Value in range [0, total weight) - drawn uniformly if not given
+        :return: Key chosen
+        """
+        if r is None:
+            r = numpy.random.random() * self.total()
+        tree = self._tree
+        capacity = len(tree) - 1
+        position = 0
+        step = 1 << (capacity.bit_length() - 1)
+        # Descend the tree to find the first position whose cumulative weight exceeds r
+        while step:
+            i = position + step
+            if i <= capacity and tree[i] <= r:
+                r -= tree[i]
+                position = i
+            step >>= 1
+        # Guard against rounding taking the position beyond the final key with a non-zero weight
+        if position >= len(self._keys) or not self._weights[position]:
+            position = max(i for i, w in enumerate(self._weights) if w > 0)
+        return self._keys[position]
+
+
+class AliasSampler(object):
+    """
+    Weighted sampler over a fixed set of keys using Walker's alias method. Building the table is O(n), after which a
+    key is drawn with probability proportional to its weight in O(1).
+    """
+
+    def __init__(self, keys, weights):
+        """
+        Build the alias table
+        :param keys: List of keys
+        :param weights: Non-negative weights, one per key (need not be normalised)
+        """
+        assert len(keys) == len(weights), "Must have one weight per key"
+        assert len(keys), "Must have at least one key"
+        self._keys = list(keys)
+        self._index = {k: i for i, k in enumerate(self._keys)}
+        self._weights = numpy.array(weights, dtype=numpy.float)
+        n = len(self._keys)
+        total = numpy.sum(self._weights)
+        assert total > 0, "Weights must not all be zero"
+
+        # Scale so the mean weight is 1, then pair each under-full entry with an over-full one
+        scaled = self._weights * n / total
+        self._probability = numpy.ones(n, dtype=numpy.float)
+        self._alias = numpy.arange(n)
+        small = [i for i in range(n) if scaled[i] < 1.0]
+        large = [i for i in range(n) if scaled[i] >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self._probability[s] = scaled[s]
+            self._alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+        # Any remaining entries are full (up to rounding), unless they have no weight
+        for i in small:
+            if not self._weights[i]:
+                self._probability[i] = 0.0
+                self._alias[i] = numpy.argmax(self._weights)
+        self._probability = self._probability.tolist()
+        self._alias = self._alias.tolist()
+
+    def keys(self):
+        return self._keys
+
+    def weight(self, key):
+        return self._weights[self._index[key]]
+
+    def sample(self):
+        """
+        Choose a key with probability proportional to its weight
+        :return: Key chosen
+        """
+        u = numpy.random.random() * len(self._keys)
+        column = int(u)
+        if u - column < self._probability[column]:
+            return self._keys[column]
+        return self._keys[self._alias[column]]
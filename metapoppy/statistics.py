@@ -0,0 +1,226 @@
+from environment import *
+
+
+class SummaryStatistic(object):
+    """
+    A statistic of a run which is updated as the run progresses, rather than calculated afterwards from recorded
+    results. The dynamics tell the statistic when simulated time moves forward (the network is unchanged over that
+    time) and which patches have changed after each event.
+    """
+
+    def __init__(self, name):
+        self._name = name
+
+    def name(self):
+        return self._name
+
+    def compartment_groups(self):
+        """
+        Compartment groups read by the statistic, to be registered on the network
+        :return: dict of Key: group name, Value: list of compartments
+        """
+        return {}
+
+    def reset(self, time, network, patches):
+        """
+        Start of a run
+        :param time: Start time
+        :param network:
+        :param patches: Active patches
+        :return:
+        """
+        pass
+
+    def advance(self, time, network):
+        """
+        Simulated time has moved forward to the given time, with the network unchanged since the last call
+        :param time:
+        :param network:
+        :return:
+        """
+        pass
+
+    def patch_changed(self, time, network, patch_id, compartments):
+        """
+        Compartments have changed at a patch
+        :param time: Current time
+        :param network:
+        :param patch_id:
+        :param compartments: Compartments changed
+        :return:
+        """
+        pass
+
+    def value(self):
+        raise NotImplementedError
+
+
+class PatchValueStatistic(SummaryStatistic):
+    """
+    Statistic of the value of a compartment (or the total of several compartments) at each patch, optionally only at
+    patches of one type. The value at each patch is held, so subclasses are given the old and new values at a patch
+    whenever it changes.
+    """
+
+    def __init__(self, name, compartments, patch_type=None):
+        SummaryStatistic.__init__(self, name)
+        if isinstance(compartments, basestring):
+            compartments = [compartments]
+        self._compartments = frozenset(compartments)
+        self._groups = {}
+        if len(compartments) == 1:
+            self._key = compartments[0]
+        else:
+            self._key = Environment.compartment_group_name(compartments)
+            self._groups[self._key] = list(compartments)
+        self._patch_type = patch_type
+        self._values = {}
+
+    def compartment_groups(self):
+        return self._groups
+
+    def _applies_to_patch(self, network, patch_id):
+        return self._patch_type is None or \
+            network.node[patch_id].get(TypedEnvironment.PATCH_TYPE) == self._patch_type
+
+    def reset(self, time, network, patches):
+        self._values = {}
+        self._reset(time)
+        for patch_id in network.nodes():
+            if self._applies_to_patch(network, patch_id):
+                self._values[patch_id] = 0
+                self._changed(time, patch_id, 0, network.get_compartment_value(patch_id, self._key))
+
+    def patch_changed(self, time, network, patch_id, compartments):
+        if patch_id in self._values and not self._compartments.isdisjoint(compartments):
+            new = network.get_compartment_value(patch_id, self._key)
+            old = self._values[patch_id]
+            if new != old:
+                self._changed(time, patch_id, old, new)
+
+    def _reset(self, time):
+        """
+        Reset the statistic before the values of the patches are first given
+        :param time:
+        :return:
+        """
+        raise NotImplementedError
+
+    def _changed(self, time, patch_id, old, new):
+        """
+        The value at a patch has changed. Subclasses must call this to hold the new value.
+        :param time:
+        :param patch_id:
+        :param old:
+        :param new:
+        :return:
+        """
+        self._values[patch_id] = new
+
+
+class CompartmentTotal(PatchValueStatistic):
+    """
+    Running total of a compartment (or several compartments) over all patches (of a type)
+    """
+
+    def _reset(self, time):
+        self._total = 0
+
+    def _changed(self, time, patch_id, old, new):
+        PatchValueStatistic._changed(self, time, patch_id, old, new)
+        self._total += new - old
+
+    def value(self):
+        return self._total
+
+
+class PatchCount(PatchValueStatistic):
+    """
+    Number of patches (of a type) at which the compartment(s) exceed a threshold, e.g. the number of infected patches
+    """
+
+    def __init__(self, name, compartments, threshold=0, patch_type=None):
+        PatchValueStatistic.__init__(self, name, compartments, patch_type)
+        self._threshold = threshold
+
+    def _reset(self, time):
+        self._count = 0
+
+    def _changed(self, time, patch_id, old, new):
+        PatchValueStatistic._changed(self, time, patch_id, old, new)
+        self._count += (new > self._threshold) - (old > self._threshold)
+
+    def value(self):
+        return self._count
+
+
+class MaximumPatchValue(PatchValueStatistic):
+    """
+    Maximum value of the compartment(s) reached at any patch (of a type) during the run
+    """
+
+    def _reset(self, time):
+        self._maximum = 0
+
+    def _changed(self, time, patch_id, old, new):
+        PatchValueStatistic._changed(self, time, patch_id, old, new)
+        if new > self._maximum:
+            self._maximum = new
+
+    def value(self):
+        return self._maximum
+
+
+class FirstPassageTime(PatchValueStatistic):
+    """
+    Time at which the compartment(s) first exceed a threshold at any patch (of a type), e.g. the time of the first
+    infection of the lymph node. None if never exceeded.
+    """
+
+    def __init__(self, name, compartments, threshold=0, patch_type=None):
+        PatchValueStatistic.__init__(self, name, compartments, patch_type)
+        self._threshold = threshold
+
+    def _reset(self, time):
+        self._time = None
+
+    def _changed(self, time, patch_id, old, new):
+        PatchValueStatistic._changed(self, time, patch_id, old, new)
+        if self._time is None and new > self._threshold:
+            self._time = time
+
+    def value(self):
+        return self._time
+
+
+class TimeWeightedAverage(SummaryStatistic):
+    """
+    Average over time of the value of another statistic (e.g. a compartment total), weighting each value by the
+    length of time it was held
+    """
+
+    def __init__(self, name, statistic):
+        SummaryStatistic.__init__(self, name)
+        self._statistic = statistic
+
+    def compartment_groups(self):
+        return self._statistic.compartment_groups()
+
+    def reset(self, time, network, patches):
+        self._statistic.reset(time, network, patches)
+        self._start_time = time
+        self._time = time
+        self._integral = 0.0
+
+    def advance(self, time, network):
+        self._statistic.advance(time, network)
+        self._integral += self._statistic.value() * (time - self._time)
+        self._time = time
+
+    def patch_changed(self, time, network, patch_id, compartments):
+        self._statistic.patch_changed(time, network, patch_id, compartments)
+
+    def value(self):
+        if self._time == self._start_time:
+            return self._statistic.value()
+        return self._integral / (self._time - self._start_time)
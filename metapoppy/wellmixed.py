@@ -0,0 +1,338 @@
+import math
+import numpy
+from environment import Environment
+from event import FusedEvent
+from ratetable import RateTable
+
+
+class WellMixedRateTable(RateTable):
+    """
+    Rate table for well-mixed models, with only one or two patches. With so few cells, the overhead of NumPy calls
+    outweighs any benefit from vectorisation, so the state variables and rates are held in flat lists (row after row)
+    and are summed and searched directly. Columns to recalculate for a set of changes are memoised as tuples.
+
+    Choices are identical to those of a RateTable holding the same rates, as the rates are accumulated in the same
+    order.
+    """
+
+    def __init__(self, events, patch_type=None):
+        RateTable.__init__(self, events, patch_type)
+        self._flat_reaction_parameters = [0.0] * self._num_events
+        self._flat_state_variables = []
+        self._flat_rates = []
+
+    def _columns(self, dep_type, keys):
+        cache = self._column_cache[dep_type]
+        cache_key = tuple(keys)
+        try:
+            return cache[cache_key]
+        except KeyError:
+            cols = tuple(RateTable._columns(self, dep_type, keys).tolist())
+            cache[cache_key] = cols
+            return cols
+
+    def patch_columns(self, compartments, patch_attributes):
+        if not patch_attributes:
+            return self._columns(RateTable.COMPARTMENT, compartments)
+        elif not compartments:
+            return self._columns(RateTable.PATCH_ATTRIBUTE, patch_attributes)
+        return tuple(sorted(set(self._columns(RateTable.COMPARTMENT, compartments)) |
+                            set(self._columns(RateTable.PATCH_ATTRIBUTE, patch_attributes))))
+
+    def network_columns(self, patch_id, compartments):
+        cols = self._columns(RateTable.NETWORK_COMPARTMENT, compartments)
+        if patch_id in self._hub_patches:
+            cols = tuple(sorted(set(cols) | set(self._columns(RateTable.HUB_COMPARTMENT,
+                                                              [(patch_id, c) for c in compartments]))))
+        return cols
+
+    def state_variables(self):
+        return numpy.array(self._flat_state_variables, dtype=numpy.float).reshape(len(self._patches),
+                                                                                self._num_events)
+
+    def reaction_parameters(self):
+        return numpy.array(self._flat_reaction_parameters, dtype=numpy.float)
+
+    def rates(self):
+        return numpy.array(self._flat_rates, dtype=numpy.float).reshape(len(self._patches), self._num_events)
+
+    def total(self):
+        return sum(self._flat_rates)
+
+    def set_reaction_parameters(self):
+        self._flat_reaction_parameters = [e.reaction_parameter_value() for e in self._events]
+        n = self._num_events
+        for i in range(len(self._flat_rates)):
+            self._flat_rates[i] = self._flat_state_variables[i] * self._flat_reaction_parameters[i % n]
+
+    def add_patch(self, network, patch_id):
+        row = len(self._patches)
+        self._row_for_patch[patch_id] = row
+        self._patches.append(patch_id)
+        state_variables = [f(network, patch_id) for f in self._state_variable_functions]
+        self._flat_state_variables.extend(state_variables)
+        self._flat_rates.extend(sv * rp for sv, rp in zip(state_variables, self._flat_reaction_parameters))
+        return row
+
+    def add_patches(self, network, patch_ids):
+        for patch_id in patch_ids:
+            self.add_patch(network, patch_id)
+
+    def update_patch(self, network, patch_id, cols):
+        offset = self._row_for_patch[patch_id] * self._num_events
+        state_variables = self._flat_state_variables
+        rates = self._flat_rates
+        reaction_parameters = self._flat_reaction_parameters
+        functions = self._state_variable_functions
+        for col in cols:
+            sv = functions[col](network, patch_id)
+            state_variables[offset + col] = sv
+            rates[offset + col] = sv * reaction_parameters[col]
+
+    def update_all_patches(self, network, cols):
+        for patch_id in self._patches:
+            self.update_patch(network, patch_id, cols)
+
+    def update_parameter(self, network, parameter):
+        if parameter in self._reaction_parameter_columns:
+            for col in self._reaction_parameter_columns[parameter]:
+                self._flat_reaction_parameters[col] = self._events[col].reaction_parameter_value()
+            self.set_reaction_parameters()
+        if parameter in self._state_variable_parameter_columns:
+            self.update_all_patches(network, self._state_variable_parameter_columns[parameter])
+
+    def choose(self, r):
+        cumulative = 0.0
+        index = 0
+        for rate in self._flat_rates:
+            cumulative += rate
+            if cumulative > r:
+                break
+            index += 1
+        else:
+            # Guard against rounding taking the index beyond the final cell with a non-zero rate
+            index = max(i for i, rate in enumerate(self._flat_rates) if rate)
+        return self._patches[index // self._num_events], self._events[index % self._num_events]
+
+    def clear(self):
+        self._patches = []
+        self._row_for_patch = {}
+        self._flat_state_variables = []
+        self._flat_rates = []
+
+    def checkpoint(self):
+        return {RateTable.PATCHES: list(self._patches),
+                RateTable.STATE_VARIABLES: list(self._flat_state_variables),
+                RateTable.RATES: list(self._flat_rates),
+                RateTable.REACTION_PARAMETERS: list(self._flat_reaction_parameters)}
+
+    def restore(self, state):
+        self._patches = list(state[RateTable.PATCHES])
+        self._row_for_patch = {p: i for i, p in enumerate(self._patches)}
+        self._flat_state_variables = list(state[RateTable.STATE_VARIABLES])
+        self._flat_rates = list(state[RateTable.RATES])
+        self._flat_reaction_parameters = list(state[RateTable.REACTION_PARAMETERS])
+
+
+class WellMixedEngine(object):
+    """
+    Direct event loop for well-mixed models whose events are simple: the state variable of every event is a product of
+    compartments at its patch, or constant (see Event._state_variable_signature), performing it only makes fixed
+    changes to the compartments there (see Event._compartment_changes), and it depends on nothing at other patches.
+
+    The compartments of the active patches are held in a flat list (patch after patch). Events are chosen, performed
+    and their rates recalculated directly on it and on the flat lists of the WellMixedRateTable, without the network or
+    its handlers. The loop stops whenever anything else needs the network (to record results or perform a posted
+    event), and the network is brought up to date first.
+
+    Choices and rates are identical to those of the WellMixedRateTable, so a run gives the same results for the same
+    seed.
+    """
+
+    # Reasons for stopping the loop before the end of the run
+    RECORD = 'record'
+    POSTED_EVENT = 'posted_event'
+
+    def __init__(self, rate_table, compartments, plans):
+        """
+        Create the engine (see compile)
+        :param rate_table: WellMixedRateTable
+        :param compartments: List of compartments, in the order held
+        :param plans: Per column, the changes made by its event (pairs of compartment index and change) and the columns
+        to recalculate (pairs of column and the indices of the compartments multiplied to give its state variable, or
+        the index alone if only one) - or for a fused column, a list of the plans of its events
+        """
+        self._rate_table = rate_table
+        self._compartments = compartments
+        self._plans = plans
+        # Choices within fused columns, and the list of reaction parameters of the table they were made for
+        self._fused = None
+        self._fused_reaction_parameters = None
+
+    @staticmethod
+    def compile(rate_table, compartments):
+        """
+        Engine for the events of a rate table, if all are simple
+        :param rate_table: WellMixedRateTable
+        :param compartments: List of compartments of the network
+        :return: WellMixedEngine, or None if any event is not simple
+        """
+        index = {c: k for k, c in enumerate(compartments)}
+        factors = []
+        member_changes = []
+        for event in rate_table.events():
+            members = event.events() if isinstance(event, FusedEvent) else [event]
+            if any(e.get_dependent_neighbour_compartments() or e.get_dependent_hub_compartments() or
+                   e.get_dependent_network_compartments() for e in members):
+                return None
+            signature = members[0].state_variable_signature()
+            if signature == ('constant',):
+                factors.append(())
+            elif signature is not None and len(signature) > 1 and signature[0] == Environment.COMPARTMENTS and \
+                    all(c in index for c in signature[1:]):
+                factors.append(tuple(index[c] for c in signature[1:]))
+            else:
+                return None
+            changes = [e.compartment_changes() for e in members]
+            if any(c is None or not all(k in index for k in c) for c in changes):
+                return None
+            member_changes.append(changes)
+
+        # A single compartment is given by its index alone, as the commonest state variable
+        factors = [f[0] if len(f) == 1 else f for f in factors]
+
+        def plan(changes):
+            # Changes by compartment index, and columns to recalculate with the compartments of their state variables
+            cols = rate_table.patch_columns(changes.keys(), [])
+            return tuple((index[c], change) for c, change in changes.iteritems()), tuple((c, factors[c]) for c in cols)
+
+        plans = []
+        for event, changes in zip(rate_table.events(), member_changes):
+            plans.append([plan(c) for c in changes] if isinstance(event, FusedEvent) else plan(changes[0]))
+        return WellMixedEngine(rate_table, compartments, plans)
+
+    def _fused_choices(self):
+        """
+        Reaction parameters are fixed until the loop stops, so the choice of event within each fused column (as
+        FusedEvent.choose_event) is tabulated: the total, each event's parameter and plan, and the plan of the last event
+        with a non-zero parameter. The table replaces its list of reaction parameters whenever they change, so the
+        choices are kept until it does.
+        :return: dict of Key: column, Value: (total, list of (parameter, plan), last plan)
+        """
+        reaction_parameters = self._rate_table._flat_reaction_parameters
+        if reaction_parameters is not self._fused_reaction_parameters:
+            events = self._rate_table.events()
+            self._fused = {}
+            for col, plan in enumerate(self._plans):
+                if plan.__class__ is list:
+                    members = [(e.reaction_parameter_value(), p) for e, p in zip(events[col].events(), plan)]
+                    non_zero = [p for reaction_parameter, p in members if reaction_parameter > 0]
+                    self._fused[col] = (sum(reaction_parameter for reaction_parameter, _ in members), members,
+                                        non_zero[-1] if non_zero else None)
+            self._fused_reaction_parameters = reaction_parameters
+        return self._fused
+
+    def run(self, network, time, max_time, next_record_time, posted_time, stop_time, firing_counts):
+        """
+        Perform events from the current values of the network until the maximum time (or the stop time, if given), no
+        events can occur, or the loop must stop for a record or posted event. The network is then brought up to date.
+        :param network:
+        :param time: Current time
+        :param max_time:
+        :param next_record_time: Next time to record results
+        :param posted_time: Time of the next posted event (None if none)
+        :param stop_time: Time to stop at (None if none)
+        :param firing_counts: dict of Key: event (column), Value: times fired, updated with the events performed
+        :return: (time, reason for stopping - RECORD, POSTED_EVENT or None at the end of the run)
+        """
+        rate_table = self._rate_table
+        patches = rate_table.patches()
+        compartments = self._compartments
+        num_compartments = len(compartments)
+        values = []
+        for patch_id in patches:
+            values.extend(network.get_compartment_value(patch_id, c) for c in compartments)
+        # The lists of the table are updated in place
+        state_variables = rate_table._flat_state_variables
+        rates = rate_table._flat_rates
+        reaction_parameters = rate_table._flat_reaction_parameters
+        num_events = rate_table._num_events
+        events = rate_table.events()
+        plans = self._plans
+        fused = self._fused_choices()
+        counts = [0] * num_events
+        random = numpy.random.random
+        log = math.log
+        end_time = max_time if stop_time is None else min(max_time, stop_time)
+        if posted_time is None:
+            posted_time = float('inf')
+        if next_record_time > max_time:
+            next_record_time = float('inf')
+
+        reason = None
+        total = sum(rates)
+        while time < end_time:
+            dt = (1.0 / total) * log(1.0 / random())
+            if time + dt > posted_time:
+                reason = WellMixedEngine.POSTED_EVENT
+                break
+
+            # Choose a cell, as WellMixedRateTable.choose
+            r = random() * total
+            if not r < total:
+                r = total
+            cumulative = 0.0
+            index = 0
+            for rate in rates:
+                cumulative += rate
+                if cumulative > r:
+                    break
+                index += 1
+            else:
+                index = max(i for i, rate in enumerate(rates) if rate)
+            if index < num_events:
+                row, col = 0, index
+            else:
+                row, col = divmod(index, num_events)
+            counts[col] += 1
+
+            # Perform the event and recalculate the cells which depend on the compartments changed
+            plan = plans[col]
+            if plan.__class__ is list:
+                fused_total, members, plan = fused[col]
+                r = random() * fused_total
+                for reaction_parameter, member_plan in members:
+                    r -= reaction_parameter
+                    if r < 0:
+                        plan = member_plan
+                        break
+            changes, cols = plan
+            base = row * num_compartments
+            for k, change in changes:
+                values[base + k] += change
+            offset = row * num_events
+            for c, factor in cols:
+                if factor.__class__ is int:
+                    sv = values[base + factor]
+                else:
+                    sv = 1
+                    for k in factor:
+                        sv *= values[base + k]
+                state_variables[offset + c] = sv
+                rates[offset + c] = sv * reaction_parameters[c]
+
+            time += dt
+            if time >= next_record_time:
+                reason = WellMixedEngine.RECORD
+                break
+            total = sum(rates)
+            if total == 0:
+                break
+
+        for row, patch_id in enumerate(patches):
+            base = row * num_compartments
+            network.set_compartment_values(patch_id, dict(zip(compartments, values[base:base + num_compartments])))
+        for col, count in enumerate(counts):
+            if count:
+                firing_counts[events[col]] = firing_counts.get(events[col], 0) + count
+        return time, reason
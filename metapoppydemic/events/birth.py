@@ -1,3 +1,4 @@
+import numpy
 from metapoppy import *
 
 
@@ -15,5 +16,14 @@ class Create(Event):
     def _calculate_state_variable_at_patch(self, network, patch_id):
         return 1
 
+    def _calculate_state_variables(self, network_arrays, patch_indices):
+        return numpy.ones(len(patch_indices), dtype=numpy.float)
+
+    def _state_variable_signature(self):
+        return 'constant',
+
+    def _compartment_changes(self):
+        return {self._comp: 1}
+
     def perform(self, network, patch_id):
         network.update_patch(patch_id, {self._comp: 1})
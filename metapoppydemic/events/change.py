@@ -16,6 +16,15 @@ class Change(Event):
     def _calculate_state_variable_at_patch(self, network, patch_id):
         return network.get_compartment_value(patch_id, self._comp_from)
 
+    def _calculate_state_variables(self, network_arrays, patch_indices):
+        return network_arrays.compartment(self._comp_from)[patch_indices]
+
+    def _state_variable_signature(self):
+        return Environment.COMPARTMENTS, self._comp_from
+
+    def _compartment_changes(self):
+        return {self._comp_from: -1, self._comp_to: 1}
+
     def perform(self, network, patch_id):
         network.update_patch(patch_id, {self._comp_from: -1, self._comp_to: 1})
 
@@ -33,3 +42,10 @@ class Infect(Change):
     def _calculate_state_variable_at_patch(self, network, patch_id):
         return network.get_compartment_value(patch_id, self._comp_from) * \
                network.get_compartment_value(patch_id, self._infectious)
+
+    def _calculate_state_variables(self, network_arrays, patch_indices):
+        return network_arrays.compartment(self._comp_from)[patch_indices] * \
+               network_arrays.compartment(self._infectious)[patch_indices]
+
+    def _state_variable_signature(self):
+        return Environment.COMPARTMENTS, self._comp_from, self._infectious
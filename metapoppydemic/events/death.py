@@ -15,5 +15,14 @@ class Death(Event):
     def _calculate_state_variable_at_patch(self, network, patch_id):
         return network.get_compartment_value(patch_id, self._comp)
 
+    def _calculate_state_variables(self, network_arrays, patch_indices):
+        return network_arrays.compartment(self._comp)[patch_indices]
+
+    def _state_variable_signature(self):
+        return Environment.COMPARTMENTS, self._comp
+
+    def _compartment_changes(self):
+        return {self._comp: -1}
+
     def perform(self, network, patch_id):
         network.update_patch(patch_id, {self._comp: -1})
@@ -10,13 +10,18 @@ class McCormackBirth(Event):
         self._comp = compartment
         self._all_comps = all_comps
         Event.__init__(self, all_comps, [], [])
+        self._population = self._compartment_group(all_comps)
 
     def _define_parameter_keys(self):
         return McCormackBirth.RATE_OF_BIRTH + self._comp, []
 
     def _calculate_state_variable_at_patch(self, network, patch_id):
         b = network.get_attribute_value(patch_id, McCormackEnvironment.BIRTH_RATE)
-        return b * network.get_compartment_value(patch_id, self._all_comps)
+        return b * network.get_compartment_value(patch_id, self._population)
+
+    def _calculate_state_variables(self, network_arrays, patch_indices):
+        b = network_arrays.attribute(McCormackEnvironment.BIRTH_RATE)[patch_indices]
+        return b * network_arrays.compartment(self._population)[patch_indices]
 
     def perform(self, network, patch_id):
         network.update_patch(patch_id, {self._comp: 1})
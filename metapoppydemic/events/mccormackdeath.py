@@ -10,6 +10,7 @@ class McCormackDeath(Event):
         self._comp = compartment
         self._all_comps = all_comps
         Event.__init__(self, all_comps, [], [])
+        self._population = self._compartment_group(all_comps)
 
     def _define_parameter_keys(self):
         return McCormackDeath.RATE_OF_DEATH + self._comp, []
@@ -17,9 +18,15 @@ class McCormackDeath(Event):
     def _calculate_state_variable_at_patch(self, network, patch_id):
         d1 = network.get_attribute_value(patch_id, McCormackEnvironment.BASE_DEATH_RATE)
         d2 = network.get_attribute_value(patch_id, McCormackEnvironment.POPULATION_DEATH_RATE)
-        d = (d1 + (d2 * network.get_compartment_value(patch_id, self._all_comps)))
+        d = (d1 + (d2 * network.get_compartment_value(patch_id, self._population)))
         return network.get_compartment_value(patch_id, self._comp)* d
 
+    def _calculate_state_variables(self, network_arrays, patch_indices):
+        d1 = network_arrays.attribute(McCormackEnvironment.BASE_DEATH_RATE)[patch_indices]
+        d2 = network_arrays.attribute(McCormackEnvironment.POPULATION_DEATH_RATE)[patch_indices]
+        d = (d1 + (d2 * network_arrays.compartment(self._population)[patch_indices]))
+        return network_arrays.compartment(self._comp)[patch_indices] * d
+
     def perform(self, network, patch_id):
         network.update_patch(patch_id, {self._comp: -1})
 
@@ -39,5 +46,9 @@ class McCormackDeathInfection(Event):
         alpha = network.get_attribute_value(patch_id, McCormackEnvironment.INFECTION_DEATH_RATE)
         return alpha * network.get_compartment_value(patch_id, self._comp)
 
+    def _calculate_state_variables(self, network_arrays, patch_indices):
+        alpha = network_arrays.attribute(McCormackEnvironment.INFECTION_DEATH_RATE)[patch_indices]
+        return alpha * network_arrays.compartment(self._comp)[patch_indices]
+
     def perform(self, network, patch_id):
         network.update_patch(patch_id, {self._comp: -1})
@@ -1,4 +1,4 @@
-from metapoppy import Event
+from metapoppy import Event, safe_divide
 from ..environment.mccormackenvironment import *
 
 
@@ -11,15 +11,27 @@ class McCormackInfection(Event):
         self._comp_i = compartment_i
         self._all_comps = all_comps
         Event.__init__(self, all_comps, [], [])
+        self._population = self._compartment_group(all_comps)
 
     def _define_parameter_keys(self):
         return McCormackInfection.RATE_OF_INFECTION + self._comp_s + '_' + self._comp_i, []
 
     def _calculate_state_variable_at_patch(self, network, patch_id):
+        population = network.get_compartment_value(patch_id, self._population)
+        # Empty patches have no susceptibles, so give them zero (as the vectorised form does)
+        if not population:
+            return 0
         lambda_i = network.get_attribute_value(patch_id, McCormackEnvironment.INFECTION_LAMBDA)
-        return (lambda_i / network.get_compartment_value(patch_id, self._all_comps)) * \
+        return (lambda_i / population) * \
                network.get_compartment_value(patch_id, self._comp_s) * \
                network.get_compartment_value(patch_id, self._comp_i)
 
+    def _calculate_state_variables(self, network_arrays, patch_indices):
+        lambda_i = network_arrays.attribute(McCormackEnvironment.INFECTION_LAMBDA)[patch_indices]
+        # Empty patches have no susceptibles, so give them zero
+        return safe_divide(lambda_i, network_arrays.compartment(self._population)[patch_indices]) * \
+               network_arrays.compartment(self._comp_s)[patch_indices] * \
+               network_arrays.compartment(self._comp_i)[patch_indices]
+
     def perform(self, network, patch_id):
         network.update_patch(patch_id, {self._comp_s: -1, self._comp_i:1})
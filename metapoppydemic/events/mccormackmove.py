@@ -1,5 +1,4 @@
 from metapoppy import *
-import numpy
 from ..environment.mccormackenvironment import *
 
 
@@ -15,11 +14,16 @@ class McCormackMove(Event):
 
     def _calculate_state_variable_at_patch(self, network, patch_id):
         k = network.get_attribute_value(patch_id, McCormackEnvironment.CARRYING_CAPACITY)
-        return (1.0/k) * network.get_compartment_value(patch_id, self._mover) * len(network.edges([patch_id]))
+        return (1.0/k) * network.get_compartment_value(patch_id, self._mover) * network.patch_degree(patch_id)
+
+    def _calculate_state_variables(self, network_arrays, patch_indices):
+        k = network_arrays.attribute(McCormackEnvironment.CARRYING_CAPACITY)[patch_indices]
+        return (1.0/k) * network_arrays.compartment(self._mover)[patch_indices] * network_arrays.degree()[patch_indices]
 
     def perform(self, network, patch_id):
-        # Moves along an edge at random
-        edges = [v for _,v,_ in network.edges([patch_id], data=True)]
-        chosen_neighbour = numpy.random.choice(edges)
+        # Moves along an edge, chosen by the mobility kernel of the network
+        chosen_neighbour = network.choose_neighbour(patch_id)
+        if chosen_neighbour is None:
+            return
         network.update_patch(patch_id, {self._mover: -1})
         network.update_patch(chosen_neighbour, {self._mover: 1})
@@ -18,5 +18,9 @@ class McCormackRecover(Event):
         alpha = network.get_attribute_value(patch_id, McCormackEnvironment.RECOVERY_RATE)
         return alpha * network.get_compartment_value(patch_id, self._comp_from)
 
+    def _calculate_state_variables(self, network_arrays, patch_indices):
+        alpha = network_arrays.attribute(McCormackEnvironment.RECOVERY_RATE)[patch_indices]
+        return alpha * network_arrays.compartment(self._comp_from)[patch_indices]
+
     def perform(self, network, patch_id):
         network.update_patch(patch_id, {self._comp_from: -1, self._comp_to: 1})
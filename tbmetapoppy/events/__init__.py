@@ -5,5 +5,6 @@ from cell_ingestion import *
 from cell_recruitment import *
 from cell_activation import *
 from parameters import *
+from hill import *
 from translocation import *
 from caseum_liquify import *
\ No newline at end of file
@@ -1,6 +1,8 @@
+import numpy
 from ..tbpulmonaryenvironment import TBPulmonaryEnvironment
 from metapoppy.event import PatchTypeEvent
 from parameters import RATE, SIGMOID, HALF_SAT
+from hill import hill_kernel, PatchAttributeHill
 
 
 class BacteriumChangeStateThroughOxygen(PatchTypeEvent):
@@ -16,6 +18,8 @@ class BacteriumChangeStateThroughOxygen(PatchTypeEvent):
             self._compartment_to = TBPulmonaryEnvironment.BACTERIUM_EXTRACELLULAR_REPLICATING
         self._sigmoid_key = None
         self._half_sat_key = None
+        # Oxygen tension only changes when the network is reset, so the sigmoid at each patch is cached
+        self._oxygen_hill = PatchAttributeHill(TBPulmonaryEnvironment.OXYGEN_TENSION)
         PatchTypeEvent.__init__(self, TBPulmonaryEnvironment.ALVEOLAR_PATCH, [self._compartment_from],
                                 [TBPulmonaryEnvironment.OXYGEN_TENSION], [])
 
@@ -28,17 +32,27 @@ class BacteriumChangeStateThroughOxygen(PatchTypeEvent):
         bac = network.get_compartment_value(patch_id, self._compartment_from)
         if not bac:
             return 0
-        half_sat = self._parameters[self._half_sat_key]
-
-        o2 = network.get_attribute_value(patch_id, TBPulmonaryEnvironment.OXYGEN_TENSION)
-
         # Use negative sigmoid for change to dormant
         if self._compartment_from == TBPulmonaryEnvironment.BACTERIUM_EXTRACELLULAR_REPLICATING:
-            sig = -1 * self._parameters[self._sigmoid_key]
+            kernel = hill_kernel(-1 * self._parameters[self._sigmoid_key])
         else:
-            sig = self._parameters[self._sigmoid_key]
+            kernel = hill_kernel(self._parameters[self._sigmoid_key])
+
+        return bac * self._oxygen_hill.saturation(network, patch_id, kernel,
+                                                  kernel.power(self._parameters[self._half_sat_key]))
 
-        return bac * ((o2 ** sig) / (half_sat ** sig + o2 ** sig))
+    def _calculate_state_variables(self, network_arrays, patch_indices):
+        bac = network_arrays.compartment(self._compartment_from)[patch_indices]
+        o2 = network_arrays.attribute(TBPulmonaryEnvironment.OXYGEN_TENSION)[patch_indices]
+        if self._compartment_from == TBPulmonaryEnvironment.BACTERIUM_EXTRACELLULAR_REPLICATING:
+            kernel = hill_kernel(-1 * self._parameters[self._sigmoid_key])
+        else:
+            kernel = hill_kernel(self._parameters[self._sigmoid_key])
+        state_variables = numpy.zeros(len(bac), dtype=numpy.float)
+        present = bac > 0
+        state_variables[present] = bac[present] * kernel.saturation_array(
+            o2[present], kernel.power(self._parameters[self._half_sat_key]))
+        return state_variables
 
     def perform(self, network, patch_id):
         network.update_patch(patch_id, {self._compartment_from: -1, self._compartment_to: 1})
@@ -16,6 +16,10 @@ class CaseumLiquefy(Event):
         return network.get_compartment_value(patch_id, TBPulmonaryEnvironment.SOLID_CASEUM) * \
                network.get_compartment_value(patch_id, TBPulmonaryEnvironment.MACROPHAGE_ACTIVATED)
 
+    def _calculate_state_variables(self, network_arrays, patch_indices):
+        return network_arrays.compartment(TBPulmonaryEnvironment.SOLID_CASEUM)[patch_indices] * \
+               network_arrays.compartment(TBPulmonaryEnvironment.MACROPHAGE_ACTIVATED)[patch_indices]
+
     def perform(self, network, patch_id):
         network.update_patch(patch_id, {TBPulmonaryEnvironment.SOLID_CASEUM:-1,
                                         TBPulmonaryEnvironment.LIQUEFIED_CASEUM:1})
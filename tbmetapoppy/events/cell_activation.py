@@ -1,5 +1,6 @@
 from ..tbpulmonaryenvironment import TBPulmonaryEnvironment
 from metapoppy.event import Event
+from metapoppy.networkarrays import safe_divide
 from parameters import RATE, HALF_SAT
 
 
@@ -12,6 +13,7 @@ class CellActivation(Event):
         self._activated_cell = TBPulmonaryEnvironment.ACTIVATED_CELL[self._resting_cell]
         self._triggers = triggers
         Event.__init__(self, [self._resting_cell] + self._triggers, [], [])
+        self._trigger_group = self._compartment_group(self._triggers)
 
     def _define_parameter_keys(self):
         rp_key = self._resting_cell + CellActivation.ACTIVATION_BY + '_'.join(self._triggers) + RATE
@@ -19,11 +21,16 @@ class CellActivation(Event):
         return rp_key, [self._half_sat_key]
 
     def _calculate_state_variable_at_patch(self, network, patch_id):
-        trigger_count = network.get_compartment_value(patch_id, self._triggers)
+        trigger_count = network.get_compartment_value(patch_id, self._trigger_group)
         if not trigger_count:
             return 0
         return network.get_compartment_value(patch_id, self._resting_cell) * \
             (float(trigger_count) / (trigger_count + self._parameters[self._half_sat_key]))
 
+    def _calculate_state_variables(self, network_arrays, patch_indices):
+        trigger_count = network_arrays.compartment(self._trigger_group)[patch_indices]
+        return network_arrays.compartment(self._resting_cell)[patch_indices] * \
+            safe_divide(trigger_count, trigger_count + self._parameters[self._half_sat_key])
+
     def perform(self, network, patch_id):
         network.update_patch(patch_id, {self._resting_cell: -1, self._activated_cell: 1})
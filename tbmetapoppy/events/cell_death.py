@@ -1,6 +1,9 @@
+import numpy
 from metapoppy.event import Event
+from metapoppy.networkarrays import safe_divide
 from ..tbpulmonaryenvironment import *
 from parameters import RATE, HALF_SAT, INTRACELLULAR_REPLICATION_SIGMOID, MACROPHAGE_CAPACITY
+from hill import hill_kernel
 
 
 class CellDeath(Event):
@@ -18,6 +21,12 @@ class CellDeath(Event):
     def _calculate_state_variable_at_patch(self, network, patch_id):
         return network.get_compartment_value(patch_id, self._dying_compartment)
 
+    def _calculate_state_variables(self, network_arrays, patch_indices):
+        return network_arrays.compartment(self._dying_compartment)[patch_indices]
+
+    def _state_variable_signature(self):
+        return TBPulmonaryEnvironment.COMPARTMENTS, self._dying_compartment
+
     def perform(self, network, patch_id):
         changes = {self._dying_compartment: -1}
         network.update_patch(patch_id, changes)
@@ -67,9 +76,19 @@ class MacrophageBursting(InfectedCellDeath):
         if not bac:
             return 0
         mac = network.get_compartment_value(patch_id, self._dying_compartment)
-        sig = self._parameters[INTRACELLULAR_REPLICATION_SIGMOID]
-        cap = self._parameters[MACROPHAGE_CAPACITY]
-        return mac * ((float(bac) ** sig) / (bac ** sig + ((cap * mac) ** sig)))
+        kernel = hill_kernel(self._parameters[INTRACELLULAR_REPLICATION_SIGMOID])
+        # (cap * mac)^s = cap^s * mac^s
+        return mac * kernel.saturation(bac, kernel.power(self._parameters[MACROPHAGE_CAPACITY]) * kernel.power(mac))
+
+    def _calculate_state_variables(self, network_arrays, patch_indices):
+        bac = network_arrays.compartment(TBPulmonaryEnvironment.BACTERIUM_INTRACELLULAR_MACROPHAGE)[patch_indices]
+        mac = network_arrays.compartment(self._dying_compartment)[patch_indices]
+        kernel = hill_kernel(self._parameters[INTRACELLULAR_REPLICATION_SIGMOID])
+        state_variables = numpy.zeros(len(bac), dtype=numpy.float)
+        present = bac > 0
+        state_variables[present] = mac[present] * kernel.saturation_array(
+            bac[present], kernel.power(self._parameters[MACROPHAGE_CAPACITY]) * kernel.power_array(mac[present]))
+        return state_variables
 
 
 class TCellDestroysMacrophage(InfectedCellDeath):
@@ -93,3 +112,8 @@ class TCellDestroysMacrophage(InfectedCellDeath):
             return 0
         mac = network.get_compartment_value(patch_id, self._dying_compartment)
         return mac * (float(t_cell) / (t_cell + self._parameters[self._half_sat_key]))
+
+    def _calculate_state_variables(self, network_arrays, patch_indices):
+        t_cell = network_arrays.compartment(TBPulmonaryEnvironment.T_CELL_ACTIVATED)[patch_indices]
+        mac = network_arrays.compartment(self._dying_compartment)[patch_indices]
+        return mac * safe_divide(t_cell, t_cell + self._parameters[self._half_sat_key])
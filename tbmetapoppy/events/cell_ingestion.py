@@ -1,5 +1,6 @@
 from ..tbpulmonaryenvironment import *
 from metapoppy.event import Event
+from metapoppy.networkarrays import safe_divide
 import numpy
 from parameters import HALF_SAT, RATE
 
@@ -19,6 +20,7 @@ class CellIngestBacterium(Event):
         self._half_sat_key = None
         Event.__init__(self, [self._cell_type, TBPulmonaryEnvironment.BACTERIUM_EXTRACELLULAR_DORMANT,
                               TBPulmonaryEnvironment.BACTERIUM_EXTRACELLULAR_REPLICATING], [], [])
+        self._extracellular_bacteria = self._compartment_group(TBPulmonaryEnvironment.EXTRACELLULAR_BACTERIA)
 
     def _define_parameter_keys(self):
         rp_key = self._cell_type + CellIngestBacterium.INGEST_BACTERIUM + RATE
@@ -27,13 +29,17 @@ class CellIngestBacterium(Event):
         return rp_key, [self._half_sat_key, self._infection_prob_key]
 
     def _calculate_state_variable_at_patch(self, network, patch_id):
-        total_bac = network.get_compartment_value(patch_id, [TBPulmonaryEnvironment.BACTERIUM_EXTRACELLULAR_REPLICATING,
-                                                             TBPulmonaryEnvironment.BACTERIUM_EXTRACELLULAR_DORMANT])
+        total_bac = network.get_compartment_value(patch_id, self._extracellular_bacteria)
         if not total_bac:
             return 0
         return network.get_compartment_value(patch_id, self._cell_type) * \
            (float(total_bac) / (total_bac + self._parameters[self._half_sat_key]))
 
+    def _calculate_state_variables(self, network_arrays, patch_indices):
+        total_bac = network_arrays.compartment(self._extracellular_bacteria)[patch_indices]
+        return network_arrays.compartment(self._cell_type)[patch_indices] * \
+            safe_divide(total_bac, total_bac + self._parameters[self._half_sat_key])
+
     def perform(self, network, patch_id):
         replicating = network.get_compartment_value(patch_id,
                                                     TBPulmonaryEnvironment.BACTERIUM_EXTRACELLULAR_REPLICATING)
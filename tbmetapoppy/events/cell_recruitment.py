@@ -1,5 +1,7 @@
 from tbmetapoppy.tbpulmonaryenvironment import TBPulmonaryEnvironment
+import numpy
 from metapoppy.event import PatchTypeEvent
+from metapoppy.networkarrays import safe_divide
 from parameters import RATE, HALF_SAT
 
 
@@ -36,6 +38,12 @@ class StandardCellRecruitmentLung(CellRecruitment):
     def _calculate_state_variable_at_patch(self, network, patch_id):
         return network.get_attribute_value(patch_id, TBPulmonaryEnvironment.PERFUSION)
 
+    def _calculate_state_variables(self, network_arrays, patch_indices):
+        return network_arrays.attribute(TBPulmonaryEnvironment.PERFUSION)[patch_indices]
+
+    def _state_variable_signature(self):
+        return TBPulmonaryEnvironment.ATTRIBUTES, TBPulmonaryEnvironment.PERFUSION
+
 
 class EnhancedCellRecruitmentLung(CellRecruitment):
     def __init__(self, cell_recruited):
@@ -61,6 +69,13 @@ class EnhancedCellRecruitmentLung(CellRecruitment):
         return network.get_attribute_value(patch_id, TBPulmonaryEnvironment.PERFUSION) * \
                (float(ma_and_mi) / (ma_and_mi + self._parameters[self._half_sat_key]))
 
+    def _calculate_state_variables(self, network_arrays, patch_indices):
+        mi = network_arrays.compartment(TBPulmonaryEnvironment.MACROPHAGE_INFECTED)[patch_indices]
+        ma = network_arrays.compartment(TBPulmonaryEnvironment.MACROPHAGE_ACTIVATED)[patch_indices]
+        ma_and_mi = ma + self._parameters[self._weight_key] * mi
+        return network_arrays.attribute(TBPulmonaryEnvironment.PERFUSION)[patch_indices] * \
+               safe_divide(ma_and_mi, ma_and_mi + self._parameters[self._half_sat_key])
+
 
 class StandardCellRecruitmentLymph(CellRecruitment):
     def __init__(self, cell_type):
@@ -73,6 +88,12 @@ class StandardCellRecruitmentLymph(CellRecruitment):
     def _calculate_state_variable_at_patch(self, network, patch_id):
         return 1
 
+    def _calculate_state_variables(self, network_arrays, patch_indices):
+        return numpy.ones(len(patch_indices), dtype=numpy.float)
+
+    def _state_variable_signature(self):
+        return 'constant',
+
 
 class EnhancedCellRecruitmentLymph(CellRecruitment):
     def __init__(self, cell_type):
@@ -97,6 +118,12 @@ class EnhancedCellRecruitmentLymph(CellRecruitment):
         ma_and_mi = ma + self._parameters[self._weight_key] * mi
         return float(ma_and_mi) / (ma_and_mi + self._parameters[self._half_sat_key])
 
+    def _calculate_state_variables(self, network_arrays, patch_indices):
+        mi = network_arrays.compartment(TBPulmonaryEnvironment.MACROPHAGE_INFECTED)[patch_indices]
+        ma = network_arrays.compartment(TBPulmonaryEnvironment.MACROPHAGE_ACTIVATED)[patch_indices]
+        ma_and_mi = ma + self._parameters[self._weight_key] * mi
+        return safe_divide(ma_and_mi, ma_and_mi + self._parameters[self._half_sat_key])
+
 
 class EnhancedTCellRecruitmentLymph(CellRecruitment):
     def __init__(self):
@@ -115,3 +142,7 @@ class EnhancedTCellRecruitmentLymph(CellRecruitment):
         if not dcm:
             return 0
         return float(dcm) / (dcm + self._parameters[self._half_sat_key])
+
+    def _calculate_state_variables(self, network_arrays, patch_indices):
+        dcm = network_arrays.compartment(TBPulmonaryEnvironment.DENDRITIC_CELL_MATURE)[patch_indices]
+        return safe_divide(dcm, dcm + self._parameters[self._half_sat_key])
@@ -0,0 +1,137 @@
+import numpy
+
+
+class HillKernel(object):
+    """
+    Hill (sigmoid) function x^s / (x^s + k^s) for a fixed sigmoid s.
+
+    Powers of the small non-negative integers (i.e. counts of cells or bacteria) are held in a lookup table, built once
+    for the sigmoid, so the function at a count requires no exponentiation. Powers of any other values (e.g. half
+    saturation parameters) are memoised in a bounded cache, so a constant k^s is only calculated once per parameter
+    set.
+    """
+
+    # Integers below this have their power held in the lookup table
+    TABLE_SIZE = 4096
+    # Maximum number of non-table powers memoised (the memo is emptied when full)
+    MEMO_SIZE = 1024
+
+    def __init__(self, sigmoid, table_size=TABLE_SIZE):
+        self._sigmoid = sigmoid
+        self._table_size = table_size
+        with numpy.errstate(divide='ignore'):
+            self._table_array = numpy.arange(table_size, dtype=numpy.float) ** sigmoid
+        self._table = self._table_array.tolist()
+        self._memo = {}
+
+    def sigmoid(self):
+        return self._sigmoid
+
+    def power(self, x):
+        """
+        x raised to the sigmoid
+        :param x: Non-negative value
+        :return:
+        """
+        if x.__class__ is int:
+            if 0 <= x < self._table_size:
+                return self._table[x]
+        elif 0 <= x < self._table_size and x == int(x):
+            # Integral floats and numpy integers (e.g. counts read from arrays) are also counts
+            return self._table[int(x)]
+        try:
+            return self._memo[x]
+        except KeyError:
+            if len(self._memo) >= HillKernel.MEMO_SIZE:
+                self._memo = {}
+            p = float(x) ** self._sigmoid
+            self._memo[x] = p
+            return p
+
+    def saturation(self, x, k_power):
+        """
+        Hill function at x, given the power of the half saturation point (i.e. from power(k))
+        :param x: Non-negative value, which must be positive if the sigmoid is negative
+        :param k_power: k^s
+        :return: x^s / (x^s + k^s)
+        """
+        x_power = self.power(x)
+        return x_power / (x_power + k_power)
+
+    def power_array(self, x):
+        """
+        Vectorised form of power
+        :param x: Array of non-negative values
+        :return: Array of powers
+        """
+        x = numpy.asarray(x)
+        if x.dtype.kind in 'iuf' and x.size and 0 <= x.min() and x.max() < self._table_size:
+            # Counts are held as floats (e.g. by NetworkArrays), so integral floats are looked up too
+            indices = x.astype(numpy.intp)
+            if x.dtype.kind != 'f' or (indices == x).all():
+                return self._table_array[indices]
+        return x.astype(numpy.float) ** self._sigmoid
+
+    def saturation_array(self, x, k_power):
+        """
+        Vectorised form of saturation. Entries where both x^s and k^s are zero are given zero.
+        :param x: Array of non-negative values
+        :param k_power: Array of k^s (or a single value)
+        :return: Array of x^s / (x^s + k^s)
+        """
+        x_power = self.power_array(x)
+        denominator = x_power + k_power
+        result = numpy.zeros(denominator.shape, dtype=numpy.float)
+        numpy.divide(x_power, denominator, out=result, where=denominator > 0)
+        return result
+
+
+_kernels = {}
+
+
+def hill_kernel(sigmoid):
+    """
+    The Hill kernel for the sigmoid, shared between all events using the same value (built on first use)
+    :param sigmoid:
+    :return: HillKernel
+    """
+    try:
+        return _kernels[sigmoid]
+    except KeyError:
+        if len(_kernels) >= HillKernel.MEMO_SIZE:
+            _kernels.clear()
+        kernel = HillKernel(sigmoid)
+        _kernels[sigmoid] = kernel
+        return kernel
+
+
+class PatchAttributeHill(object):
+    """
+    Per-patch cache of a Hill function of a patch attribute which rarely changes (e.g. oxygen tension). The value at a
+    patch is only recalculated if the attribute, sigmoid or half saturation point has changed since it was last
+    calculated there.
+    """
+
+    def __init__(self, attribute):
+        self._attribute = attribute
+        self._cache = {}
+
+    def saturation(self, network, patch_id, kernel, k_power):
+        """
+        Hill function of the attribute at the patch
+        :param network:
+        :param patch_id:
+        :param kernel: HillKernel
+        :param k_power: k^s
+        :return:
+        """
+        x = network.get_attribute_value(patch_id, self._attribute)
+        cached = self._cache.get(patch_id)
+        if cached is not None and cached[0] == x and cached[1] is kernel and cached[2] == k_power:
+            return cached[3]
+        value = kernel.saturation(x, k_power)
+        self._cache[patch_id] = (x, kernel, k_power, value)
+        return value
+
+    def clear(self):
+        self._cache = {}
@@ -1,6 +1,8 @@
+import numpy
 from metapoppy.event import *
 from ..tbpulmonaryenvironment import *
 from parameters import *
+from hill import hill_kernel
 
 
 class Replication(Event):
@@ -17,6 +19,12 @@ class Replication(Event):
     def _calculate_state_variable_at_patch(self, network, patch_id):
         return network.get_compartment_value(patch_id, self._cell_type)
 
+    def _calculate_state_variables(self, network_arrays, patch_indices):
+        return network_arrays.compartment(self._cell_type)[patch_indices]
+
+    def _state_variable_signature(self):
+        return TBPulmonaryEnvironment.COMPARTMENTS, self._cell_type
+
     def perform(self, network, patch_id):
         network.update_patch(patch_id, {self._cell_type: 1})
 
@@ -37,7 +45,18 @@ class IntracellularBacterialReplication(Replication):
         # Return 0 if no bacteria exist
         if not bac:
             return 0
-        sig = self._parameters[INTRACELLULAR_REPLICATION_SIGMOID]
-        cap = self._parameters[MACROPHAGE_CAPACITY]
+        kernel = hill_kernel(self._parameters[INTRACELLULAR_REPLICATION_SIGMOID])
         mac = network.get_compartment_value(patch_id, TBPulmonaryEnvironment.MACROPHAGE_INFECTED)
-        return bac * (1 - (float(bac ** sig) / (bac ** sig + (cap * mac) ** sig)))
+        # (cap * mac)^s = cap^s * mac^s
+        return bac * (1 - kernel.saturation(bac, kernel.power(self._parameters[MACROPHAGE_CAPACITY]) *
+                                            kernel.power(mac)))
+
+    def _calculate_state_variables(self, network_arrays, patch_indices):
+        bac = network_arrays.compartment(TBPulmonaryEnvironment.BACTERIUM_INTRACELLULAR_MACROPHAGE)[patch_indices]
+        mac = network_arrays.compartment(TBPulmonaryEnvironment.MACROPHAGE_INFECTED)[patch_indices]
+        kernel = hill_kernel(self._parameters[INTRACELLULAR_REPLICATION_SIGMOID])
+        state_variables = numpy.zeros(len(bac), dtype=numpy.float)
+        present = bac > 0
+        state_variables[present] = bac[present] * (1 - kernel.saturation_array(
+            bac[present], kernel.power(self._parameters[MACROPHAGE_CAPACITY]) * kernel.power_array(mac[present])))
+        return state_variables
@@ -1,7 +1,9 @@
 from tbmetapoppy.tbpulmonaryenvironment import TBPulmonaryEnvironment
+import numpy
 from metapoppy.event import PatchTypeEvent
+from metapoppy.networkarrays import safe_divide
 from parameters import RATE, SIGMOID, HALF_SAT
-import numpy
+from hill import hill_kernel
 
 
 class TranslocationLungToLymph(PatchTypeEvent):
@@ -26,6 +28,13 @@ class TranslocationLungToLymph(PatchTypeEvent):
         return network.get_compartment_value(patch_id, self._cell_type) * \
                network.get_attribute_value(patch_id, TBPulmonaryEnvironment.DRAINAGE)
 
+    def _calculate_state_variables(self, network_arrays, patch_indices):
+        return network_arrays.compartment(self._cell_type)[patch_indices] * \
+               network_arrays.attribute(TBPulmonaryEnvironment.DRAINAGE)[patch_indices]
+
+    def _state_variable_signature(self):
+        return TBPulmonaryEnvironment.COMPARTMENTS, self._cell_type, TBPulmonaryEnvironment.DRAINAGE
+
     def perform(self, network, patch_id):
         neighbour = TBPulmonaryEnvironment.LYMPH_PATCH
         changes_from = {self._cell_type: -1}
@@ -47,6 +56,7 @@ class TranslocationLymphToLungCytokine(PatchTypeEvent):
         self._cell_type = cell_type
         dep_comps = [cell_type, TBPulmonaryEnvironment.MACROPHAGE_INFECTED]
 
+        # Depends on the total cytokine on the edges to the lung, so on any change to the edges' cytokine
         PatchTypeEvent.__init__(self, TBPulmonaryEnvironment.LYMPH_PATCH, dep_comps,
                                 [], [TBPulmonaryEnvironment.CYTOKINE])
 
@@ -60,32 +70,24 @@ class TranslocationLymphToLungCytokine(PatchTypeEvent):
         cells = network.get_compartment_value(patch_id, self._cell_type)
         if not cells:
             return 0
-        infected_patches = network.infected_patches()
-        cytokine_count_lung = sum([network.get_edge_data(patch_id, n)[TBPulmonaryEnvironment.CYTOKINE] for n in
-                                   infected_patches])
+        cytokine_count_lung = network.lymph_cytokine()
         cytokine_count_lymph = network.get_compartment_value(patch_id, TBPulmonaryEnvironment.MACROPHAGE_INFECTED)
         # Catch to avoid / 0 errors
         if not cytokine_count_lymph and not cytokine_count_lung:
             return 0
-        return cells * (float(cytokine_count_lung) ** self._parameters[self._sigmoid_key] /
-                        (cytokine_count_lung ** self._parameters[self._sigmoid_key] +
-                         cytokine_count_lymph ** self._parameters[self._sigmoid_key]))
-
-    def perform(self, network, patch_id):
-        infected_patches = network.infected_patches()
+        kernel = hill_kernel(self._parameters[self._sigmoid_key])
+        return cells * kernel.saturation(cytokine_count_lung, kernel.power(cytokine_count_lymph))
 
-        edges = {n: network[patch_id][n][TBPulmonaryEnvironment.PERFUSION] for n in infected_patches}
-        neighbours = []
-        vals = []
-        total = 0
-        for k, v in edges.iteritems():
-            neighbours.append(k)
-            val = network.get_compartment_value(k, TBPulmonaryEnvironment.MACROPHAGE_INFECTED) * v
-            vals.append(val)
-            total += val
+    def _calculate_state_variables(self, network_arrays, patch_indices):
+        cells = network_arrays.compartment(self._cell_type)[patch_indices]
+        cytokine_count_lymph = network_arrays.compartment(TBPulmonaryEnvironment.MACROPHAGE_INFECTED)[patch_indices]
+        kernel = hill_kernel(self._parameters[self._sigmoid_key])
+        lung_power = kernel.power(network_arrays.network().lymph_cytokine())
+        return cells * safe_divide(lung_power, lung_power + kernel.power_array(cytokine_count_lymph))
 
-        # Choose a neighbour based on the values
-        neighbour = neighbours[numpy.random.choice(range(len(neighbours)), p=numpy.array(vals) / total)]
+    def perform(self, network, patch_id):
+        # Choose an infected patch, weighted by infected macrophages x perfusion
+        neighbour = network.t_cell_destinations().sample()
 
         network.update_patch(patch_id, {self._cell_type: -1})
         network.update_patch(neighbour, {self._cell_type: 1})
@@ -117,27 +119,26 @@ class TranslocationLymphToLungDendritic(PatchTypeEvent):
         # Catch to avoid / 0 errors
         if not dm:
             return 0
-        sig = self._parameters[self._sigmoid_key]
-        return cells * (float(dm)**sig / (dm**sig + self._parameters[self._half_sat_key]**sig))
+        kernel = hill_kernel(self._parameters[self._sigmoid_key])
+        return cells * kernel.saturation(dm, kernel.power(self._parameters[self._half_sat_key]))
+
+    def _calculate_state_variables(self, network_arrays, patch_indices):
+        cells = network_arrays.compartment(self._cell_type)[patch_indices]
+        dm = network_arrays.compartment(TBPulmonaryEnvironment.DENDRITIC_CELL_MATURE)[patch_indices]
+        kernel = hill_kernel(self._parameters[self._sigmoid_key])
+        state_variables = numpy.zeros(len(cells), dtype=numpy.float)
+        present = dm > 0
+        state_variables[present] = cells[present] * kernel.saturation_array(
+            dm[present], kernel.power(self._parameters[self._half_sat_key]))
+        return state_variables
 
     def perform(self, network, patch_id):
-        infected_patches = network.infected_patches()
-
-        edges = {n: network[patch_id][n][TBPulmonaryEnvironment.PERFUSION] for n in infected_patches}
-        neighbours = []
-        vals = []
-        total = 0
-        for k, v in edges.iteritems():
-            neighbours.append(k)
-            val = network.get_compartment_value(k, TBPulmonaryEnvironment.MACROPHAGE_INFECTED) * v
-            vals.append(val)
-            total += val
-
-        if total == 0:
+        destinations = network.t_cell_destinations()
+        if not destinations.total():
             return
 
-        # Choose a neighbour based on the values
-        neighbour = neighbours[numpy.random.choice(range(len(neighbours)), p=numpy.array(vals) / total)]
+        # Choose an infected patch, weighted by infected macrophages x perfusion
+        neighbour = destinations.sample()
 
         network.update_patch(patch_id, {self._cell_type: -1})
         network.update_patch(neighbour, {self._cell_type: 1})
@@ -167,14 +168,16 @@ class TranslocationLymphToLungBlood(PatchTypeEvent):
         cas = network.get_compartment_value(patch_id, TBPulmonaryEnvironment.SOLID_CASEUM)
         return cells * (1 - (float(cas) / (cas + self._parameters[self._half_sat_key])))
 
+    def _calculate_state_variables(self, network_arrays, patch_indices):
+        cells = network_arrays.compartment(self._cell_type)[patch_indices]
+        cas = network_arrays.compartment(TBPulmonaryEnvironment.SOLID_CASEUM)[patch_indices]
+        return cells * (1 - safe_divide(cas, cas + self._parameters[self._half_sat_key]))
+
     def perform(self, network, patch_id):
-        # TODO - this works on the basis of sum of all perfusion == 1, needs amending if perfusion changes
-        r = numpy.random.random()
-        edges = network[patch_id]
-        total = 0
-        for k, v in edges.iteritems():
-            total += v[TBPulmonaryEnvironment.PERFUSION]
-            if total >= r:
-                network.update_patch(patch_id, {self._cell_type: -1})
-                network.update_patch(k, {self._cell_type: 1})
-                return
+        # Choose a lung patch, weighted by the perfusion of its edge to the lymph patch
+        perfusion = network.perfusion_sampler()
+        if perfusion is None:
+            return
+        neighbour = perfusion.sample()
+        network.update_patch(patch_id, {self._cell_type: -1})
+        network.update_patch(neighbour, {self._cell_type: 1})
@@ -1,4 +1,5 @@
 from tbmodel import *
 from tbmodelAge import *
 from tbmodelHIV import *
-from tbmodelEnzymes import *
\ No newline at end of file
+from tbmodelEnzymes import *
+from tbmodel_reducedoutput import *
\ No newline at end of file
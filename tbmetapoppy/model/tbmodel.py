@@ -1,4 +1,5 @@
 from metapoppy.dynamics import Dynamics
+from metapoppy.activation import PatchTypeActivation, CompartmentActivation
 from tbmetapoppy.events import *
 
 
@@ -128,7 +129,7 @@ class TBDynamics(Dynamics):
         events.append(ta_rep)
 
         # T-cell translocation
-        # TODO - currently two options, needs a decision
+        # TODO - currently two options, needs a decision (either is removed when configured if its rate is zero)
         ta_translocation_cyt = TranslocationLymphToLungCytokine(TBPulmonaryEnvironment.T_CELL_ACTIVATED)
         events.append(ta_translocation_cyt)
 
@@ -154,17 +155,9 @@ class TBDynamics(Dynamics):
         patch_seeding = self._network.calculate_pulmonary_attribute_values(params)
 
         # Bacteria
-        # Ventilation based - assumes sum of ventilation values = 1.0
-        initial_bac_patch = None
-
+        # Ventilation based
         if params[TBDynamics.IC_BAC_LOCATION] == TBDynamics.RANDOM:
-            r = numpy.random.random()
-            count = 0
-            for p in self._network.get_patches_by_type(TBPulmonaryEnvironment.ALVEOLAR_PATCH):
-                count += patch_seeding[p][TypedEnvironment.ATTRIBUTES][TBPulmonaryEnvironment.VENTILATION]
-                if count >= r:
-                    initial_bac_patch = p
-                    break
+            initial_bac_patch = self._network.ventilation_sampler().sample()
         else:
             initial_bac_patch = params[TBDynamics.IC_BAC_LOCATION]
 
@@ -175,15 +168,13 @@ class TBDynamics(Dynamics):
 
         return patch_seeding
 
-    def _patch_is_active(self, patch_id):
+    def _create_activation_rules(self):
         """
-        Determine if the given patch is active (from the network). Alveolar patches only become active when they contain
-        bacteria.
-        :param patch_id:
+        The lymph patch is always active. Alveolar patches only become active when they contain bacteria.
         :return:
         """
-        return patch_id == TBPulmonaryEnvironment.LYMPH_PATCH or \
-                sum([self._network.get_compartment_value(patch_id, n) for n in TBPulmonaryEnvironment.BACTERIA]) > 0
+        return [PatchTypeActivation(TBPulmonaryEnvironment.LYMPH_PATCH),
+                CompartmentActivation(TBPulmonaryEnvironment.BACTERIA)]
 
     def _seed_activated_patch(self, patch_id, params):
         """
@@ -230,13 +221,16 @@ class TBDynamics(Dynamics):
     def _end_simulation(self, t):
         if self._total_bac_cutoff == -1:
             return False
+        # No patch can exceed the bacteria threshold if the whole network does not
+        elif self._network.get_group_total(TBPulmonaryEnvironment.TOTAL_BACTERIA) < self._total_bac_cutoff:
+            return False
         else:
             # End simulation if any lung patch of the lymph patch exceeds the bacteria threshold
             return any([i for i in self._network.infected_patches() if
-                        self._network.get_compartment_value(i, TBPulmonaryEnvironment.BACTERIA) >=
+                        self._network.get_compartment_value(i, TBPulmonaryEnvironment.TOTAL_BACTERIA) >=
                         self._total_bac_cutoff]) or \
                     self._network.get_compartment_value(TBPulmonaryEnvironment.LYMPH_PATCH,
-                                                        TBPulmonaryEnvironment.BACTERIA) >= \
+                                                        TBPulmonaryEnvironment.TOTAL_BACTERIA) >= \
                     self._total_bac_cutoff
 
     # def setUp(self, params):
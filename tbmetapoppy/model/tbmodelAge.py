@@ -10,35 +10,60 @@ class TBDynamicsWithImmuneDrop(TBDynamics):
     def __init__(self, network_config):
         TBDynamics.__init__(self, network_config)
 
+    def _scheduled_parameters(self):
+        return [self._lung_recruit_keys[TBPulmonaryEnvironment.MACROPHAGE_RESTING],
+                self._lymph_recruit_keys[TBPulmonaryEnvironment.MACROPHAGE_RESTING],
+                self._lung_recruit_keys[TBPulmonaryEnvironment.DENDRITIC_CELL_IMMATURE],
+                self._lymph_recruit_keys[TBPulmonaryEnvironment.T_CELL_NAIVE]]
+
     def setUp(self, params):
         TBDynamics.setUp(self, params)
 
         # Post event rate drops
-        drop_percent = params[TBDynamicsWithImmuneDrop.RECRUITMENT_DROP_PERCENTAGE]
-
-        current_mr_lung_rate = self._parameters[self._lung_recruit_keys[TBPulmonaryEnvironment.MACROPHAGE_RESTING]]
-        current_mr_lymph_rate = self._parameters[self._lymph_recruit_keys[TBPulmonaryEnvironment.MACROPHAGE_RESTING]]
-        current_di_rate = self._parameters[self._lung_recruit_keys[TBPulmonaryEnvironment.DENDRITIC_CELL_IMMATURE]]
-        current_tn_rate = self._parameters[self._lymph_recruit_keys[TBPulmonaryEnvironment.T_CELL_NAIVE]]
+        self._post_recruitment_drops(params, [self._parameters[p] for p in self._scheduled_parameters()],
+                                     self._start_time)
 
-        def drop_rec_rate(rates):
-            mr_lung_rate, mr_lymph_rate, di_rate, tn_rate = rates
+    def _set_up_fork(self, params, time):
+        """
+        Replace the drops in recruitment posted for the burn-in with drops at the fork's interval and percentage,
+        continuing from the current rates
+        :param params:
+        :param time:
+        :return:
+        """
+        self._remove_posted_events('_drop_recruitment_rates')
+        current = self._parameter_values()
+        self._post_recruitment_drops(params, [current[p] for p in self._scheduled_parameters()], time)
 
-            self.update_parameter(self._lung_recruit_keys[TBPulmonaryEnvironment.MACROPHAGE_RESTING],
-                                  mr_lung_rate)
-            self.update_parameter(self._lymph_recruit_keys[TBPulmonaryEnvironment.MACROPHAGE_RESTING],
-                                  mr_lymph_rate)
-            self.update_parameter(self._lung_recruit_keys[TBPulmonaryEnvironment.DENDRITIC_CELL_IMMATURE],
-                                  di_rate)
-            self.update_parameter(self._lymph_recruit_keys[TBPulmonaryEnvironment.T_CELL_NAIVE],
-                                  tn_rate)
+    def _post_recruitment_drops(self, params, rates, after_time):
+        """
+        Post the drops in recruitment due after the given time
+        :param params:
+        :param rates: Current recruitment rates (as _scheduled_parameters)
+        :param after_time:
+        :return:
+        """
+        drop_percent = params[TBDynamicsWithImmuneDrop.RECRUITMENT_DROP_PERCENTAGE]
+        current_mr_lung_rate, current_mr_lymph_rate, current_di_rate, current_tn_rate = rates
 
         drop_interval = params[TBDynamicsWithImmuneDrop.RECRUITMENT_DROP_INTERVAL]
         times = [self._start_time + (n * drop_interval) for n in range(1, int(self._max_time/drop_interval)+1)]
-        for t in times:
+        for t in [t for t in times if t > after_time]:
             current_mr_lung_rate = current_mr_lung_rate * (1-drop_percent)
             current_mr_lymph_rate = current_mr_lymph_rate * (1-drop_percent)
             current_di_rate = current_di_rate * (1-drop_percent)
             current_tn_rate = current_tn_rate * (1-drop_percent)
-            self.post_event(t, lambda a: drop_rec_rate(a),
+            self.post_event(t, '_drop_recruitment_rates',
                             [current_mr_lung_rate, current_mr_lymph_rate, current_di_rate, current_tn_rate])
+
+    def _drop_recruitment_rates(self, rates):
+        mr_lung_rate, mr_lymph_rate, di_rate, tn_rate = rates
+
+        self.update_parameter(self._lung_recruit_keys[TBPulmonaryEnvironment.MACROPHAGE_RESTING],
+                              mr_lung_rate)
+        self.update_parameter(self._lymph_recruit_keys[TBPulmonaryEnvironment.MACROPHAGE_RESTING],
+                              mr_lymph_rate)
+        self.update_parameter(self._lung_recruit_keys[TBPulmonaryEnvironment.DENDRITIC_CELL_IMMATURE],
+                              di_rate)
+        self.update_parameter(self._lymph_recruit_keys[TBPulmonaryEnvironment.T_CELL_NAIVE],
+                              tn_rate)
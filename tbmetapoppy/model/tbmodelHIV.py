@@ -9,6 +9,9 @@ class TBDynamicsWithHIV(TBDynamics):
     def __init__(self, network_config):
         TBDynamics.__init__(self, network_config)
 
+    def _scheduled_parameters(self):
+        return [self._lymph_recruit_keys[TBPulmonaryEnvironment.T_CELL_NAIVE]]
+
     def setUp(self, params):
         TBDynamics.setUp(self, params)
 
@@ -22,8 +25,25 @@ class TBDynamicsWithHIV(TBDynamics):
         initial_tn_rate = self._parameters[self._lymph_recruit_keys[TBPulmonaryEnvironment.T_CELL_NAIVE]]
         new_tn_rate = initial_tn_rate * (1-hiv_drop)
 
-        def update_rate(rates):
-            self.update_parameter(self._lymph_recruit_keys[TBPulmonaryEnvironment.T_CELL_NAIVE], rates[0])
+        self.post_event(self._start_time, '_update_naive_t_cell_recruitment', [initial_tn_rate])
+        self.post_event(hiv_initial_time, '_drop_naive_t_cell_recruitment', [new_tn_rate])
+
+    def _set_up_fork(self, params, time):
+        """
+        Replace the drop in recruitment posted for the burn-in with that of the fork's parameters
+        :param params:
+        :param time:
+        :return:
+        """
+        assert params[TBDynamicsWithHIV.HIV_INITIAL_TIME] >= time, "HIV must start after the burn-in"
+        assert 0 <= params[TBDynamicsWithHIV.HIV_DROP] <= 1.0, "HIV drop must be % (0-1)"
+        self._remove_posted_events('_drop_naive_t_cell_recruitment')
+        initial_tn_rate = params[self._lymph_recruit_keys[TBPulmonaryEnvironment.T_CELL_NAIVE]]
+        self.post_event(params[TBDynamicsWithHIV.HIV_INITIAL_TIME], '_drop_naive_t_cell_recruitment',
+                        [initial_tn_rate * (1 - params[TBDynamicsWithHIV.HIV_DROP])])
+
+    def _update_naive_t_cell_recruitment(self, rates):
+        self.update_parameter(self._lymph_recruit_keys[TBPulmonaryEnvironment.T_CELL_NAIVE], rates[0])
 
-        self.post_event(self._start_time, lambda a: update_rate(a), [initial_tn_rate])
-        self.post_event(hiv_initial_time, lambda a: update_rate(a), [new_tn_rate])
+    def _drop_naive_t_cell_recruitment(self, rates):
+        self._update_naive_t_cell_recruitment(rates)
@@ -1,7 +1,34 @@
 from tbmodel import *
+from metapoppy.projection import OutputProjection
 
 
 class TBDynamicsReducedOutput(TBDynamics):
+    """
+    TB dynamics recording only totals: the total bacteria and the total caseum at each alveolar patch, plus the totals
+    of bacteria, macrophages, dendritic cells and T cells at the lymph patch. The caseum total is the sum of
+    TBPulmonaryEnvironment.CASEUM, which currently holds only solid caseum.
+    """
+
+    # The standard name of a group of one compartment is that of the compartment, so the caseum total is named
+    TOTAL_CASEUM = 'total_caseum'
+    TOTAL_MACROPHAGES = TypedEnvironment.compartment_group_name(TBPulmonaryEnvironment.MACROPHAGES)
+    TOTAL_DENDRITIC_CELLS = TypedEnvironment.compartment_group_name(TBPulmonaryEnvironment.DENDRITIC_CELLS)
+    TOTAL_T_CELLS = TypedEnvironment.compartment_group_name(TBPulmonaryEnvironment.T_CELLS)
 
     def __init__(self, network_config):
         TBDynamics.__init__(self, network_config)
+
+    def _create_output_projection(self):
+        projection = OutputProjection()
+        projection.select(TBPulmonaryEnvironment.LYMPH_PATCH, compartments=[],
+                          compartment_groups={
+                              TBPulmonaryEnvironment.TOTAL_BACTERIA: TBPulmonaryEnvironment.BACTERIA,
+                              TBDynamicsReducedOutput.TOTAL_MACROPHAGES: TBPulmonaryEnvironment.MACROPHAGES,
+                              TBDynamicsReducedOutput.TOTAL_DENDRITIC_CELLS: TBPulmonaryEnvironment.DENDRITIC_CELLS,
+                              TBDynamicsReducedOutput.TOTAL_T_CELLS: TBPulmonaryEnvironment.T_CELLS},
+                          patch_attributes=[])
+        projection.select(TBPulmonaryEnvironment.ALVEOLAR_PATCH, compartments=[],
+                          compartment_groups={TBPulmonaryEnvironment.TOTAL_BACTERIA: TBPulmonaryEnvironment.BACTERIA,
+                                              TBDynamicsReducedOutput.TOTAL_CASEUM: TBPulmonaryEnvironment.CASEUM},
+                          patch_attributes=[])
+        return projection
@@ -1,6 +1,8 @@
 from metapoppy.environment import TypedEnvironment
+from metapoppy.sampling import FenwickSampler, AliasSampler
 import numpy
 import ConfigParser
+import copy
 
 
 class TBPulmonaryEnvironment(TypedEnvironment):
@@ -57,6 +59,18 @@ class TBPulmonaryEnvironment(TypedEnvironment):
 
     TB_COMPARTMENTS = BACTERIA + MACROPHAGES + DENDRITIC_CELLS + T_CELLS + CASEUM
 
+    _BACTERIA_SET = frozenset(BACTERIA)
+
+    # Compartment groups - sums maintained at every patch
+    TOTAL_BACTERIA = TypedEnvironment.compartment_group_name(BACTERIA)
+    TOTAL_EXTRACELLULAR_BACTERIA = TypedEnvironment.compartment_group_name(EXTRACELLULAR_BACTERIA)
+    TOTAL_INTRACELLULAR_BACTERIA = TypedEnvironment.compartment_group_name(INTRACELLULAR_BACTERIA)
+    COMPARTMENT_GROUPS = {TOTAL_BACTERIA: BACTERIA, TOTAL_EXTRACELLULAR_BACTERIA: EXTRACELLULAR_BACTERIA,
+                          TOTAL_INTRACELLULAR_BACTERIA: INTRACELLULAR_BACTERIA}
+
+    # Key of the pulmonary values in a checkpoint of the network
+    PULMONARY_STATE = 'pulmonary_state'
+
     ACTIVATED_CELL = {MACROPHAGE_RESTING: MACROPHAGE_ACTIVATED, T_CELL_NAIVE: T_CELL_ACTIVATED}
     INFECTED_CELL = {MACROPHAGE_RESTING: MACROPHAGE_INFECTED, DENDRITIC_CELL_IMMATURE: DENDRITIC_CELL_MATURE}
     INTERNAL_BACTERIA_FOR_CELL = {MACROPHAGE_INFECTED: BACTERIUM_INTRACELLULAR_MACROPHAGE,
@@ -83,7 +97,23 @@ class TBPulmonaryEnvironment(TypedEnvironment):
             y_min = min(ys)
             self._y_range = self._y_max - y_min
 
+        # Infected patches, in order of infection, and their positions in the list
         self._infected_patches = []
+        self._infected_patch_index = {}
+        # Total cytokine over all edges to the lymph patch
+        self._lymph_cytokine = 0
+        # Destinations for T-cells leaving the lymph patch - infected patches weighted by infected macrophages x
+        # perfusion
+        self._t_cell_destinations = FenwickSampler()
+        # Alias tables for sampling lung patches by ventilation and by perfusion (of their edges to the lymph patch).
+        # Built when pulmonary attributes are calculated. The perfusion table is rebuilt before sampling if any edge
+        # perfusion no longer matches it.
+        self._ventilation_sampler = None
+        self._perfusion_sampler = None
+        self._perfusion_mismatches = set()
+
+        for group, compartments in TBPulmonaryEnvironment.COMPARTMENT_GROUPS.iteritems():
+            self.add_compartment_group(group, compartments)
 
     def output_positions(self, filename):
         """
@@ -117,11 +147,94 @@ class TBPulmonaryEnvironment(TypedEnvironment):
 
     def infected_patches(self):
         """
-        Get all infected patches
+        Get all infected patches (in order of infection)
         :return:
         """
         return self._infected_patches
 
+    def is_infected(self, patch_id):
+        """
+        Determine if the patch has been infected
+        :param patch_id:
+        :return:
+        """
+        return patch_id in self._infected_patch_index
+
+    def lymph_cytokine(self):
+        """
+        Total cytokine on the edges between the lung patches and the lymph patch
+        :return:
+        """
+        return self._lymph_cytokine
+
+    def t_cell_destinations(self):
+        """
+        Sampler of the infected patches T-cells travel to from the lymph patch, weighted by the number of infected
+        macrophages at the patch multiplied by the perfusion of its edge to the lymph patch.
+        :return:
+        """
+        return self._t_cell_destinations
+
+    def ventilation_sampler(self):
+        """
+        Sampler of lung patches weighted by ventilation (available once pulmonary attributes are calculated)
+        :return:
+        """
+        return self._ventilation_sampler
+
+    def perfusion_sampler(self):
+        """
+        Sampler of lung patches weighted by the perfusion of their edge to the lymph patch. Rebuilt if perfusion has
+        changed since it was built.
+        :return: Sampler, or None if there is no perfusion
+        """
+        if self._perfusion_sampler is None or self._perfusion_mismatches:
+            if TBPulmonaryEnvironment.LYMPH_PATCH not in self._adj:
+                return None
+            lymph_edges = self._adj[TBPulmonaryEnvironment.LYMPH_PATCH]
+            self._build_perfusion_sampler({n: e[TBPulmonaryEnvironment.PERFUSION] for n, e in lymph_edges.iteritems()})
+        return self._perfusion_sampler
+
+    def _build_perfusion_sampler(self, perfusion):
+        """
+        Build the alias table of lung patches by perfusion
+        :param perfusion: dict of Key: lung patch, Value: perfusion
+        :return:
+        """
+        self._perfusion_mismatches = set()
+        if sum(perfusion.values()) > 0:
+            self._perfusion_sampler = AliasSampler(perfusion.keys(), perfusion.values())
+        else:
+            self._perfusion_sampler = None
+
+    def _check_perfusion(self, patch_id):
+        """
+        Record whether the perfusion of the edge from a lung patch to the lymph patch matches the perfusion table
+        :param patch_id:
+        :return:
+        """
+        if self._perfusion_sampler is None:
+            return
+        if self._adj[patch_id][TBPulmonaryEnvironment.LYMPH_PATCH][TBPulmonaryEnvironment.PERFUSION] == \
+                self._perfusion_sampler.weight(patch_id):
+            self._perfusion_mismatches.discard(patch_id)
+        else:
+            self._perfusion_mismatches.add(patch_id)
+
+    def _update_t_cell_destination(self, patch_id):
+        """
+        Recalculate the weight of an infected patch as a T-cell destination (patches not connected to the lymph patch
+        cannot be destinations)
+        :param patch_id:
+        :return:
+        """
+        lymph_edge = self._adj[patch_id].get(TBPulmonaryEnvironment.LYMPH_PATCH)
+        if lymph_edge is None:
+            return
+        self._t_cell_destinations.set_weight(
+            patch_id, self._node[patch_id][TypedEnvironment.COMPARTMENTS][TBPulmonaryEnvironment.MACROPHAGE_INFECTED] *
+            lymph_edge[TBPulmonaryEnvironment.PERFUSION])
+
     def _build_single_patch_network(self):
         """
         Build a topology where the lung is a single patch
@@ -265,6 +378,7 @@ class TBPulmonaryEnvironment(TypedEnvironment):
                                                                 TBPulmonaryEnvironment.OXYGEN_TENSION: o2,
                                                                 TBPulmonaryEnvironment.DRAINAGE: drain}}}
             self._pulmonary_att_seeding = seeding
+            self._build_attribute_samplers()
             return seeding
 
         ventilation_skew = params[TBPulmonaryEnvironment.VENTILATION_SKEW]
@@ -315,23 +429,36 @@ class TBPulmonaryEnvironment(TypedEnvironment):
                  TBPulmonaryEnvironment.PERFUSION: q,
                  TBPulmonaryEnvironment.OXYGEN_TENSION: o2,
                  TBPulmonaryEnvironment.DRAINAGE: values[TBPulmonaryEnvironment.DRAINAGE]}
+        self._build_attribute_samplers()
         return self._pulmonary_att_seeding
 
+    def _build_attribute_samplers(self):
+        """
+        Build the ventilation and perfusion alias tables from the pulmonary attribute seeding
+        :return:
+        """
+        seeding = {p: s[TypedEnvironment.ATTRIBUTES] for p, s in self._pulmonary_att_seeding.iteritems()}
+        self._ventilation_sampler = AliasSampler(seeding.keys(),
+                                                 [s[TBPulmonaryEnvironment.VENTILATION] for s in seeding.values()])
+        self._build_perfusion_sampler({p: s[TBPulmonaryEnvironment.PERFUSION] for p, s in seeding.iteritems()
+                                       if self.has_edge(p, TBPulmonaryEnvironment.LYMPH_PATCH)})
+
     def update_patch(self, patch_id, compartment_changes=None, attribute_changes=None):
         """
         Update a patch on the network. Also adds patch to list of infected patches, and updates the edge if the
-        perfusion value of a lung patch has been amended
+        perfusion value of a lung patch has been amended. Edges are updated before the patch, so that the edges are
+        current when the patch update is propagated to the lymph patch.
         :param patch_id: ID of patch
         :param compartment_changes: compartments changed
         :param attribute_changes: attributes changed
         :return:
         """
-        if (patch_id not in self._infected_patches and
-           self._node[patch_id][TypedEnvironment.PATCH_TYPE] == TBPulmonaryEnvironment.ALVEOLAR_PATCH and
-           compartment_changes and any(x in TBPulmonaryEnvironment.BACTERIA for x in compartment_changes)):
-            # TODO - awkward way of doing this
+        new_infection = (compartment_changes and patch_id not in self._infected_patch_index and
+                         self._node[patch_id][TypedEnvironment.PATCH_TYPE] == TBPulmonaryEnvironment.ALVEOLAR_PATCH and
+                         not TBPulmonaryEnvironment._BACTERIA_SET.isdisjoint(compartment_changes))
+        if new_infection:
+            self._infected_patch_index[patch_id] = len(self._infected_patches)
             self._infected_patches.append(patch_id)
-        TypedEnvironment.update_patch(self, patch_id, compartment_changes, attribute_changes)
         if self._node[patch_id][TypedEnvironment.PATCH_TYPE] == TBPulmonaryEnvironment.ALVEOLAR_PATCH:
             if compartment_changes and TBPulmonaryEnvironment.MACROPHAGE_INFECTED in compartment_changes:
                 self.update_edge(patch_id, TBPulmonaryEnvironment.LYMPH_PATCH,
@@ -339,11 +466,74 @@ class TBPulmonaryEnvironment(TypedEnvironment):
             if attribute_changes and TBPulmonaryEnvironment.PERFUSION in attribute_changes:
                 val = attribute_changes[TBPulmonaryEnvironment.PERFUSION]
                 self.update_edge(patch_id, TBPulmonaryEnvironment.LYMPH_PATCH, {TBPulmonaryEnvironment.PERFUSION: val})
+        TypedEnvironment.update_patch(self, patch_id, compartment_changes, attribute_changes)
+        # Keep the weight of an infected patch as a T-cell destination current
+        if patch_id in self._infected_patch_index and \
+                (new_infection or
+                 (compartment_changes and TBPulmonaryEnvironment.MACROPHAGE_INFECTED in compartment_changes) or
+                 (attribute_changes and TBPulmonaryEnvironment.PERFUSION in attribute_changes)):
+            self._update_t_cell_destination(patch_id)
+
+    def update_edge(self, u, v, attribute_changes):
+        """
+        Update an edge on the network. Also maintains the total cytokine on the edges to the lymph patch and the
+        weights of T-cell destinations.
+        :param u: Patch 1
+        :param v: Patch 2
+        :param attribute_changes: attributes changed
+        :return:
+        """
+        if TBPulmonaryEnvironment.CYTOKINE in attribute_changes and \
+                TBPulmonaryEnvironment.LYMPH_PATCH in (u, v):
+            self._lymph_cytokine += attribute_changes[TBPulmonaryEnvironment.CYTOKINE]
+        TypedEnvironment.update_edge(self, u, v, attribute_changes)
+        if TBPulmonaryEnvironment.PERFUSION in attribute_changes and TBPulmonaryEnvironment.LYMPH_PATCH in (u, v):
+            lung_patch = v if u == TBPulmonaryEnvironment.LYMPH_PATCH else u
+            self._check_perfusion(lung_patch)
+            if lung_patch in self._infected_patch_index:
+                self._update_t_cell_destination(lung_patch)
+
+    def _revert(self, change_set):
+        """
+        Revert the changes in a change set, then recalculate the T-cell destination weights of any infected patches
+        which were changed. (Patches infected during the transaction remain in the infected list.)
+        :param change_set:
+        :return:
+        """
+        TypedEnvironment._revert(self, change_set)
+        for patch_id in set(change_set.compartment_changes()) | set(change_set.attribute_changes()):
+            if patch_id in self._infected_patch_index:
+                self._update_t_cell_destination(patch_id)
 
     def reset(self):
         """
-        Reset the environment. Also clears the infected patches list.
+        Reset the environment. Also clears the infected patches list, the lymph cytokine total and the T-cell
+        destinations.
         :return:
         """
         self._infected_patches = []
+        self._infected_patch_index = {}
+        self._lymph_cytokine = 0
+        self._t_cell_destinations.clear()
         TypedEnvironment.reset(self)
+        # Edge perfusion is now zero, so the perfusion table is out of date until the perfusion is seeded again
+        if self._perfusion_sampler is not None:
+            self._perfusion_mismatches = set(p for p in self._perfusion_sampler.keys()
+                                             if self._perfusion_sampler.weight(p))
+
+    def checkpoint(self):
+        """
+        Also copies the infected patches, the lymph cytokine total, the T-cell destinations and the perfusion table
+        :return:
+        """
+        state = TypedEnvironment.checkpoint(self)
+        state[TBPulmonaryEnvironment.PULMONARY_STATE] = copy.deepcopy(
+            (self._infected_patches, self._infected_patch_index, self._lymph_cytokine, self._t_cell_destinations,
+             self._perfusion_sampler, self._perfusion_mismatches))
+        return state
+
+    def restore(self, state):
+        TypedEnvironment.restore(self, state)
+        (self._infected_patches, self._infected_patch_index, self._lymph_cytokine, self._t_cell_destinations,
+         self._perfusion_sampler, self._perfusion_mismatches) = copy.deepcopy(
+            state[TBPulmonaryEnvironment.PULMONARY_STATE])
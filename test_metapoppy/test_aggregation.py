@@ -0,0 +1,116 @@
+import unittest
+from metapoppy import *
+import numpy
+import pickle
+
+
+class WelfordAccumulatorTestCase(unittest.TestCase):
+
+    def test_mean_variance_merge(self):
+        samples = numpy.random.RandomState(1).rand(10, 3, 2) * 100
+        samples[2, 0, 1] = numpy.nan
+        whole = WelfordAccumulator((3, 2))
+        first, second = WelfordAccumulator((3, 2)), WelfordAccumulator((3, 2))
+        for i, s in enumerate(samples):
+            whole.add(s)
+            (first if i < 4 else second).add(s)
+        first.merge(second)
+
+        for acc in [whole, first]:
+            numpy.testing.assert_allclose(acc.mean(), numpy.nanmean(samples, axis=0))
+            numpy.testing.assert_allclose(acc.variance(), numpy.nanvar(samples, axis=0, ddof=1))
+            self.assertEqual(acc.count()[0, 1], 9)
+            self.assertEqual(acc.count()[0, 0], 10)
+
+    def test_no_samples(self):
+        acc = WelfordAccumulator((2,))
+        acc.add(numpy.array([1.0, numpy.nan]))
+        self.assertTrue(numpy.isnan(acc.mean()[1]))
+        self.assertTrue(numpy.isnan(acc.variance()[0]))
+
+
+class QuantileSketchTestCase(unittest.TestCase):
+
+    def test_quantiles_merge(self):
+        samples = numpy.random.RandomState(2).randint(0, 1000, size=(200, 4)).astype(numpy.float)
+        whole = QuantileSketch((4,), relative_accuracy=0.01)
+        first, second = QuantileSketch((4,), relative_accuracy=0.01), QuantileSketch((4,), relative_accuracy=0.01)
+        for i, s in enumerate(samples):
+            whole.add(s)
+            (first if i % 2 else second).add(s)
+        first.merge(second)
+        self.assertEqual(whole.size(), first.size())
+
+        for q in [0.0, 0.1, 0.5, 0.9, 1.0]:
+            numpy.testing.assert_array_equal(whole.quantile(q), first.quantile(q))
+            exact = numpy.percentile(samples, q * 100, axis=0, interpolation='lower')
+            numpy.testing.assert_allclose(whole.quantile(q), exact, rtol=0.011)
+
+    def test_zero_and_missing(self):
+        sketch = QuantileSketch((2,))
+        for v in [0.0, 0.0, 5.0]:
+            sketch.add(numpy.array([v, numpy.nan]))
+        self.assertEqual(sketch.quantile(0.5)[0], 0.0)
+        self.assertTrue(numpy.isnan(sketch.quantile(0.5)[1]))
+
+    def test_size_bounded(self):
+        sketch = QuantileSketch((3,))
+        for _ in range(50):
+            sketch.add(numpy.array([1.0, 10.0, 100.0]))
+        self.assertEqual(sketch.size(), 3)
+
+
+class RepetitionAggregatorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.network = TypedEnvironment(['a', 'b'], {'x': []}, [])
+        self.network.add_nodes_from([1, 2])
+        for n in [1, 2]:
+            self.network.set_patch_type(n, 'x')
+        self.network.reset()
+
+    def run_recorder(self, values, patches):
+        self.network.reset()
+        recorder = ResultRecorder()
+        recorder.reset(self.network)
+        for t, v in enumerate(values):
+            for p in patches:
+                current = self.network.get_compartment_value(p, 'a')
+                self.network.update_patch(p, {'a': v - current})
+            recorder.record(float(t), self.network, patches)
+        return recorder
+
+    def test_aggregate_runs(self):
+        aggregator = RepetitionAggregator([0.0, 1.0, 2.0], [1, 2], ['a', 'b'])
+        aggregator.add_run(self.run_recorder([1, 2, 3], [1, 2]))
+        aggregator.add_run(self.run_recorder([3, 4, 5], [1, 2]))
+        # Patch 2 not active, and run ended early
+        aggregator.add_run(self.run_recorder([5, 6], [1]))
+
+        self.assertEqual(aggregator.num_runs(), 3)
+        numpy.testing.assert_array_equal(aggregator.count()[:, :, 0], [[3, 2], [3, 2], [2, 2]])
+        numpy.testing.assert_allclose(aggregator.mean()[:, 0, 0], [3.0, 4.0, 4.0])
+        numpy.testing.assert_allclose(aggregator.mean()[:, 1, 0], [2.0, 3.0, 4.0])
+        numpy.testing.assert_allclose(aggregator.variance()[:, 0, 0], [4.0, 4.0, 2.0])
+        numpy.testing.assert_array_equal(aggregator.mean()[:, :, 1], numpy.zeros((3, 2)))
+        numpy.testing.assert_allclose(aggregator.quantile(0.5)[:, 0, 0], [3.0, 4.0, 3.0], rtol=0.011)
+
+    def test_merge(self):
+        runs = [self.run_recorder(v, [1, 2]) for v in [[1, 2], [3, 5], [8, 13], [2, 2]]]
+        whole = RepetitionAggregator([0.0, 1.0], [1, 2], ['a'])
+        parts = [RepetitionAggregator([0.0, 1.0], [1, 2], ['a']) for _ in range(2)]
+        for i, r in enumerate(runs):
+            whole.add_run(r)
+            parts[i % 2].add_run(r)
+        # Partial aggregates can be sent between processes
+        merged = pickle.loads(pickle.dumps(parts[0]))
+        merged.merge(parts[1])
+
+        self.assertEqual(merged.num_runs(), 4)
+        numpy.testing.assert_allclose(merged.mean(), whole.mean())
+        numpy.testing.assert_allclose(merged.variance(), whole.variance())
+        numpy.testing.assert_array_equal(merged.quantile(0.5), whole.quantile(0.5))
+
+
+if __name__ == '__main__':
+    unittest.main()
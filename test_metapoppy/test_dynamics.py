@@ -1,5 +1,8 @@
 import unittest
 from metapoppy import *
+import os
+import shutil
+import tempfile
 
 compartments = ['a','b','c']
 patch_attributes = ['d','e','f']
@@ -191,6 +194,37 @@ class DynamicsTestCase(unittest.TestCase):
         self.dynamics.setUp(params)
         self.dynamics.do(params)
 
+    def test_summary_statistics(self):
+        params = {NAEvent1.RP_1_KEY: 0.1, NAEvent2.RP_2_KEY: 0.2,
+                  NADynamics.INITIAL_COMP_0: 3, NADynamics.INITIAL_COMP_1: 5,
+                  NADynamics.INITIAL_ATT_0: 7, NADynamics.INITIAL_ATT_1: 11,
+                  NADynamics.INITIAL_EDGE_0: 13, NADynamics.INITIAL_EDGE_1: 17}
+        self.dynamics.add_summary_statistic(CompartmentTotal('total_c', compartments[2]))
+        self.dynamics.add_summary_statistic(FirstPassageTime('first_c', compartments[2]))
+        self.dynamics.add_summary_statistic(TimeWeightedAverage('average_b', CompartmentTotal('total_b',
+                                                                                               compartments[1])))
+        self.dynamics.set_maximum_time(2.0)
+        self.dynamics.configure(params)
+        self.dynamics.setUp(params)
+        res = self.dynamics.do(params)
+        self.assertItemsEqual(res.keys(), [Dynamics.STATISTICS, Dynamics.SNAPSHOTS])
+        self.assertItemsEqual(res[Dynamics.SNAPSHOTS].keys(), [0.0, 1.0, 2.0])
+        statistics = res[Dynamics.STATISTICS]
+        # Event 2 adds 2 to c
+        self.assertEqual(statistics['total_c'] % 2, 0)
+        self.assertLessEqual(statistics['total_c'], sum(self.network.get_compartment_value(n, compartments[2])
+                                                        for n in self.nodes))
+        self.assertTrue(0.0 < statistics['first_c'] <= 2.0)
+        self.assertTrue(3 * 5 <= statistics['average_b'] <= sum(self.network.get_compartment_value(n, compartments[1])
+                                                                 for n in self.nodes))
+        self.dynamics.tearDown()
+
+        # Statistics only
+        self.dynamics.set_record_snapshots(False)
+        self.dynamics.setUp(params)
+        res = self.dynamics.do(params)
+        self.assertItemsEqual(res.keys(), [Dynamics.STATISTICS])
+
     def test_post_event(self):
         letters = ['a','b','c','d','e','f','g','h','i']
         strq = ''.join(numpy.random.choice(letters, 10, True))
@@ -300,10 +334,10 @@ class PropagationTestCase(unittest.TestCase):
         self.dynamics.setUp(params)
 
         # No values so check rates - NoDep should have value, rest should be 0
-        nodep_rates = self.dynamics._rate_table[:,0]
-        patchcompdep_rates = self.dynamics._rate_table[:,1]
-        patchattdep_rates = self.dynamics._rate_table[:,2]
-        edgeattdep_rates = self.dynamics._rate_table[:,3]
+        nodep_rates = self.dynamics._rate_tables[0].rates()[:,0]
+        patchcompdep_rates = self.dynamics._rate_tables[0].rates()[:,1]
+        patchattdep_rates = self.dynamics._rate_tables[0].rates()[:,2]
+        edgeattdep_rates = self.dynamics._rate_tables[0].rates()[:,3]
         for r in nodep_rates:
             self.assertEqual(r, params[EventNoDep.__name__] * 1)
         for r in patchcompdep_rates:
@@ -318,10 +352,10 @@ class PropagationTestCase(unittest.TestCase):
         self.network.update_patch(self.nodes[1], {compartments[0]: 2})
         self.network.update_patch(self.nodes[2], {compartments[0]: 3})
 
-        nodep_rates = self.dynamics._rate_table[:,0]
-        patchcompdep_rates = self.dynamics._rate_table[:,1]
-        patchattdep_rates = self.dynamics._rate_table[:,2]
-        edgeattdep_rates = self.dynamics._rate_table[:,3]
+        nodep_rates = self.dynamics._rate_tables[0].rates()[:,0]
+        patchcompdep_rates = self.dynamics._rate_tables[0].rates()[:,1]
+        patchattdep_rates = self.dynamics._rate_tables[0].rates()[:,2]
+        edgeattdep_rates = self.dynamics._rate_tables[0].rates()[:,3]
         for r in nodep_rates:
             self.assertEqual(r, params[EventNoDep.__name__] * 1)
         for i in range(len(patchcompdep_rates)):
@@ -338,10 +372,10 @@ class PropagationTestCase(unittest.TestCase):
         self.network.update_patch(self.nodes[1], attribute_changes={patch_attributes[0]: 5})
         self.network.update_patch(self.nodes[2], attribute_changes={patch_attributes[0]: 6})
 
-        nodep_rates = self.dynamics._rate_table[:,0]
-        patchcompdep_rates = self.dynamics._rate_table[:,1]
-        patchattdep_rates = self.dynamics._rate_table[:,2]
-        edgeattdep_rates = self.dynamics._rate_table[:,3]
+        nodep_rates = self.dynamics._rate_tables[0].rates()[:,0]
+        patchcompdep_rates = self.dynamics._rate_tables[0].rates()[:,1]
+        patchattdep_rates = self.dynamics._rate_tables[0].rates()[:,2]
+        edgeattdep_rates = self.dynamics._rate_tables[0].rates()[:,3]
         for r in nodep_rates:
             self.assertEqual(r, params[EventNoDep.__name__] * 1)
         for i in range(len(patchcompdep_rates)):
@@ -375,5 +409,775 @@ class PropagationTestCase(unittest.TestCase):
             self.assertEqual(r, params[EventEdgeAttDep.__name__] * v)
 
 
+    def test_bulk_rows(self):
+        params = {EventNoDep.__name__: 0.1, EventPatchCompDep.__name__: 0.2,
+                  EventPatchAttDep.__name__: 0.3, EventEdgeAttDep.__name__: 0.4}
+        self.dynamics.configure(params)
+        self.network.reset()
+        self.network.update_patch('a1', {compartments[0]: 3}, {patch_attributes[0]: 2})
+        self.network.update_edge('b1', 'c1', {edge_attributes[0]: 5})
+        # Rows added together (a column at a time) match rows added one by one
+        bulk = RateTable(self.dynamics._events)
+        bulk.set_reaction_parameters()
+        bulk.add_patches(self.network, self.nodes)
+        single = RateTable(self.dynamics._events)
+        single.set_reaction_parameters()
+        for n in self.nodes:
+            single.add_patch(self.network, n)
+        numpy.testing.assert_array_equal(bulk.rates(), single.rates())
+        self.network.update_patch('c1', {compartments[0]: 4})
+        bulk.update_all_patches(self.network, [1])
+        single.update_patch(self.network, 'c1', [1])
+        numpy.testing.assert_array_equal(bulk.rates(), single.rates())
+
+class EventParamDep(Event):
+    SCALE_KEY = 'scale'
+
+    def __init__(self):
+        Event.__init__(self, [compartments[0]], [], [])
+
+    def _define_parameter_keys(self):
+        return self.__class__.__name__, [EventParamDep.SCALE_KEY]
+
+    def _calculate_state_variable_at_patch(self, network, patch_id):
+        return network.get_compartment_value(patch_id, compartments[0]) * self._parameters[EventParamDep.SCALE_KEY]
+
+    def _calculate_state_variables(self, network_arrays, patch_indices):
+        return network_arrays.compartment(compartments[0])[patch_indices] * self._parameters[EventParamDep.SCALE_KEY]
+
+    def perform(self, network, patch_id):
+        pass
+
+
+class ParamDynamics(PropDynamics):
+    def _create_events(self):
+        return [EventPatchCompDep(compartments[0]), EventParamDep()]
+
+
+class ParamActivationDynamics(ParamDynamics):
+    def _create_activation_rules(self):
+        return [CompartmentActivation([compartments[0]])]
+
+    def _get_initial_patch_seeding(self, params):
+        return {p: {Environment.COMPARTMENTS: {compartments[0]: n + 1}} for n, p in enumerate(['a1', 'b1', 'c1'])}
+
+
+class ParameterUpdateTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.network = Environment(compartments, patch_attributes, edge_attributes)
+        self.nodes = ['a1', 'b1', 'c1']
+        self.network.add_nodes_from(self.nodes)
+        self.network.add_edges_from([('a1', 'b1'), ('b1', 'c1')])
+        self.dynamics = ParamDynamics(self.network)
+        self.params = {EventPatchCompDep.__name__: 0.2, EventParamDep.__name__: 0.3, EventParamDep.SCALE_KEY: 2.0}
+        self.dynamics.configure(self.params)
+        self.dynamics.setUp(self.params)
+        for n in range(len(self.nodes)):
+            self.network.update_patch(self.nodes[n], {compartments[0]: n + 1})
+
+    def test_update_reaction_parameter(self):
+        self.dynamics.update_parameter(EventPatchCompDep.__name__, 0.5)
+        rates = self.dynamics._rate_tables[0].rates()
+        state_variables = self.dynamics._rate_tables[0].state_variables()
+        for row in range(len(self.nodes)):
+            value = self.network.get_compartment_value(self.dynamics._active_patches[row], compartments[0])
+            self.assertEqual(state_variables[row, 0], value)
+            self.assertEqual(rates[row, 0], 0.5 * value)
+            self.assertEqual(rates[row, 1], 0.3 * value * 2.0)
+
+    def test_update_state_variable_parameter(self):
+        self.dynamics.update_parameter(EventParamDep.SCALE_KEY, 5.0)
+        rates = self.dynamics._rate_tables[0].rates()
+        for row in range(len(self.nodes)):
+            value = self.network.get_compartment_value(self.dynamics._active_patches[row], compartments[0])
+            self.assertEqual(rates[row, 0], 0.2 * value)
+            self.assertEqual(rates[row, 1], 0.3 * value * 5.0)
+
+    def test_network_arrays_refreshed(self):
+        network = Environment(compartments, patch_attributes, edge_attributes)
+        network.add_nodes_from(self.nodes + ['d1'])
+        network.add_edges_from([('a1', 'b1'), ('b1', 'c1')])
+        dynamics = ParamActivationDynamics(network)
+        dynamics.configure(self.params)
+        dynamics.setUp(self.params)
+        rate_table = dynamics._rate_tables[0]
+        dynamics.update_parameter(EventParamDep.SCALE_KEY, 5.0)
+        network_arrays = rate_table._network_arrays
+        self.assertIsNotNone(network_arrays)
+        # Changes to active patches (and a newly active patch) are re-read, without rebuilding the view
+        self.assertFalse(rate_table.has_patch('d1'))
+        network.update_patch('b1', {compartments[0]: 4})
+        with network.transaction():
+            network.update_patch('c1', {compartments[0]: 2})
+            network.update_patch('d1', {compartments[0]: 7})
+        dynamics.update_parameter(EventParamDep.SCALE_KEY, 3.0)
+        self.assertIs(rate_table._network_arrays, network_arrays)
+        self.assertEqual(len(rate_table.patches()), 4)
+        rates = rate_table.rates()
+        for row in range(len(rate_table.patches())):
+            value = network.get_compartment_value(rate_table.patches()[row], compartments[0])
+            self.assertAlmostEqual(rates[row, 1], 0.3 * value * 3.0)
+
+
+class EventNeighbourCompDep(Event):
+    def __init__(self, comp):
+        self.comp = comp
+        Event.__init__(self, [], [], [])
+        self._dependent_neighbour_compartments = [comp]
+
+    def _define_parameter_keys(self):
+        return self.__class__.__name__, []
+
+    def _calculate_state_variable_at_patch(self, network, patch_id):
+        return sum(network.get_compartment_value(n, self.comp) for n in network[patch_id])
+
+    def perform(self, network, patch_id):
+        pass
+
+
+class EventHubCompDep(Event):
+    def __init__(self, hub, comp):
+        self.hub = hub
+        self.comp = comp
+        Event.__init__(self, [], [], [])
+        self._dependent_hub_compartments = {hub: [comp]}
+
+    def _define_parameter_keys(self):
+        return self.__class__.__name__, []
+
+    def _calculate_state_variable_at_patch(self, network, patch_id):
+        return network.get_compartment_value(self.hub, self.comp)
+
+    def perform(self, network, patch_id):
+        pass
+
+
+class EventNetworkCompDep(Event):
+    def __init__(self, comp):
+        self.comp = comp
+        Event.__init__(self, [], [], [])
+        self._dependent_network_compartments = [comp]
+
+    def _define_parameter_keys(self):
+        return self.__class__.__name__, []
+
+    def _calculate_state_variable_at_patch(self, network, patch_id):
+        return sum(network.get_compartment_value(n, self.comp) for n in network.nodes())
+
+    def perform(self, network, patch_id):
+        pass
+
+
+class CrossPatchDynamics(PropDynamics):
+    def _create_events(self):
+        return [EventNeighbourCompDep(compartments[0]), EventHubCompDep('a1', compartments[1]),
+                EventNetworkCompDep(compartments[2])]
+
+
+class CrossPatchPropagationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.network = Environment(compartments, patch_attributes, edge_attributes)
+        self.nodes = ['a1', 'b1', 'c1']
+        self.network.add_nodes_from(self.nodes)
+        self.network.add_edges_from([('a1', 'b1'), ('b1', 'c1')])
+        self.dynamics = CrossPatchDynamics(self.network)
+        self.params = {EventNeighbourCompDep.__name__: 0.1, EventHubCompDep.__name__: 0.2,
+                       EventNetworkCompDep.__name__: 0.3}
+        self.dynamics.configure(self.params)
+        self.dynamics.setUp(self.params)
+
+    def rate(self, patch_id, col):
+        return self.dynamics._rate_tables[0].rates()[self.dynamics._rate_tables[0].row_for_patch(patch_id), col]
+
+    def test_neighbour_dependency(self):
+        self.network.update_patch('a1', {compartments[0]: 2})
+        self.assertEqual(self.rate('a1', 0), 0)
+        self.assertEqual(self.rate('b1', 0), 0.1 * 2)
+        self.assertEqual(self.rate('c1', 0), 0)
+        self.network.update_patch('c1', {compartments[0]: 3})
+        self.assertEqual(self.rate('b1', 0), 0.1 * 5)
+
+    def test_neighbours_only_visited_for_dependent_compartments(self):
+        self.assertEqual(self.dynamics._neighbour_compartments, {compartments[0]})
+        visited = []
+        neighbours = self.network.neighbours
+        self.network.neighbours = lambda patch_id: visited.append(patch_id) or neighbours(patch_id)
+        self.network.update_patch('b1', {compartments[1]: 4})
+        self.assertEqual(visited, [])
+        self.network.update_patch('b1', {compartments[0]: 1})
+        self.assertEqual(visited, ['b1'])
+        self.assertEqual(self.rate('a1', 0), 0.1)
+
+    def test_hub_dependency(self):
+        self.network.update_patch('b1', {compartments[1]: 4})
+        for n in self.nodes:
+            self.assertEqual(self.rate(n, 1), 0)
+        self.network.update_patch('a1', {compartments[1]: 5})
+        for n in self.nodes:
+            self.assertEqual(self.rate(n, 1), 0.2 * 5)
+
+    def test_network_dependency(self):
+        self.network.update_patch('a1', {compartments[2]: 1})
+        self.network.update_patch('c1', {compartments[2]: 6})
+        for n in self.nodes:
+            self.assertAlmostEqual(self.rate(n, 2), 0.3 * 7)
+
+    def test_transaction(self):
+        with self.network.transaction():
+            self.network.update_patch('a1', {compartments[0]: 2, compartments[1]: 5})
+            self.network.update_patch('c1', {compartments[0]: 3, compartments[2]: 6})
+            self.network.update_patch('a1', {compartments[2]: 1})
+            # Not propagated yet
+            self.assertEqual(self.rate('b1', 0), 0)
+        self.assertEqual(self.rate('b1', 0), 0.1 * 5)
+        for n in self.nodes:
+            self.assertEqual(self.rate(n, 1), 0.2 * 5)
+            self.assertAlmostEqual(self.rate(n, 2), 0.3 * 7)
+
+
+class WellMixedTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.params = {EventNeighbourCompDep.__name__: 0.1, EventHubCompDep.__name__: 0.2,
+                       EventNetworkCompDep.__name__: 0.3}
+
+    def create(self, nodes, well_mixed=None):
+        network = Environment(compartments, patch_attributes, edge_attributes)
+        network.add_nodes_from(nodes)
+        network.add_edges_from(zip(nodes[:-1], nodes[1:]))
+        dynamics = CrossPatchDynamics(network)
+        dynamics.set_well_mixed(well_mixed)
+        dynamics.configure(self.params)
+        dynamics.setUp(self.params)
+        return network, dynamics
+
+    def test_chosen_by_size(self):
+        _, dynamics = self.create(['a1', 'b1'])
+        self.assertTrue(isinstance(dynamics._rate_tables[0], WellMixedRateTable))
+        _, dynamics = self.create(['a1', 'b1', 'c1'])
+        self.assertFalse(isinstance(dynamics._rate_tables[0], WellMixedRateTable))
+        _, dynamics = self.create(['a1', 'b1', 'c1'], True)
+        self.assertTrue(isinstance(dynamics._rate_tables[0], WellMixedRateTable))
+
+    def test_same_as_rate_table(self):
+        nodes = ['a1', 'b1']
+        results = []
+        for well_mixed in [False, True]:
+            network, dynamics = self.create(nodes, well_mixed)
+            network.update_patch('a1', {compartments[0]: 2, compartments[1]: 5})
+            network.update_patch('b1', {compartments[2]: 6})
+            network.update_patch('a1', {compartments[2]: 1})
+            network.update_patch('b1', {compartments[0]: 3})
+            table = dynamics._rate_tables[0]
+            rates = table.rates()
+            results.append(rates)
+            self.assertAlmostEqual(table.total(), rates.sum())
+            self.assertEqual(table.choose(0.0), ('a1', table.events()[0]))
+            self.assertEqual(table.choose(table.total() - 1e-9), ('b1', table.events()[2]))
+        numpy.testing.assert_array_almost_equal(results[0], results[1])
+
+
+class EventFixedChange(Event):
+    def __init__(self, key, comp_from, comp_to):
+        self.key = key
+        self.comp_from = comp_from
+        self.comp_to = comp_to
+        Event.__init__(self, [comp_from], [], [])
+
+    def _define_parameter_keys(self):
+        return self.key, []
+
+    def _calculate_state_variable_at_patch(self, network, patch_id):
+        return network.get_compartment_value(patch_id, self.comp_from)
+
+    def _state_variable_signature(self):
+        return Environment.COMPARTMENTS, self.comp_from
+
+    def _compartment_changes(self):
+        return {self.comp_from: -1, self.comp_to: 1}
+
+    def perform(self, network, patch_id):
+        network.update_patch(patch_id, {self.comp_from: -1, self.comp_to: 1})
+
+
+class EventFixedContact(EventFixedChange):
+    def __init__(self, key, comp_from, comp_to, comp_by):
+        self.comp_by = comp_by
+        EventFixedChange.__init__(self, key, comp_from, comp_to)
+        self._dependent_compartments = [comp_from, comp_by]
+
+    def _calculate_state_variable_at_patch(self, network, patch_id):
+        return network.get_compartment_value(patch_id, self.comp_from) * \
+               network.get_compartment_value(patch_id, self.comp_by)
+
+    def _state_variable_signature(self):
+        return Environment.COMPARTMENTS, self.comp_from, self.comp_by
+
+
+class EventFixedArrival(Event):
+    def __init__(self, key, comp):
+        self.key = key
+        self.comp = comp
+        Event.__init__(self, [], [], [])
+
+    def _define_parameter_keys(self):
+        return self.key, []
+
+    def _calculate_state_variable_at_patch(self, network, patch_id):
+        return 1
+
+    def _state_variable_signature(self):
+        return 'constant',
+
+    def _compartment_changes(self):
+        return {self.comp: 1}
+
+    def perform(self, network, patch_id):
+        network.update_patch(patch_id, {self.comp: 1})
+
+
+class EventFixedChangeOverridden(EventFixedChange):
+    def perform(self, network, patch_id):
+        network.update_patch(patch_id, {self.comp_from: -1, self.comp_to: 1}, {patch_attributes[0]: 1})
+
+
+class FixedDynamics(PropDynamics):
+    def _create_events(self):
+        # The two changes from a are fused
+        return [EventFixedArrival('arrive', compartments[0]),
+                EventFixedChange('a_to_b', compartments[0], compartments[1]),
+                EventFixedChange('a_to_c', compartments[0], compartments[2]),
+                EventFixedContact('contact', compartments[1], compartments[2], compartments[0]),
+                EventFixedChange('c_to_a', compartments[2], compartments[0])]
+
+    def setUp(self, params):
+        PropDynamics.setUp(self, params)
+        self.post_event(2.5, '_double_arrivals', [])
+
+    def _double_arrivals(self):
+        self.update_parameter('arrive', 2 * self._parameters['arrive'])
+
+    def _get_initial_patch_seeding(self, params):
+        return {'a1': {Environment.COMPARTMENTS: {compartments[0]: 20, compartments[1]: 3}}}
+
+
+class FixedDynamicsOverridden(FixedDynamics):
+    def _create_events(self):
+        events = FixedDynamics._create_events(self)
+        events[-1] = EventFixedChangeOverridden('c_to_a', compartments[2], compartments[0])
+        return events
+
+
+class WellMixedEngineTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.params = {'arrive': 1.0, 'a_to_b': 0.2, 'a_to_c': 0.1, 'contact': 0.05, 'c_to_a': 0.3}
+
+    def run_dynamics(self, dynamics_class, well_mixed):
+        network = Environment(compartments, patch_attributes, edge_attributes)
+        network.add_node('a1')
+        dynamics = dynamics_class(network)
+        dynamics.set_well_mixed(well_mixed)
+        dynamics.set_maximum_time(10.0)
+        dynamics.configure(self.params)
+        dynamics.setUp(self.params)
+        numpy.random.seed(5)
+        results = dynamics.do(self.params)
+        firing_counts = {e.reaction_parameter(): n for e, n in dynamics._firing_counts.iteritems()}
+        return dynamics, results, firing_counts
+
+    def test_same_as_rate_table(self):
+        dynamics, results, firing_counts = self.run_dynamics(FixedDynamics, True)
+        self.assertIsNotNone(dynamics._well_mixed_engine())
+        self.assertTrue(any(isinstance(e, FusedEvent) for e in dynamics._rate_tables[0].events()))
+        _, expected_results, expected_firing_counts = self.run_dynamics(FixedDynamics, False)
+        self.assertEqual(results, expected_results)
+        self.assertEqual(firing_counts, expected_firing_counts)
+        self.assertEqual(dynamics._events[0].reaction_parameter_value(), 2.0)
+
+    def run_traced(self, dynamics_class):
+        network = Environment(compartments, patch_attributes, edge_attributes)
+        network.add_node('a1')
+        dynamics = dynamics_class(network)
+        dynamics.set_maximum_time(10.0)
+        dynamics.set_record_trace(True)
+        dynamics.configure(self.params)
+        dynamics.setUp(self.params)
+        numpy.random.seed(5)
+        return dynamics, dynamics.do(self.params)
+
+    def test_not_used_unless_simple(self):
+        dynamics, _, _ = self.run_dynamics(FixedDynamicsOverridden, True)
+        self.assertIsNone(dynamics._well_mixed_engine())
+
+    def test_not_used_when_traced(self):
+        _, expected_results, firing_counts = self.run_dynamics(FixedDynamics, True)
+        dynamics, results = self.run_traced(FixedDynamics)
+        self.assertEqual(results, expected_results)
+        # Every event is traced, plus the posted event and the parameter it changes
+        self.assertEqual(len(dynamics.trace()), sum(firing_counts.values()) + 2)
+
+
+class EventCompCount(EventPatchCompDep):
+    def __init__(self, comp, key):
+        self.key = key
+        EventPatchCompDep.__init__(self, comp)
+
+    def _define_parameter_keys(self):
+        return self.key, []
+
+    def _state_variable_signature(self):
+        return Environment.COMPARTMENTS, self.comp
+
+
+class EventCompCountOverridden(EventCompCount):
+    def _calculate_state_variable_at_patch(self, network, patch_id):
+        return 2 * network.get_compartment_value(patch_id, self.comp)
+
+
+class OptimisedDynamics(PropDynamics):
+    def _create_events(self):
+        return [EventNoDep(), EventCompCount(compartments[0], 'count1'), EventCompCount(compartments[0], 'count2'),
+                EventCompCountOverridden(compartments[0], 'count3'), EventPatchAttDep(patch_attributes[0])]
+
+    def _scheduled_parameters(self):
+        return [EventPatchAttDep.__name__]
+
+
+class OptimisationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.network = Environment(compartments, patch_attributes, edge_attributes)
+        self.nodes = ['a1', 'b1']
+        self.network.add_nodes_from(self.nodes)
+        self.network.add_edge('a1', 'b1')
+        self.dynamics = OptimisedDynamics(self.network)
+        self.params = {EventNoDep.__name__: 0.0, 'count1': 0.1, 'count2': 0.3, 'count3': 0.2,
+                       EventPatchAttDep.__name__: 0.0}
+
+    def test_optimise(self):
+        self.dynamics.configure(self.params)
+        report = self.dynamics.optimisation_report()
+        # Zero and not scheduled
+        self.assertEqual(report[Dynamics.REMOVED_EVENTS], [EventNoDep.__name__])
+        # Overridden state variable cannot be fused
+        self.assertEqual(report[Dynamics.FUSED_EVENTS], [['count1', 'count2']])
+        events = self.dynamics._rate_tables[0].events()
+        self.assertEqual(len(events), 3)
+        self.assertTrue(isinstance(events[0], FusedEvent))
+        self.assertEqual(events[0].reaction_parameter_value(), 0.1 + 0.3)
+
+        self.dynamics.setUp(self.params)
+        self.network.update_patch('a1', {compartments[0]: 5})
+        rates = self.dynamics._rate_tables[0].rates()
+        row = self.dynamics._rate_tables[0].row_for_patch('a1')
+        self.assertAlmostEqual(rates[row, 0], (0.1 + 0.3) * 5)
+        self.assertAlmostEqual(rates[row, 1], 0.2 * 10)
+
+        # Parameter of a fused event rescales its column
+        self.dynamics.update_parameter('count1', 0.5)
+        self.assertAlmostEqual(self.dynamics._rate_tables[0].rates()[row, 0], (0.5 + 0.3) * 5)
+        # Scheduled parameter was kept
+        self.network.update_patch('a1', attribute_changes={patch_attributes[0]: 2})
+        self.dynamics.update_parameter(EventPatchAttDep.__name__, 0.7)
+        self.assertAlmostEqual(self.dynamics._rate_tables[0].rates()[row, 2], 0.7 * 2)
+        # Removed parameter cannot be changed
+        with self.assertRaises(AssertionError):
+            self.dynamics.update_parameter(EventNoDep.__name__, 0.1)
+
+    def test_column_order(self):
+        self.dynamics.configure(self.params)
+        overridden = self.dynamics._rate_tables[0].events()[1]
+        self.dynamics._firing_counts[overridden] = 10
+        self.dynamics.configure(self.params)
+        self.assertIs(self.dynamics._rate_tables[0].events()[0], overridden)
+
+    def test_no_optimise(self):
+        self.dynamics.set_optimise(False)
+        self.dynamics.configure(self.params)
+        self.assertEqual(self.dynamics._rate_tables[0].events(), self.dynamics._events)
+        self.assertFalse(self.dynamics.optimisation_report()[Dynamics.REMOVED_EVENTS])
+
+class ActivationRuleDynamics(PropDynamics):
+    def __init__(self, network):
+        PropDynamics.__init__(self, network)
+        self.checked = []
+
+    def _create_activation_rules(self):
+        return [CompartmentActivation([compartments[0]])]
+
+    def _get_initial_patch_seeding(self, params):
+        return {'b1': {Environment.COMPARTMENTS: {compartments[0]: 2}}}
+
+    def _patch_is_active(self, patch_id):
+        self.checked.append(patch_id)
+        return PropDynamics._patch_is_active(self, patch_id)
+
+
+class ActivationRuleTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.network = Environment(compartments, patch_attributes, edge_attributes)
+        self.nodes = ['a1', 'b1', 'c1']
+        self.network.add_nodes_from(self.nodes)
+        self.network.add_edges_from([('a1', 'b1'), ('b1', 'c1')])
+        self.dynamics = ActivationRuleDynamics(self.network)
+        self.params = {EventNoDep.__name__: 0.1, EventPatchCompDep.__name__: 0.2,
+                       EventPatchAttDep.__name__: 0.3, EventEdgeAttDep.__name__: 0.4}
+        self.dynamics.configure(self.params)
+
+    def test_seeding(self):
+        self.dynamics.setUp(self.params)
+        # Only the seeded patch is visited
+        self.assertItemsEqual(self.dynamics.checked, ['b1'])
+        self.assertItemsEqual(self.dynamics._active_patches, ['b1'])
+
+    def test_activation(self):
+        self.dynamics.setUp(self.params)
+        self.dynamics.checked = []
+        # Unwatched changes do not check activation
+        self.network.update_patch('a1', {compartments[1]: 1}, {patch_attributes[0]: 1})
+        self.network.update_edge('a1', 'b1', {edge_attributes[0]: 1})
+        self.assertFalse(self.dynamics.checked)
+        self.assertItemsEqual(self.dynamics._active_patches, ['b1'])
+        # Watched change activates the patch
+        self.network.update_patch('a1', {compartments[0]: 1})
+        self.assertEqual(self.dynamics.checked, ['a1'])
+        self.assertItemsEqual(self.dynamics._active_patches, ['a1', 'b1'])
+        self.assertEqual(self.dynamics._rate_tables[0].rates()[self.dynamics._rate_tables[0].row_for_patch('a1'), 1],
+                         0.2)
+
+    def test_compartment_group_rule(self):
+        rule = CompartmentActivation([compartments[0], compartments[1]], threshold=2)
+        self.network.reset()
+        self.assertEqual(rule.compartment_groups(),
+                         {Environment.compartment_group_name([compartments[0], compartments[1]]):
+                              [compartments[0], compartments[1]]})
+        for g, comps in rule.compartment_groups().iteritems():
+            self.network.add_compartment_group(g, comps)
+        self.network.update_patch('a1', {compartments[0]: 1, compartments[1]: 1})
+        self.assertFalse(rule.is_satisfied(self.network, 'a1'))
+        self.network.update_patch('a1', {compartments[1]: 1})
+        self.assertTrue(rule.is_satisfied(self.network, 'a1'))
+
+
+class EventMoveRandom(Event):
+    def __init__(self):
+        Event.__init__(self, [compartments[0]], [], [])
+
+    def _define_parameter_keys(self):
+        return EventMoveRandom.__name__, []
+
+    def _calculate_state_variable_at_patch(self, network, patch_id):
+        return network.get_compartment_value(patch_id, compartments[0])
+
+    def perform(self, network, patch_id):
+        destination = network.choose_neighbour(patch_id)
+        network.update_patch(patch_id, {compartments[0]: -1})
+        network.update_patch(destination, {compartments[0]: 1})
+
+
+class TraceDynamics(ActivationRuleDynamics):
+    def _create_events(self):
+        return [EventMoveRandom(), EventPatchCompDep(compartments[0])]
+
+    def _scheduled_parameters(self):
+        return [EventPatchCompDep.__name__]
+
+    def _seed_activated_patch(self, patch_id, params):
+        return {Environment.ATTRIBUTES: {patch_attributes[0]: numpy.random.random()}}
+
+    def setUp(self, params):
+        ActivationRuleDynamics.setUp(self, params)
+        self.post_event(2.0, '_set_rate', [2.0])
+
+    def _set_rate(self, rates):
+        self.update_parameter(EventPatchCompDep.__name__, rates[0])
+
+
+class EventTraceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.network = Environment(compartments, patch_attributes, edge_attributes)
+        self.nodes = ['a1', 'b1', 'c1', 'd1']
+        self.network.add_nodes_from(self.nodes)
+        self.network.add_edges_from([('a1', 'b1'), ('b1', 'c1'), ('c1', 'd1')])
+        self.dynamics = TraceDynamics(self.network)
+        self.dynamics.set_record_trace(True)
+        self.dynamics.set_maximum_time(5.0)
+        self.params = {EventMoveRandom.__name__: 1.0, EventPatchCompDep.__name__: 0.5}
+        self.dynamics.configure(self.params)
+        self.dynamics.setUp(self.params)
+        self.dynamics.do(self.params)
+        self.final = {n: dict(self.network.node[n][Environment.COMPARTMENTS]) for n in self.nodes}
+
+    def test_trace(self):
+        trace = self.dynamics.trace()
+        records = trace.records()
+        self.assertEqual(trace.nbytes(), 16 * len(trace))
+        self.assertEqual(len(trace.times()), (records['column'] >= 0).sum())
+        self.assertEqual(records['time'][records['column'] == EventTrace.POSTED_EVENT].tolist(), [2.0])
+        self.assertEqual(trace.parameter_updates(), [(EventPatchCompDep.__name__, 2.0)])
+        self.assertIn(EventTrace.ACTIVATION, records['column'])
+
+    def test_replay(self):
+        trace = self.dynamics.trace()
+        recorder = self.dynamics.recorder()
+        self.dynamics.tearDown()
+        event_times = trace.times()
+        state = numpy.random.get_state()
+        # The recorded state at each interval includes the event which passed it
+        times = [0.0] + [event_times[event_times >= t][0] for t in recorder.times()[1:]]
+        replayed = self.dynamics.replay(trace, times)
+        self.assertTrue(numpy.array_equal(numpy.random.get_state()[1], state[1]))
+        self.assertEqual(self.dynamics._events[1].reaction_parameter_value(), 2.0)
+        self.assertEqual(replayed.patches(), recorder.patches())
+        numpy.testing.assert_array_equal(replayed.compartment_values(), recorder.compartment_values())
+        numpy.testing.assert_array_equal(replayed.attribute_values(), recorder.attribute_values())
+
+        # Replay from a saved trace reaches the final state of the run
+        filename = tempfile.mktemp()
+        try:
+            trace.save(filename)
+            loaded = EventTrace.load(filename)
+        finally:
+            os.remove(filename)
+        replayed = self.dynamics.replay(loaded, [0.5, 1.5, numpy.inf])
+        self.assertEqual(len(replayed.times()), 3)
+        self.assertEqual({n: self.network.node[n][Environment.COMPARTMENTS] for n in self.nodes}, self.final)
+
+
+class Interrupted(Exception):
+    pass
+
+
+class InterruptedDynamics(TraceDynamics):
+    def __init__(self, network, interrupt_time=None):
+        TraceDynamics.__init__(self, network)
+        self.interrupt_time = interrupt_time
+
+    def _end_simulation(self, t):
+        if self.interrupt_time is not None and t >= self.interrupt_time:
+            raise Interrupted()
+        return False
+
+
+class CheckpointTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.params = {EventMoveRandom.__name__: 1.0, EventPatchCompDep.__name__: 0.5}
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_dynamics(self, seed, interrupt_time=None, previous_params=None):
+        network = Environment(compartments, patch_attributes, edge_attributes)
+        network.add_nodes_from(['a1', 'b1', 'c1', 'd1'])
+        network.add_edges_from([('a1', 'b1'), ('b1', 'c1'), ('c1', 'd1')])
+        dynamics = InterruptedDynamics(network)
+        dynamics.set_maximum_time(5.0)
+        dynamics.add_summary_statistic(CompartmentTotal('total_b', compartments[1]))
+        dynamics.set_checkpoint(self.directory, simulated_interval=1.0)
+        if previous_params is not None:
+            # Earlier sample in the same process, whose events fired set the order of the columns
+            dynamics.configure(previous_params)
+            numpy.random.seed(seed)
+            dynamics.setUp(previous_params)
+            dynamics.do(previous_params)
+            dynamics.tearDown()
+        dynamics.interrupt_time = interrupt_time
+        dynamics.configure(self.params)
+        numpy.random.seed(seed)
+        dynamics.setUp(self.params)
+        return dynamics, dynamics.do(self.params)
+
+    def test_resume(self):
+        _, expected = self.run_dynamics(5)
+        # Checkpoint removed once complete
+        self.assertFalse(os.listdir(self.directory))
+
+        self.assertRaises(Interrupted, self.run_dynamics, 5, 3.5)
+        self.assertEqual(os.listdir(self.directory), [Checkpointer.FILENAME])
+        # Resumed from the checkpoint, so the seed of the new run does not matter
+        dynamics, results = self.run_dynamics(6)
+        self.assertEqual(results, expected)
+        self.assertFalse(os.listdir(self.directory))
+
+    def test_resume_in_new_process(self):
+        previous_params = {EventMoveRandom.__name__: 0.1, EventPatchCompDep.__name__: 5.0}
+        dynamics, expected = self.run_dynamics(5, previous_params=previous_params)
+        # Columns reordered by the earlier sample
+        self.assertEqual(dynamics._rate_tables[0].events(), dynamics._events[::-1])
+
+        self.assertRaises(Interrupted, self.run_dynamics, 5, 3.5, previous_params)
+        # Resumed without the earlier sample, so the columns are first built in the original order
+        dynamics, results = self.run_dynamics(6)
+        self.assertEqual(dynamics._rate_tables[0].events(), dynamics._events[::-1])
+        self.assertEqual(results, expected)
+
+    def test_wall_clock_stride(self):
+        checkpointer = Checkpointer(self.directory, wall_clock_interval=0.0, wall_clock_stride=3)
+        checkpointer.start(0.0)
+        # Wall clock only read on every third check
+        self.assertEqual([checkpointer.due(0.0) for _ in range(6)], [False, False, True, False, False, True])
+        checkpointer.write(0.0, {})
+        self.assertEqual([checkpointer.due(0.0) for _ in range(3)], [False, False, True])
+
+    def test_lambda_not_checkpointed(self):
+        dynamics, _ = self.run_dynamics(5)
+        dynamics.post_event(1.0, lambda a: 0, [])
+        self.assertRaises(AssertionError, dynamics._run_state, self.params, 0.0, 1.0)
+
+
+class ForkTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.params = {EventMoveRandom.__name__: 1.0, EventPatchCompDep.__name__: 0.5}
+
+    def set_up_dynamics(self, seed):
+        network = Environment(compartments, patch_attributes, edge_attributes)
+        network.add_nodes_from(['a1', 'b1', 'c1', 'd1'])
+        network.add_edges_from([('a1', 'b1'), ('b1', 'c1'), ('c1', 'd1')])
+        dynamics = TraceDynamics(network)
+        dynamics.set_maximum_time(5.0)
+        dynamics.configure(self.params)
+        numpy.random.seed(seed)
+        dynamics.setUp(self.params)
+        return dynamics
+
+    def test_fork(self):
+        expected = self.set_up_dynamics(5).do(self.params)
+
+        dynamics = self.set_up_dynamics(5)
+        snapshot = dynamics.burn_in(self.params, 2.5)
+        self.assertGreaterEqual(snapshot[Dynamics.RUN_TIME], 2.5)
+        first = dynamics.fork(snapshot, seed=1)
+        # Snapshot unchanged by forking
+        self.assertEqual(dynamics.fork(snapshot, seed=1), first)
+        # Parameter changed during the burn-in is kept
+        self.assertEqual(dynamics._events[1].reaction_parameter_value(), 2.0)
+        second = dynamics.fork(snapshot, self.params, seed=2)
+        self.assertEqual(dynamics._events[1].reaction_parameter_value(), 2.0)
+        self.assertNotEqual(second, first)
+        # Burn-in shared by all forks
+        self.assertEqual(sorted(first.keys()), sorted(expected.keys()))
+        for t in [0.0, 1.0, 2.0]:
+            self.assertEqual(first[t], expected[t])
+            self.assertEqual(second[t], expected[t])
+
+    def test_fork_parameters(self):
+        dynamics = self.set_up_dynamics(5)
+        snapshot = dynamics.burn_in(self.params, 2.5)
+        dynamics.set_record_trace(True)
+        dynamics.fork(snapshot, dict(self.params, **{EventPatchCompDep.__name__: 0.0}), seed=1)
+        self.assertEqual(dynamics._events[1].reaction_parameter_value(), 0.0)
+        # Event has no rate (so no column) after the burn-in
+        self.assertNotIn((1,), dynamics.trace().column_keys())
+        self.assertEqual(snapshot[Dynamics.RUN_PARAMETERS], self.params)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -27,6 +27,16 @@ class NAEvent(Event):
         network.update_patch(patch_id, {compartments[1]: 1})
 
 
+class NAFixedEvent(NAEvent):
+    def _compartment_changes(self):
+        return {compartments[1]: 1}
+
+
+class NAFixedEventOverridden(NAFixedEvent):
+    def perform(self, network, patch_id):
+        network.update_patch(patch_id, {compartments[1]: 2})
+
+
 class EventTestCase(unittest.TestCase):
 
     def setUp(self):
@@ -41,11 +51,73 @@ class EventTestCase(unittest.TestCase):
         self.network.node[1][Environment.COMPARTMENTS][compartments[0]] = 10
         self.assertEqual(self.event.calculate_rate_at_patch(self.network, 1), 0.1 * 10)
 
+    def test_calculate_rates(self):
+        # No vectorised form, so falls back to the scalar calculation
+        self.event.set_parameters({RP1_key: 0.1})
+        self.network.add_node(2)
+        self.network.reset()
+        self.network.node[1][Environment.COMPARTMENTS][compartments[0]] = 10
+        self.network.node[2][Environment.COMPARTMENTS][compartments[0]] = 3
+        network_arrays = NetworkArrays(self.network, [1, 2])
+        numpy.testing.assert_array_almost_equal(self.event.calculate_rates(network_arrays, numpy.array([1, 0])),
+                                                [0.1 * 3, 0.1 * 10])
+
     def test_perform(self):
         self.assertEqual(self.network.get_compartment_value(1, compartments[1]), 0)
         self.event.perform(self.network, 1)
         self.assertEqual(self.network.get_compartment_value(1, compartments[1]), 1)
 
+    def test_compartment_changes(self):
+        self.assertIsNone(self.event.compartment_changes())
+        self.assertEqual(NAFixedEvent(compartments[0], compartments[1]).compartment_changes(), {compartments[1]: 1})
+        # Not valid once perform is overridden
+        self.assertIsNone(NAFixedEventOverridden(compartments[0], compartments[1]).compartment_changes())
+
+
+class NACountEvent(NAEvent):
+    def __init__(self, key, changed_comp):
+        self.key = key
+        NAEvent.__init__(self, compartments[0], changed_comp)
+
+    def _define_parameter_keys(self):
+        return self.key, []
+
+    def _state_variable_signature(self):
+        return Environment.COMPARTMENTS, self._dep_comp
+
+    def perform(self, network, patch_id):
+        network.update_patch(patch_id, {self._changed_comp: 1})
+
+
+class FusedEventTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.network = Environment(compartments, attributes, [])
+        self.network.add_node(1)
+        self.network.reset()
+        self.events = [NACountEvent('k1', compartments[1]), NACountEvent('k2', compartments[2])]
+        self.fused = FusedEvent(self.events)
+        self.fused.set_parameters({'k1': 0.25, 'k2': 0.75})
+
+    def test_calculate_rate(self):
+        self.network.node[1][Environment.COMPARTMENTS][compartments[0]] = 4
+        self.assertEqual(self.fused.calculate_rate_at_patch(self.network, 1), 4.0)
+        self.assertItemsEqual(self.fused.reaction_parameter_keys(), ['k1', 'k2'])
+
+    def test_perform(self):
+        numpy.random.seed(1)
+        for _ in range(400):
+            self.fused.perform(self.network, 1)
+        b = self.network.get_compartment_value(1, compartments[1])
+        c = self.network.get_compartment_value(1, compartments[2])
+        self.assertEqual(b + c, 400)
+        self.assertTrue(60 < b < 140)
+
+    def test_cannot_fuse(self):
+        # No signature
+        self.assertIsNone(NAEvent(compartments[0], compartments[1]).fusion_key())
+        with self.assertRaises(AssertionError):
+            FusedEvent([self.events[0], NAEvent(compartments[0], compartments[1])])
 
 class NAPatchTypeEvent(PatchTypeEvent):
     PAR1 = 'par1'
@@ -106,5 +178,16 @@ class PatchTypeEventTestCase(unittest.TestCase):
                                (params[NAPatchTypeEvent.PAR1] + params[NAPatchTypeEvent.PAR2]))
 
 
+    def test_calculate_rates(self):
+        params = {p: 0.5 for p in self.event_type1.parameter_keys() + self.event_type2.parameter_keys()}
+        self.event_type1.set_parameters(params)
+        self.network.node[1][Environment.COMPARTMENTS][compartments[0]] = 10
+        self.network.node[2][Environment.COMPARTMENTS][compartments[0]] = 9
+        network_arrays = NetworkArrays(self.network, [1, 2])
+        # Zero at the patch of the other type
+        numpy.testing.assert_array_almost_equal(self.event_type1.calculate_rates(network_arrays, numpy.arange(2)),
+                                                [0.5 * 10 * (0.5 + 0.5), 0.0])
+
+
 if __name__ == '__main__':
     unittest.main()
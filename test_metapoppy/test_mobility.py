@@ -0,0 +1,41 @@
+import unittest
+from metapoppy import *
+
+
+class MobilityKernelTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.network = Environment(['a'], ['mass'], ['distance'])
+        self.network.add_nodes_from(range(1, 5))
+        self.network.add_edges_from([(1, 2), (1, 3), (1, 4)])
+        self.network.reset()
+        for n, m in [(1, 10.0), (2, 2.0), (3, 4.0), (4, 8.0)]:
+            self.network.update_patch(n, attribute_changes={'mass': m})
+        for n, d in [(2, 1.0), (3, 2.0), (4, 2.0)]:
+            self.network.update_edge(1, n, {'distance': d})
+
+    def test_uniform(self):
+        self.assertEqual(MobilityKernel().weights(self.network, 1, [2, 3, 4]), [1.0, 1.0, 1.0])
+
+    def test_gravity(self):
+        kernel = GravityKernel('mass', 'distance')
+        self.assertEqual(kernel.patch_attributes(), ['mass'])
+        self.assertEqual(kernel.edge_attributes(), ['distance'])
+        self.assertEqual(kernel.weights(self.network, 1, [2, 3, 4]), [2.0, 1.0, 2.0])
+
+        kernel = GravityKernel('mass', mass_exponent=2)
+        self.assertEqual(kernel.edge_attributes(), [])
+        self.assertEqual(kernel.weights(self.network, 1, [2, 3, 4]), [4.0, 16.0, 64.0])
+
+    def test_radiation(self):
+        kernel = RadiationKernel('mass', 'distance')
+        weights = kernel.weights(self.network, 1, [2, 3, 4])
+        # Patch 2 is nearest - nothing intervenes
+        self.assertAlmostEqual(weights[0], (10.0 * 2) / (10 * (10 + 2)))
+        # Patches 3 and 4 are equidistant - only patch 2 intervenes
+        self.assertAlmostEqual(weights[1], (10.0 * 4) / ((10 + 2) * (10 + 4 + 2)))
+        self.assertAlmostEqual(weights[2], (10.0 * 8) / ((10 + 2) * (10 + 8 + 2)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -43,6 +43,79 @@ class NetworkTestCase(unittest.TestCase):
         # Multiple compartments
         self.assertEqual(self.network.get_compartment_value(1, self.compartments[0:2]), 101)
 
+    def test_compartment_groups(self):
+        self.network.add_nodes_from([1, 2])
+        self.network.reset()
+        self.network.update_patch(1, {'a': 3, 'b': 4})
+        # Group added after patches have values
+        self.network.add_compartment_group('a+b', ['a', 'b'])
+        self.assertEqual(self.network.get_compartment_value(1, 'a+b'), 7)
+        self.assertEqual(self.network.get_group_total('a+b'), 7)
+        # Same group again is ignored, but not with different compartments
+        self.network.add_compartment_group('a+b', ['b', 'a'])
+        with self.assertRaises(AssertionError):
+            self.network.add_compartment_group('a+b', ['a', 'c'])
+        with self.assertRaises(AssertionError):
+            self.network.add_compartment_group('a', ['a', 'c'])
+
+        # Maintained by updates
+        self.network.add_compartment_group('b+c', ['b', 'c'])
+        self.network.update_patch(1, {'b': -1, 'c': 5})
+        self.network.update_patch(2, {'a': 2})
+        self.assertEqual(self.network.get_compartment_value(1, 'a+b'), 6)
+        self.assertEqual(self.network.get_compartment_value(1, 'b+c'), 8)
+        self.assertEqual(self.network.get_compartment_value(2, 'a+b'), 2)
+        self.assertEqual(self.network.get_compartment_value(2, 'b+c'), 0)
+        self.assertEqual(self.network.get_group_total('a+b'), 8)
+        self.assertEqual(self.network.get_group_total('b+c'), 8)
+
+        # Cleared by reset
+        self.network.reset()
+        self.assertEqual(self.network.get_compartment_value(1, 'a+b'), 0)
+        self.assertEqual(self.network.get_group_total('b+c'), 0)
+
+    def test_neighbour_tables(self):
+        self.network.add_nodes_from(range(1, 6))
+        self.network.add_edges_from([(1, 2), (1, 3), (1, 4), (2, 3)])
+        self.network.reset()
+        self.assertItemsEqual(self.network.neighbours(1), [2, 3, 4])
+        self.assertItemsEqual(self.network.neighbours(3), [1, 2])
+        self.assertEqual(self.network.neighbours(5), [])
+        self.assertEqual(self.network.patch_degree(1), 3)
+        self.assertEqual(self.network.patch_degree(4), 1)
+        self.assertEqual(self.network.patch_degree(5), 0)
+
+        # Uniform movement
+        numpy.random.seed(101)
+        counts = {2: 0, 3: 0, 4: 0}
+        for _ in range(3000):
+            counts[self.network.choose_neighbour(1)] += 1
+        for n in counts:
+            self.assertAlmostEqual(counts[n] / 3000.0, 1 / 3.0, 1)
+        self.assertIsNone(self.network.choose_neighbour(5))
+
+    def test_mobility_kernel(self):
+        self.network.add_nodes_from(range(1, 4))
+        self.network.add_edges_from([(1, 2), (1, 3)])
+        self.network.reset()
+        self.network.set_mobility_kernel(GravityKernel('d'))
+        # No mass anywhere, so no destination
+        self.assertIsNone(self.network.choose_neighbour(1))
+
+        self.network.update_patch(2, attribute_changes={'d': 1.0})
+        self.assertEqual(self.network.choose_neighbour(1), 2)
+        # Mass change at a neighbour rebuilds the table
+        self.network.update_patch(3, attribute_changes={'d': 3.0})
+        numpy.random.seed(101)
+        counts = {2: 0, 3: 0}
+        for _ in range(4000):
+            counts[self.network.choose_neighbour(1)] += 1
+        self.assertAlmostEqual(counts[3] / 4000.0, 0.75, 1)
+        # Other attributes leave the table alone
+        sampler = self.network._mobility_samplers[1]
+        self.network.update_patch(2, attribute_changes={'e': 1.0})
+        self.assertIs(self.network._mobility_samplers[1], sampler)
+
     def test_get_attribute_value(self):
         self.network.add_node(1)
         self.network.reset()
@@ -101,6 +174,90 @@ class NetworkTestCase(unittest.TestCase):
         self.assertItemsEqual(self.check_value[0][2], [self.edge_attributes[0], self.edge_attributes[1]])
 
 
+    def test_transaction(self):
+        patch_updates = []
+        edge_updates = []
+        self.network.add_nodes_from([1, 2])
+        self.network.add_edge(1, 2)
+        self.network.reset()
+        self.network.set_handlers(lambda p, c, a: patch_updates.append([p, c, a]),
+                                  lambda u, v, a: edge_updates.append([u, v, a]))
+
+        with self.network.transaction():
+            self.network.update_patch(1, {'a': 2})
+            self.network.update_patch(1, {'b': 1}, {'d': 1.0})
+            self.network.update_patch(2, {'a': 1})
+            self.network.update_patch(2, {'a': -1})
+            self.network.update_edge(2, 1, {'g': 1.0})
+            self.network.update_edge(1, 2, {'h': 2.0})
+            # Changes applied immediately but not propagated
+            self.assertEqual(self.network.get_compartment_value(1, 'a'), 2)
+            self.assertTrue(self.network.in_transaction())
+            self.assertFalse(patch_updates)
+            self.assertFalse(edge_updates)
+        self.assertFalse(self.network.in_transaction())
+
+        # Each patch/edge notified once with the union of its net changes (patch 2 has no net change)
+        self.assertEqual(len(patch_updates), 1)
+        self.assertEqual(patch_updates[0][0], 1)
+        self.assertItemsEqual(patch_updates[0][1], ['a', 'b'])
+        self.assertItemsEqual(patch_updates[0][2], ['d'])
+        self.assertEqual(len(edge_updates), 1)
+        self.assertItemsEqual(edge_updates[0][2], ['g', 'h'])
+
+    def test_transaction_change_set_handler(self):
+        change_sets = []
+        self.network.add_nodes_from([1, 2])
+        self.network.add_edge(1, 2)
+        self.network.reset()
+        self.network.set_handlers(None, None, lambda p, e: change_sets.append([p, e]))
+
+        with self.network.transaction():
+            self.network.update_patch(1, {'a': 2})
+            # Nested transaction is part of the outer one
+            with self.network.transaction():
+                self.network.update_patch(2, attribute_changes={'e': 1.0})
+            self.network.update_edge(1, 2, {'g': 1.0})
+        self.assertEqual(len(change_sets), 1)
+        patch_changes, edge_changes = change_sets[0]
+        self.assertEqual(patch_changes, {1: (['a'], []), 2: ([], ['e'])})
+        self.assertEqual(edge_changes, {(1, 2): ['g']})
+
+    def test_transaction_rollback(self):
+        patch_updates = []
+        self.network.add_nodes_from([1, 2])
+        self.network.add_edge(1, 2)
+        self.network.reset()
+        self.network.add_compartment_group('a+b', ['a', 'b'])
+        self.network.update_patch(1, {'a': 1})
+        self.network.set_handlers(lambda p, c, a: patch_updates.append([p, c, a]), None)
+
+        # Compartments may drop below zero within the transaction, but not on commit
+        with self.network.transaction():
+            self.network.update_patch(1, {'a': -2})
+            self.network.update_patch(1, {'a': 3})
+        self.assertEqual(self.network.get_compartment_value(1, 'a'), 2)
+        with self.assertRaises(ValueError):
+            with self.network.transaction():
+                self.network.update_patch(1, {'a': -3, 'b': 1}, {'d': 1.0})
+                self.network.update_edge(1, 2, {'g': 1.0})
+        self.assertEqual(self.network.get_compartment_value(1, 'a'), 2)
+        self.assertEqual(self.network.get_compartment_value(1, 'b'), 0)
+        self.assertEqual(self.network.get_compartment_value(1, 'a+b'), 2)
+        self.assertEqual(self.network.get_attribute_value(1, 'd'), 0.0)
+        self.assertEqual(self.network.get_edge_data(1, 2)['g'], 0.0)
+        self.assertFalse(self.network.in_transaction())
+
+        # Other failures roll back too, and are raised
+        with self.assertRaises(KeyError):
+            with self.network.transaction():
+                self.network.update_patch(2, {'a': 5})
+                self.network.update_patch(2, {'z': 1})
+        self.assertEqual(self.network.get_compartment_value(2, 'a'), 0)
+        self.assertEqual(len(patch_updates), 1)
+
+
+
 class TypedNetworkTestCase(unittest.TestCase):
 
     def setUp(self):
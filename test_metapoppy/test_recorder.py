@@ -0,0 +1,179 @@
+import unittest
+from metapoppy import *
+import numpy
+import os
+import json
+import shutil
+import tempfile
+
+
+class ResultRecorderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.network = TypedEnvironment(['a', 'b'], {'x': ['d'], 'y': ['e']}, ['g'])
+        self.network.add_nodes_from([1, 2, 3])
+        self.network.set_patch_type(1, 'x')
+        self.network.set_patch_type(2, 'y')
+        self.network.set_patch_type(3, 'y')
+        self.network.add_edges_from([(1, 2), (2, 3)])
+        self.network.reset()
+        self.recorder = ResultRecorder(chunk_size=2)
+        self.recorder.reset(self.network)
+
+    def test_record(self):
+        self.network.update_patch(1, {'a': 3}, {'d': 0.5})
+        self.recorder.record(0.0, self.network, [1])
+        self.network.update_patch(1, {'b': 1})
+        self.network.update_patch(2, {'a': 2}, {'e': 1.5})
+        # Patches activating mid-run are added as columns, and the arrays grow beyond the chunk size
+        for t in [1.0, 2.0, 3.0]:
+            self.recorder.record(t, self.network, [1, 2, 3])
+
+        numpy.testing.assert_array_equal(self.recorder.times(), [0.0, 1.0, 2.0, 3.0])
+        self.assertEqual(self.recorder.patches(), [1, 2, 3])
+        self.assertEqual(self.recorder.compartments(), ['a', 'b'])
+        self.assertItemsEqual(self.recorder.patch_attributes(), ['d', 'e'])
+        self.assertEqual(self.recorder.compartment_values().shape, (4, 3, 2))
+        numpy.testing.assert_array_equal(self.recorder.compartment_values()[:, 0], [[3, 0], [3, 1], [3, 1], [3, 1]])
+        numpy.testing.assert_array_equal(self.recorder.recorded()[:, 1], [False, True, True, True])
+        d, e = self.recorder.patch_attributes().index('d'), self.recorder.patch_attributes().index('e')
+        self.assertTrue(numpy.isnan(self.recorder.attribute_values()[1, 1, d]))
+        self.assertEqual(self.recorder.attribute_values()[1, 1, e], 1.5)
+        # Static data stored once
+        self.assertEqual(self.recorder.patch_data(2), {TypedEnvironment.PATCH_TYPE: 'y'})
+
+        results = self.recorder.results()
+        self.assertItemsEqual(results.keys(), [0.0, 1.0, 2.0, 3.0])
+        self.assertEqual(results[0.0].keys(), [1])
+        self.assertEqual(results[0.0][1], {TypedEnvironment.PATCH_TYPE: 'x',
+                                           Environment.COMPARTMENTS: {'a': 3, 'b': 0},
+                                           Environment.ATTRIBUTES: {'d': 0.5}})
+        self.assertEqual(results[3.0][2], {TypedEnvironment.PATCH_TYPE: 'y',
+                                           Environment.COMPARTMENTS: {'a': 2, 'b': 0},
+                                           Environment.ATTRIBUTES: {'e': 1.5}})
+        # Compartment values are counts
+        self.assertEqual(self.recorder.compartment_values().dtype.kind, 'i')
+        self.assertIs(type(results[3.0][2][Environment.COMPARTMENTS]['a']), int)
+
+    def test_grow(self):
+        # Arrays double in size as times are recorded
+        capacities = []
+        for t in range(9):
+            self.recorder.record(float(t), self.network, [1])
+            capacities.append(self.recorder._recorded.shape[0])
+        self.assertEqual(capacities, [2, 2, 4, 4, 8, 8, 8, 8, 16])
+        self.recorder.record(9.0, self.network, [1, 2, 3])
+        self.assertEqual(self.recorder._recorded.shape, (16, 4))
+        numpy.testing.assert_array_equal(self.recorder.times(), range(10))
+
+    def test_record_edges(self):
+        self.recorder.set_record_edges(True)
+        self.recorder.reset(self.network)
+        self.network.update_edge(1, 2, {'g': 4.0})
+        self.recorder.record(0.0, self.network, [1])
+        self.assertEqual(self.recorder.edge_values().shape, (1, 2, 1))
+        edges = self.recorder.results()[0.0][ResultRecorder.EDGES]
+        self.assertItemsEqual([(min(u, v), max(u, v), d['g']) for u, v, d in edges], [(1, 2, 4.0), (2, 3, 0.0)])
+
+    def test_projection(self):
+        self.network.add_compartment_group('total', ['a', 'b'])
+        projection = OutputProjection().select('y', compartments=['b'], compartment_groups={'total': ['a', 'b']},
+                                               patch_attributes=[])
+        self.assertEqual(projection.compartment_groups(), {'total': ['a', 'b']})
+        self.recorder.set_projection(projection)
+        self.recorder.reset(self.network)
+        self.network.update_patch(2, {'a': 2, 'b': 1})
+        self.recorder.record(0.0, self.network, [1, 2])
+
+        # Patch of type x not recorded
+        self.assertEqual(self.recorder.patches(), [2])
+        self.assertEqual(self.recorder.compartments(), ['b', 'total'])
+        self.assertEqual(self.recorder.patch_attributes(), [])
+        self.assertEqual(self.recorder.results()[0.0], {2: {TypedEnvironment.PATCH_TYPE: 'y',
+                                                            Environment.COMPARTMENTS: {'b': 1, 'total': 3},
+                                                            Environment.ATTRIBUTES: {}}})
+
+
+class DeltaRecorderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.network = TypedEnvironment(['a', 'b'], {'x': ['d'], 'y': ['e']}, ['g'])
+        self.network.add_nodes_from([1, 2, 3])
+        self.network.set_patch_type(1, 'x')
+        self.network.set_patch_type(2, 'y')
+        self.network.set_patch_type(3, 'y')
+        self.network.add_edges_from([(1, 2), (2, 3)])
+        self.network.reset()
+
+    def test_same_as_full(self):
+        full = ResultRecorder(record_edges=True, chunk_size=2)
+        delta = DeltaRecorder(record_edges=True, chunk_size=2, keyframe_interval=3)
+        for recorder in [full, delta]:
+            recorder.reset(self.network)
+        numpy.random.seed(7)
+        for t in range(10):
+            patch = [1, 2, 3][t % 3]
+            self.network.update_patch(patch, {'a': numpy.random.randint(3)})
+            if t == 4:
+                self.network.update_patch(2, attribute_changes={'e': 2.5})
+                self.network.update_edge(1, 2, {'g': 1.0})
+            active = [1] if t < 3 else ([1, 2] if t < 6 else [1, 2, 3])
+            for recorder in [full, delta]:
+                recorder.record(float(t), self.network, active)
+
+        numpy.testing.assert_array_equal(delta.times(), full.times())
+        numpy.testing.assert_array_equal(delta.compartment_values(), full.compartment_values())
+        numpy.testing.assert_array_equal(delta.attribute_values(), full.attribute_values())
+        numpy.testing.assert_array_equal(delta.recorded(), full.recorded())
+        numpy.testing.assert_array_equal(delta.edge_values(), full.edge_values())
+        self.assertEqual(delta.results(), full.results())
+        for index in range(10):
+            self.assertEqual(delta.snapshot(index), full.snapshot(index))
+        self.assertLess(delta.nbytes(), full.nbytes())
+
+
+class ResultStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.network = Environment(['a', 'b'], ['d'], ['g'])
+        self.network.add_nodes_from([1, 2])
+        self.network.add_edge(1, 2)
+        self.network.reset()
+        self.store = ResultStore(self.directory, queue_size=1)
+        self.recorder = ResultRecorder(chunk_size=2, store=self.store)
+        self.recorder.reset(self.network)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_write(self):
+        for t in range(5):
+            self.network.update_patch(1, {'a': 1})
+            self.recorder.record(float(t), self.network, [1] if t < 3 else [1, 2])
+            # Only one chunk held in memory
+            self.assertLessEqual(len(self.recorder.times()), 2)
+        results = self.recorder.results()
+        path = results[ResultStore.STORE]
+        self.assertEqual(os.path.dirname(path), self.directory)
+
+        with open(os.path.join(path, ResultStore.INDEX_FILENAME)) as index_file:
+            index = json.load(index_file)
+        self.assertTrue(index[ResultStore.COMPLETE])
+        self.assertEqual(index[ResultStore.COMPARTMENTS], ['a', 'b'])
+        self.assertEqual(index[ResultStore.PATCHES], [1, 2])
+        self.assertEqual([n for _, n in index[ResultStore.CHUNKS]], [2, 2, 1])
+
+        chunks = [{name: numpy.load(os.path.join(path, ResultStore.ARRAY_FILENAME.format(c, name)))
+                   for name in [ResultStore.TIMES, ResultStore.COMPARTMENT_VALUES, ResultStore.RECORDED]}
+                  for c, _ in index[ResultStore.CHUNKS]]
+        numpy.testing.assert_array_equal(numpy.concatenate([c[ResultStore.TIMES] for c in chunks]), range(5))
+        # Patch 2 added as a column part way through
+        self.assertEqual(chunks[0][ResultStore.COMPARTMENT_VALUES].shape, (2, 1, 2))
+        numpy.testing.assert_array_equal(chunks[1][ResultStore.COMPARTMENT_VALUES][:, :, 0], [[3, 0], [4, 0]])
+        numpy.testing.assert_array_equal(chunks[1][ResultStore.RECORDED], [[True, False], [True, True]])
+        numpy.testing.assert_array_equal(chunks[2][ResultStore.COMPARTMENT_VALUES][:, 0, 0], [5])
+
+
+if __name__ == '__main__':
+    unittest.main()
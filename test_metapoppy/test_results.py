@@ -0,0 +1,143 @@
+import unittest
+from metapoppy import *
+import metapoppy.results
+import numpy
+import json
+import os
+import shutil
+import tempfile
+
+
+class StoredRunTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.network = Environment(['a', 'b'], ['d'], [])
+        self.network.add_nodes_from([1, 2])
+        self.network.reset()
+        recorder = ResultRecorder(chunk_size=2, store=ResultStore(self.directory))
+        recorder.reset(self.network)
+        for t in range(5):
+            self.network.update_patch(1, {'a': 1}, {'d': 0.5})
+            if t == 3:
+                self.network.update_patch(2, {'b': 4})
+            recorder.record(float(t), self.network, [1] if t < 3 else [1, 2])
+        self.path = recorder.results()[ResultStore.STORE]
+        self.run = StoredRun(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_index(self):
+        self.assertTrue(self.run.is_complete())
+        self.assertEqual(len(self.run), 5)
+        numpy.testing.assert_array_equal(self.run.times(), range(5))
+        self.assertEqual(self.run.patches(), [1, 2])
+        self.assertEqual(self.run.compartments(), ['a', 'b'])
+
+    def test_compartment_values(self):
+        values = self.run.compartment_values()
+        self.assertEqual(values.shape, (5, 2, 2))
+        numpy.testing.assert_array_equal(values[:, 0, 0], [1, 2, 3, 4, 5])
+        # Patch 2 not active in the first chunk
+        numpy.testing.assert_array_equal(values[:, 1, 1], [0, 0, 0, 4, 4])
+
+        # Within one chunk, a single compartment is a view of the memory-mapped file
+        view = self.run.compartment_values('a', start=2, stop=4)
+        self.assertIsInstance(view.base, numpy.memmap)
+        numpy.testing.assert_array_equal(view, [[3, 0], [4, 0]])
+
+        numpy.testing.assert_array_equal(self.run.compartment_values(['b'], patches=[2], start=1)[:, 0, 0],
+                                         [0, 0, 4, 4])
+        numpy.testing.assert_array_equal(self.run.recorded(patches=[2]), [[False], [False], [False], [True], [True]])
+        numpy.testing.assert_array_equal(self.run.attribute_values('d', patches=[1], stop=2), [[0.5], [1.0]])
+        self.assertEqual(self.run.compartment_values('a', start=5).shape, (0, 2))
+
+    def test_result_set(self):
+        # epyc output with two repetitions of one sample, one written to the store and one held in the results
+        in_memory = {'0.0': {'1': {Environment.COMPARTMENTS: {'a': 1, 'b': 0}}}}
+        epyc_results = {'results': {'sample': [{'parameters': {'x': 1}, 'results': {ResultStore.STORE: self.path}},
+                                               {'parameters': {'x': 1}, 'results': in_memory}]}}
+        filename = os.path.join(self.directory, 'results.json')
+        with open(filename, 'w') as json_file:
+            json.dump(epyc_results, json_file)
+
+        result_set = MetapoppyResultSet(filename)
+        self.assertEqual(result_set.repetitions, 2)
+        self.assertIsInstance(result_set.run(0, 0), StoredRun)
+        self.assertEqual(result_set.run(0, 0).parameters, {'x': 1})
+        self.assertIsInstance(result_set.run(0, 1), MetapoppyOutput)
+        times, data = result_set.all_data_by_compartments()[0][1]
+        self.assertEqual(times, range(5))
+        self.assertEqual(data['b'][2], [0, 0, 0, 4, 4])
+
+    def test_long_format(self):
+        in_memory = {'0.0': {'1': {Environment.COMPARTMENTS: {'a': 1, 'b': 0}, TypedEnvironment.PATCH_TYPE: 'x'}},
+                     '1.0': {'1': {Environment.COMPARTMENTS: {'a': 2, 'b': 3}, TypedEnvironment.PATCH_TYPE: 'x'},
+                             '2': {Environment.COMPARTMENTS: {'a': 5}, TypedEnvironment.PATCH_TYPE: 'y'}}}
+        runs = [[StoredRun(self.path)], [MetapoppyOutput({'parameters': {}, 'results': in_memory})]]
+
+        columns = long_format(runs, as_data_frame=False)
+        self.assertEqual(sorted(columns.keys()), sorted(MetapoppyResultSet.LONG_FORMAT_COLUMNS))
+        # Stored run: patch 1 at 5 times and patch 2 at 2 times, with 2 compartments. In memory: 5 values.
+        self.assertEqual(len(columns[MetapoppyResultSet.VALUE]), 19)
+        rows = zip(*[columns[k].tolist() for k in MetapoppyResultSet.LONG_FORMAT_COLUMNS])
+        self.assertEqual(rows[:2], [(0, 0, 0.0, 1, None, 'a', 1.0), (0, 0, 0.0, 1, None, 'b', 0.0)])
+        self.assertIn((0, 0, 3.0, 2, None, 'b', 4.0), rows)
+        self.assertEqual(rows[14:], [(1, 0, 0.0, '1', 'x', 'a', 1.0), (1, 0, 0.0, '1', 'x', 'b', 0.0),
+                                     (1, 0, 1.0, '1', 'x', 'a', 2.0), (1, 0, 1.0, '1', 'x', 'b', 3.0),
+                                     (1, 0, 1.0, '2', 'y', 'a', 5.0)])
+
+        columns = long_format(runs, compartments=['b'], as_data_frame=False)
+        self.assertEqual(set(columns[MetapoppyResultSet.COMPARTMENT]), {'b'})
+        numpy.testing.assert_array_equal(columns[MetapoppyResultSet.VALUE], [0, 0, 0, 0, 4, 0, 4, 0, 3])
+
+        empty = long_format([], as_data_frame=False)
+        self.assertEqual(empty[MetapoppyResultSet.SAMPLE].dtype, numpy.int64)
+        self.assertEqual(len(empty[MetapoppyResultSet.TIME]), 0)
+
+    def test_long_format_stored_compartments(self):
+        selected = []
+
+        class SelectingStoredRun(StoredRun):
+            def compartment_values(self, compartments=None, patches=None, start=0, stop=None):
+                selected.append(compartments)
+                return StoredRun.compartment_values(self, compartments, patches, start, stop)
+
+        network = Environment(['a', 'b', 'c'], [], [])
+        network.add_nodes_from([1])
+        network.reset()
+        recorder = ResultRecorder(chunk_size=2, store=ResultStore(self.directory))
+        recorder.reset(network)
+        for t in range(5):
+            network.update_patch(1, {'c': 2})
+            recorder.record(float(t), network, [1])
+        run = SelectingStoredRun(recorder.results()[ResultStore.STORE])
+        self.assertEqual(len(run._chunks), 3)
+
+        columns = long_format([[run]], compartments=['c'], as_data_frame=False)
+        # Chunks are read for the selected compartment only
+        self.assertEqual(selected, [['c']])
+        self.assertEqual(set(columns[MetapoppyResultSet.COMPARTMENT]), {'c'})
+        numpy.testing.assert_array_equal(columns[MetapoppyResultSet.TIME], range(5))
+        numpy.testing.assert_array_equal(columns[MetapoppyResultSet.VALUE], [2, 4, 6, 8, 10])
+
+    @unittest.skipIf(metapoppy.results.pandas is None, "pandas not installed")
+    def test_long_format_data_frame(self):
+        frame = long_format([[StoredRun(self.path)]])
+        self.assertEqual(list(frame.columns), MetapoppyResultSet.LONG_FORMAT_COLUMNS)
+        self.assertEqual(len(frame), 14)
+        self.assertEqual(frame[frame[MetapoppyResultSet.PATCH] == 2][MetapoppyResultSet.VALUE].sum(), 8)
+
+    def test_long_format_without_pandas(self):
+        installed = metapoppy.results.pandas
+        metapoppy.results.pandas = None
+        try:
+            self.assertIsInstance(long_format([[StoredRun(self.path)]]), dict)
+            self.assertRaises(ImportError, long_format, [[StoredRun(self.path)]], None, True)
+        finally:
+            metapoppy.results.pandas = installed
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+from metapoppy import *
+import numpy
+
+
+class FenwickSamplerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.sampler = FenwickSampler()
+
+    def test_set_weight(self):
+        self.assertEqual(len(self.sampler), 0)
+        self.assertEqual(self.sampler.total(), 0)
+
+        self.sampler.set_weight('a', 2.0)
+        self.sampler.set_weight('b', 3.0)
+        self.assertEqual(self.sampler.keys(), ['a', 'b'])
+        self.assertTrue('a' in self.sampler)
+        self.assertFalse('c' in self.sampler)
+        self.assertEqual(self.sampler.total(), 5.0)
+
+        self.sampler.set_weight('a', 0.5)
+        self.assertEqual(self.sampler.weight('a'), 0.5)
+        self.assertEqual(self.sampler.total(), 3.5)
+
+        with self.assertRaises(AssertionError):
+            self.sampler.set_weight('a', -1)
+
+        self.sampler.clear()
+        self.assertEqual(len(self.sampler), 0)
+        self.assertEqual(self.sampler.total(), 0)
+
+    def test_grow(self):
+        # Beyond the initial capacity
+        n = FenwickSampler.INITIAL_CAPACITY * 3 + 1
+        for i in range(n):
+            self.sampler.set_weight(i, i)
+        self.assertEqual(self.sampler.total(), sum(range(n)))
+        self.sampler.set_weight(5, 0)
+        self.assertEqual(self.sampler.total(), sum(range(n)) - 5)
+
+    def test_sample(self):
+        weights = [1.0, 0.0, 2.0, 0.0, 3.0]
+        for i, w in enumerate(weights):
+            self.sampler.set_weight(i, w)
+
+        # Given values select by cumulative weight
+        self.assertEqual(self.sampler.sample(0.0), 0)
+        self.assertEqual(self.sampler.sample(0.99), 0)
+        self.assertEqual(self.sampler.sample(1.0), 2)
+        self.assertEqual(self.sampler.sample(2.99), 2)
+        self.assertEqual(self.sampler.sample(3.0), 4)
+        self.assertEqual(self.sampler.sample(5.99), 4)
+        # Rounding beyond the total picks the last key with weight
+        self.assertEqual(self.sampler.sample(6.0), 4)
+
+        # Random draws follow the weights
+        numpy.random.seed(101)
+        counts = [0] * len(weights)
+        for _ in range(6000):
+            counts[self.sampler.sample()] += 1
+        self.assertEqual(counts[1], 0)
+        self.assertEqual(counts[3], 0)
+        for i in [0, 2, 4]:
+            self.assertAlmostEqual(counts[i] / 6000.0, weights[i] / 6.0, 1)
+
+
+
+class AliasSamplerTestCase(unittest.TestCase):
+
+    def test_initialise(self):
+        sampler = AliasSampler(['a', 'b', 'c'], [1, 0, 3])
+        self.assertEqual(sampler.keys(), ['a', 'b', 'c'])
+        self.assertEqual(sampler.weight('c'), 3)
+        with self.assertRaises(AssertionError):
+            AliasSampler(['a', 'b'], [1])
+        with self.assertRaises(AssertionError):
+            AliasSampler(['a', 'b'], [0, 0])
+
+    def test_sample(self):
+        weights = [0.1, 0.0, 0.5, 0.15, 0.25]
+        sampler = AliasSampler(range(len(weights)), weights)
+        numpy.random.seed(101)
+        counts = [0] * len(weights)
+        for _ in range(10000):
+            counts[sampler.sample()] += 1
+        self.assertEqual(counts[1], 0)
+        for i, w in enumerate(weights):
+            self.assertAlmostEqual(counts[i] / 10000.0, w, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+from metapoppy import *
+
+
+class SummaryStatisticTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.network = TypedEnvironment(['a', 'b'], {'x': [], 'y': []}, [])
+        self.network.add_nodes_from([1, 2, 3])
+        self.network.set_patch_type(1, 'x')
+        self.network.set_patch_type(2, 'x')
+        self.network.set_patch_type(3, 'y')
+        self.network.reset()
+        self.network.update_patch(1, {'a': 2})
+
+    def run_changes(self, statistics):
+        for s in statistics:
+            for group, compartments in s.compartment_groups().iteritems():
+                self.network.add_compartment_group(group, compartments)
+            s.reset(0.0, self.network, [1])
+        for time, patch_id, changes in [(1.0, 2, {'a': 5}), (3.0, 1, {'a': -2, 'b': 1}), (4.0, 3, {'b': 7})]:
+            for s in statistics:
+                s.advance(time, self.network)
+            self.network.update_patch(patch_id, changes)
+            for s in statistics:
+                s.patch_changed(time, self.network, patch_id, changes.keys())
+        for s in statistics:
+            s.advance(5.0, self.network)
+
+    def test_compartment_total(self):
+        total_a = CompartmentTotal('total_a', 'a')
+        total_ab_x = CompartmentTotal('total_ab_x', ['a', 'b'], patch_type='x')
+        self.run_changes([total_a, total_ab_x])
+        self.assertEqual(total_a.name(), 'total_a')
+        self.assertEqual(total_a.value(), 5)
+        self.assertEqual(total_ab_x.value(), 6)
+
+    def test_patch_count(self):
+        count = PatchCount('count', ['a', 'b'])
+        self.run_changes([count])
+        self.assertEqual(count.value(), 3)
+
+    def test_maximum(self):
+        maximum = MaximumPatchValue('max', 'a')
+        maximum_y = MaximumPatchValue('max_y', 'b', patch_type='y')
+        self.run_changes([maximum, maximum_y])
+        self.assertEqual(maximum.value(), 5)
+        self.assertEqual(maximum_y.value(), 7)
+
+    def test_first_passage(self):
+        first = FirstPassageTime('first', 'b')
+        first_y = FirstPassageTime('first_y', 'b', patch_type='y')
+        never = FirstPassageTime('never', 'a', threshold=10)
+        self.run_changes([first, first_y, never])
+        self.assertEqual(first.value(), 3.0)
+        self.assertEqual(first_y.value(), 4.0)
+        self.assertIsNone(never.value())
+
+    def test_time_weighted_average(self):
+        average = TimeWeightedAverage('average', CompartmentTotal('total_a', 'a'))
+        self.run_changes([average])
+        # a is 2 for 1 time unit, 7 for 2, then 5 for 2
+        self.assertAlmostEqual(average.value(), (2 * 1 + 7 * 2 + 5 * 2) / 5.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+import numpy
+from metapoppydemic import *
+from metapoppydemic.events.mccormacktranslocate import McCormackInfection as McCormackTranslocate
+from metapoppy.networkarrays import NetworkArrays
+
+
+class McCormackEmptyPatchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.comps = ['s', 'i', 'r']
+        self.network = McCormackEnvironment(self.comps)
+        self.events = [McCormackInfection('s', 'i', self.comps), McCormackTranslocate('s', 'i', self.comps)]
+        for e in self.events:
+            e.set_parameters({e.parameter_keys()[0]: 0.5})
+            for group, compartments in e.get_compartment_groups().iteritems():
+                self.network.add_compartment_group(group, compartments)
+        self.network.reset()
+        for n in self.network.nodes():
+            self.network.update_patch(n, attribute_changes={McCormackEnvironment.INFECTION_LAMBDA: 2.0})
+        # Patch 1 is left empty
+        self.network.update_patch(2, {'s': 3, 'i': 1})
+
+    def test_rates_scalar_and_vectorised(self):
+        patches = [1, 2]
+        for e in self.events:
+            rates = e.calculate_rates(NetworkArrays(self.network, patches), numpy.arange(2))
+            self.assertEqual(e.calculate_rate_at_patch(self.network, 1), 0)
+            self.assertEqual(rates[0], 0)
+            for i in range(2):
+                self.assertAlmostEqual(rates[i], e.calculate_rate_at_patch(self.network, patches[i]))
+        self.assertAlmostEqual(self.events[0].calculate_rate_at_patch(self.network, 2), 0.5 * (2.0 / 4) * 3 * 1)
+        self.assertAlmostEqual(self.events[1].calculate_rate_at_patch(self.network, 2), 0.5 * (2.0 / 4))
+
+
+if __name__ == '__main__':
+    unittest.main()
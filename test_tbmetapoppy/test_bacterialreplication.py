@@ -1,6 +1,8 @@
 import unittest
+import numpy
 from tbmetapoppy import *
 from metapoppy.environment import Environment
+from metapoppy.networkarrays import NetworkArrays
 
 
 class ReplicationTestCase(unittest.TestCase):
@@ -63,6 +65,18 @@ class IntracellularBacterialReplicationTestCase(unittest.TestCase):
                         18 ** self.params[INTRACELLULAR_REPLICATION_SIGMOID] + (5 * self.params[MACROPHAGE_CAPACITY])
                         ** self.params[INTRACELLULAR_REPLICATION_SIGMOID]))))
 
+    def test_rates_vectorised(self):
+        self.network.add_edge(2, TBPulmonaryEnvironment.LYMPH_PATCH)
+        self.network.set_patch_type(2, TBPulmonaryEnvironment.ALVEOLAR_PATCH)
+        self.network.reset()
+        self.network.update_patch(1, {TBPulmonaryEnvironment.BACTERIUM_INTRACELLULAR_MACROPHAGE: 18,
+                                      TBPulmonaryEnvironment.MACROPHAGE_INFECTED: 5})
+        self.network.update_patch(2, {TBPulmonaryEnvironment.BACTERIUM_INTRACELLULAR_MACROPHAGE: 7})
+        patches = [1, 2, TBPulmonaryEnvironment.LYMPH_PATCH]
+        rates = self.event.calculate_rates(NetworkArrays(self.network, patches), numpy.arange(3))
+        for i in range(3):
+            self.assertAlmostEqual(rates[i], self.event.calculate_rate_at_patch(self.network, patches[i]))
+
     def test_perform(self):
         self.network.update_patch(1, {TBPulmonaryEnvironment.MACROPHAGE_INFECTED: 1,
                                       TBPulmonaryEnvironment.BACTERIUM_INTRACELLULAR_MACROPHAGE: 10})
@@ -20,6 +20,9 @@ class CellActivationTestCase(unittest.TestCase):
             e.set_parameters(self.params)
 
         self.network = TBPulmonaryEnvironment({TBPulmonaryEnvironment.TOPOLOGY: TBPulmonaryEnvironment.SINGLE_PATCH})
+        for e in [self.event_mr_t, self.event_mr_b, self.event_t]:
+            for group, compartments in e.get_compartment_groups().iteritems():
+                self.network.add_compartment_group(group, compartments)
         self.network.reset()
 
     def test_rate(self):
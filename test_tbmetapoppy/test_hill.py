@@ -0,0 +1,74 @@
+import unittest
+import numpy
+from tbmetapoppy import *
+
+
+class HillKernelTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.kernel = HillKernel(1.5, table_size=10)
+
+    def test_power(self):
+        # From the table
+        self.assertEqual(self.kernel.power(4), 4 ** 1.5)
+        # Outside the table
+        self.assertAlmostEqual(self.kernel.power(20), 20 ** 1.5)
+        self.assertAlmostEqual(self.kernel.power(2.5), 2.5 ** 1.5)
+
+    def test_saturation(self):
+        for x in [0, 1, 3, 9, 15, 2.5]:
+            self.assertAlmostEqual(self.kernel.saturation(x, self.kernel.power(3.0)),
+                                   float(x) ** 1.5 / (x ** 1.5 + 3.0 ** 1.5))
+
+    def test_negative_sigmoid(self):
+        kernel = HillKernel(-2.0)
+        self.assertAlmostEqual(kernel.saturation(4, kernel.power(2.0)), 4 ** -2.0 / (4 ** -2.0 + 2.0 ** -2.0))
+
+    def test_arrays(self):
+        x = numpy.array([0, 1, 3, 9, 15])
+        expected = [self.kernel.saturation(a, self.kernel.power(3.0)) for a in x.tolist()]
+        numpy.testing.assert_array_almost_equal(self.kernel.saturation_array(x, self.kernel.power(3.0)), expected)
+        # Both powers zero gives zero
+        k = self.kernel.power_array(numpy.array([0, 2, 0, 2, 2]))
+        numpy.testing.assert_array_almost_equal(self.kernel.saturation_array(x, k),
+                                                [0.0, 1.0 / (1 + 2 ** 1.5), 1.0, 9 ** 1.5 / (9 ** 1.5 + 2 ** 1.5),
+                                                 15 ** 1.5 / (15 ** 1.5 + 2 ** 1.5)])
+
+    def test_table_lookup(self):
+        # Mark the table, to show which powers are read from it
+        self.kernel._table = [-float(i) for i in range(10)]
+        self.kernel._table_array = -numpy.arange(10, dtype=numpy.float)
+        for x in [4, 4.0, numpy.int64(4), numpy.float64(4.0)]:
+            self.assertEqual(self.kernel.power(x), -4.0)
+        self.assertAlmostEqual(self.kernel.power(2.5), 2.5 ** 1.5)
+        # Counts held as floats (as by NetworkArrays) are looked up
+        numpy.testing.assert_array_equal(self.kernel.power_array(numpy.array([0.0, 3.0, 9.0])), [0.0, -3.0, -9.0])
+        numpy.testing.assert_array_equal(self.kernel.power_array(numpy.array([0, 3, 9])), [0.0, -3.0, -9.0])
+        # Non-integral or out of the table are calculated
+        numpy.testing.assert_array_almost_equal(self.kernel.power_array(numpy.array([3.0, 2.5])),
+                                                [3.0 ** 1.5, 2.5 ** 1.5])
+        numpy.testing.assert_array_almost_equal(self.kernel.power_array(numpy.array([3.0, 15.0])),
+                                                [3.0 ** 1.5, 15.0 ** 1.5])
+
+    def test_shared_kernels(self):
+        self.assertIs(hill_kernel(1.5), hill_kernel(1.5))
+        self.assertIsNot(hill_kernel(1.5), hill_kernel(2.5))
+
+
+class PatchAttributeHillTestCase(unittest.TestCase):
+
+    def test_cache(self):
+        network = TBPulmonaryEnvironment({TBPulmonaryEnvironment.TOPOLOGY: None})
+        network.add_node('a', patch_type=TBPulmonaryEnvironment.ALVEOLAR_PATCH)
+        network.reset()
+        network.update_patch('a', attribute_changes={TBPulmonaryEnvironment.OXYGEN_TENSION: 2.0})
+        cache = PatchAttributeHill(TBPulmonaryEnvironment.OXYGEN_TENSION)
+        kernel = hill_kernel(2.0)
+        self.assertAlmostEqual(cache.saturation(network, 'a', kernel, kernel.power(1.0)), 4.0 / 5)
+        network.update_patch('a', attribute_changes={TBPulmonaryEnvironment.OXYGEN_TENSION: -1.0})
+        self.assertAlmostEqual(cache.saturation(network, 'a', kernel, kernel.power(1.0)), 0.5)
+        self.assertAlmostEqual(cache.saturation(network, 'a', kernel, kernel.power(3.0)), 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
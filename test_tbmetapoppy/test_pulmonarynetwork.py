@@ -63,5 +63,75 @@ class PulmonaryNetworkTestCase(unittest.TestCase):
                              seeding[a][TypedEnvironment.ATTRIBUTES][TBPulmonaryEnvironment.PERFUSION])
 
 
+    def test_attribute_samplers(self):
+        params = {TBPulmonaryEnvironment.VENTILATION_SKEW: 3.5, TBPulmonaryEnvironment.PERFUSION_SKEW: 3,
+                  TBPulmonaryEnvironment.DRAINAGE_SKEW: 2}
+        seeding = self.tree_network.calculate_pulmonary_attribute_values(params)
+        alv_patch_ids = self.tree_network.get_patches_by_type(TBPulmonaryEnvironment.ALVEOLAR_PATCH)
+
+        ventilation = self.tree_network.ventilation_sampler()
+        self.assertItemsEqual(ventilation.keys(), alv_patch_ids)
+        for a in alv_patch_ids:
+            self.assertEqual(ventilation.weight(a),
+                             seeding[a][TypedEnvironment.ATTRIBUTES][TBPulmonaryEnvironment.VENTILATION])
+
+        # Perfusion table built from the seeding, kept when the edges are seeded with the same values
+        perfusion = self.tree_network.perfusion_sampler()
+        self.assertItemsEqual(perfusion.keys(), alv_patch_ids)
+        self.tree_network.reset()
+        for a in alv_patch_ids:
+            self.tree_network.update_patch(a, attribute_changes=seeding[a][TypedEnvironment.ATTRIBUTES])
+        self.assertIs(self.tree_network.perfusion_sampler(), perfusion)
+
+        # Rebuilt when perfusion changes
+        self.tree_network.update_patch(alv_patch_ids[0], attribute_changes={TBPulmonaryEnvironment.PERFUSION: 1.0})
+        new_perfusion = self.tree_network.perfusion_sampler()
+        self.assertIsNot(new_perfusion, perfusion)
+        self.assertEqual(new_perfusion.weight(alv_patch_ids[0]),
+                         seeding[alv_patch_ids[0]][TypedEnvironment.ATTRIBUTES][TBPulmonaryEnvironment.PERFUSION] + 1.0)
+        self.assertIs(self.tree_network.perfusion_sampler(), new_perfusion)
+
+    def test_infected_patches_and_cytokine(self):
+        alv_patch_ids = self.tree_network.get_patches_by_type(TBPulmonaryEnvironment.ALVEOLAR_PATCH)
+        p1, p2 = alv_patch_ids[3], alv_patch_ids[0]
+
+        # Non-bacterial change does not infect
+        self.tree_network.update_patch(p1, {TBPulmonaryEnvironment.MACROPHAGE_RESTING: 1})
+        self.assertFalse(self.tree_network.is_infected(p1))
+        self.assertEqual(self.tree_network.infected_patches(), [])
+
+        # Infected in order, and only once
+        self.tree_network.update_patch(p1, {TBPulmonaryEnvironment.BACTERIUM_EXTRACELLULAR_DORMANT: 1})
+        self.tree_network.update_patch(p2, {TBPulmonaryEnvironment.BACTERIUM_INTRACELLULAR_MACROPHAGE: 1})
+        self.tree_network.update_patch(p1, {TBPulmonaryEnvironment.BACTERIUM_EXTRACELLULAR_REPLICATING: 1})
+        self.assertEqual(self.tree_network.infected_patches(), [p1, p2])
+        self.assertTrue(self.tree_network.is_infected(p2))
+
+        # Lymph cytokine is total of cytokine on lymph edges
+        self.tree_network.update_patch(p1, {TBPulmonaryEnvironment.MACROPHAGE_INFECTED: 2})
+        self.tree_network.update_patch(p2, {TBPulmonaryEnvironment.MACROPHAGE_INFECTED: 3})
+        self.tree_network.update_patch(p1, {TBPulmonaryEnvironment.MACROPHAGE_INFECTED: -1})
+        self.assertEqual(self.tree_network.lymph_cytokine(), 4)
+        self.assertEqual(self.tree_network.lymph_cytokine(),
+                         sum(self.tree_network.get_edge_data(TBPulmonaryEnvironment.LYMPH_PATCH, n)
+                             [TBPulmonaryEnvironment.CYTOKINE] for n in alv_patch_ids))
+
+        # T-cell destinations weighted by infected macrophages x perfusion
+        self.tree_network.update_patch(p1, attribute_changes={TBPulmonaryEnvironment.PERFUSION: 0.5})
+        self.tree_network.update_patch(p2, attribute_changes={TBPulmonaryEnvironment.PERFUSION: 0.25})
+        destinations = self.tree_network.t_cell_destinations()
+        self.assertEqual(destinations.keys(), [p1, p2])
+        self.assertEqual(destinations.weight(p1), 1 * 0.5)
+        self.assertEqual(destinations.weight(p2), 3 * 0.25)
+        self.tree_network.update_patch(p1, {TBPulmonaryEnvironment.MACROPHAGE_INFECTED: 3})
+        self.assertEqual(destinations.weight(p1), 4 * 0.5)
+
+        self.tree_network.reset()
+        self.assertEqual(self.tree_network.infected_patches(), [])
+        self.assertFalse(self.tree_network.is_infected(p1))
+        self.assertEqual(self.tree_network.lymph_cytokine(), 0)
+        self.assertEqual(len(self.tree_network.t_cell_destinations()), 0)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,6 +1,8 @@
 import unittest
 from tbmetapoppy import *
+from metapoppy.recorder import ResultRecorder
 import ConfigParser
+import numpy
 
 
 class TBDynamicsTestCase(unittest.TestCase):
@@ -129,6 +131,18 @@ class TBDynamicsTestCase(unittest.TestCase):
                     e._dying_compartment == TBPulmonaryEnvironment.T_CELL_ACTIVATED]
         self.assertEqual(len(ta_death), 1)
 
+    def test_rate_tables(self):
+        # One table per patch type, containing only the events which can occur at that type
+        self.assertItemsEqual(self.dynamics._rate_table_for_type.keys(),
+                              [TBPulmonaryEnvironment.ALVEOLAR_PATCH, TBPulmonaryEnvironment.LYMPH_PATCH])
+        for patch_type, rate_table in self.dynamics._rate_table_for_type.iteritems():
+            self.assertEqual(rate_table.patch_type(), patch_type)
+            for e in self.dynamics._events:
+                self.assertEqual(e in rate_table.events(), e.applies_to_patch_type(patch_type))
+        # Every event can occur at some patch
+        for e in self.dynamics._events:
+            self.assertTrue(any(e in t.events() for t in self.dynamics._rate_tables))
+
     def configure_setUp_run(self):
 
         # TODO - check this test
@@ -165,6 +179,169 @@ class TBDynamicsTestCase(unittest.TestCase):
 
 
 
+def run_parameters():
+    """
+    Parameters for a short run, from the test config file
+    :return:
+    """
+    config = ConfigParser.ConfigParser()
+    config.read('test_config.ini')
+    params = {}
+    for section in ['Event_Parameters', 'Network_Parameters', 'Initial_Conditions']:
+        for k, v in config.items(section):
+            params[k] = float(v)
+    # Parameters of events not in the config file
+    params.update({'t_a_translocation_from_lymph_patch_by_cytokine_rate': 0.625,
+                   't_a_translocation_from_lymph_patch_by_cytokine_sigmoid': 0.25,
+                   't_a_translocation_from_lymph_patch_by_d_m_rate': 0.625,
+                   't_a_translocation_from_lymph_patch_by_d_m_sigmoid': 0.25,
+                   't_a_translocation_from_lymph_patch_by_d_m_half_sat': 75,
+                   'b_ed_translocation_from_lymph_patch_by_blood_rate': 0.1,
+                   'b_ed_translocation_from_lymph_patch_by_blood_half_sat': 50,
+                   'bacterium_change_rate': 1, 'bacterium_change_sigmoid': 2, 'bacterium_change_half_sat': 1,
+                   't_a_replication_rate': 0.1,
+                   'm_r_activation_by_b_er_b_ed_rate': 0.1, 'm_r_activation_by_b_er_b_ed_half_sat': 100})
+    params[TBDynamics.IC_BAC_LOCATION] = int(params[TBDynamics.IC_BAC_LOCATION])
+    # Lower recruitment, so the run is short
+    params['d_i_standard_recruitment_alveolar_patch_rate'] = 599.0
+    params['m_r_standard_recruitment_alveolar_patch_rate'] = 5990.0
+    return params
+
+
+def network_config():
+    return {TBPulmonaryEnvironment.TOPOLOGY: TBPulmonaryEnvironment.SPACE_FILLING_TREE_2D,
+            TBPulmonaryEnvironment.BOUNDARY: [(0, 5), (0, 10), (10, 10), (10, 0), (0, 0)],
+            TBPulmonaryEnvironment.LENGTH_DIVISOR: 2,
+            TBPulmonaryEnvironment.MINIMUM_AREA: 6}
+
+
+class TBDynamicsReplayTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dynamics = TBDynamics(network_config())
+        self.params = run_parameters()
+
+    def test_replay(self):
+        numpy.random.seed(2)
+        self.dynamics.set_maximum_time(1)
+        self.dynamics.set_record_trace(True)
+        self.dynamics.configure(self.params)
+        self.dynamics.setUp(self.params)
+        self.dynamics.do(self.params)
+        network = self.dynamics.network()
+        patches = {p: (dict(d[TypedEnvironment.COMPARTMENTS]), dict(d[TypedEnvironment.ATTRIBUTES]))
+                   for p, d in network.nodes(data=True)}
+        edges = {(u, v): dict(d) for u, v, d in network.edges(data=True)}
+        lymph_cytokine = network._lymph_cytokine
+
+        self.dynamics.replay(self.dynamics.trace(), [numpy.inf])
+        # Edge values (perfusion, etc.) are restored as held, not added again to those propagated from the patches
+        self.assertEqual({(u, v): d for u, v, d in network.edges(data=True)}, edges)
+        self.assertEqual({p: (d[TypedEnvironment.COMPARTMENTS], d[TypedEnvironment.ATTRIBUTES])
+                          for p, d in network.nodes(data=True)}, patches)
+        self.assertAlmostEqual(network._lymph_cytokine, lymph_cytokine)
+
+
+class TBDynamicsCytokineTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dynamics = TBDynamics(network_config())
+        self.params = run_parameters()
+        numpy.random.seed(2)
+        self.dynamics.configure(self.params)
+        self.dynamics.setUp(self.params)
+        self.network = self.dynamics.network()
+        self.network.update_patch(TBPulmonaryEnvironment.LYMPH_PATCH, {TBPulmonaryEnvironment.T_CELL_ACTIVATED: 4})
+
+    def assert_cytokine_rate(self):
+        event = [e for e in self.dynamics._events if isinstance(e, TranslocationLymphToLungCytokine)][0]
+        rate_table = self.dynamics._rate_table_for_patch[TBPulmonaryEnvironment.LYMPH_PATCH]
+        column = rate_table.events().index(event)
+        row = rate_table.row_for_patch(TBPulmonaryEnvironment.LYMPH_PATCH)
+        self.assertGreater(self.network.lymph_cytokine(), 0)
+        self.assertAlmostEqual(rate_table.state_variables()[row, column],
+                               event._calculate_state_variable_at_patch(self.network, TBPulmonaryEnvironment.LYMPH_PATCH))
+
+    def test_edge_cytokine(self):
+        lung = self.network.get_patches_by_type(TBPulmonaryEnvironment.ALVEOLAR_PATCH)[0]
+        self.network.update_edge(lung, TBPulmonaryEnvironment.LYMPH_PATCH, {TBPulmonaryEnvironment.CYTOKINE: 3})
+        self.assert_cytokine_rate()
+
+    def test_perfusion_and_infected_macrophages(self):
+        lung = self.network.get_patches_by_type(TBPulmonaryEnvironment.ALVEOLAR_PATCH)[1]
+        self.network.update_patch(lung, {TBPulmonaryEnvironment.MACROPHAGE_INFECTED: 2},
+                                  {TBPulmonaryEnvironment.PERFUSION: 0.5})
+        self.assert_cytokine_rate()
+        with self.network.transaction():
+            self.network.update_patch(lung, {TBPulmonaryEnvironment.MACROPHAGE_INFECTED: 1})
+            self.network.update_edge(lung, TBPulmonaryEnvironment.LYMPH_PATCH, {TBPulmonaryEnvironment.CYTOKINE: 2})
+        self.assert_cytokine_rate()
+
+
+class TBDynamicsWithHIVTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dynamics = TBDynamicsWithHIV(network_config())
+        self.params = run_parameters()
+        self.params[TBDynamicsWithHIV.HIV_INITIAL_TIME] = 5.0
+        self.params[TBDynamicsWithHIV.HIV_DROP] = 0.25
+        self.recruit_key = self.dynamics._lymph_recruit_keys[TBPulmonaryEnvironment.T_CELL_NAIVE]
+
+    def test_fork_drop(self):
+        numpy.random.seed(2)
+        self.dynamics.set_maximum_time(1)
+        self.dynamics.configure(self.params)
+        self.dynamics.setUp(self.params)
+        snapshot = self.dynamics.burn_in(self.params, 0.5)
+
+        fork_params = dict(self.params)
+        fork_params[self.recruit_key] = 400.0
+        fork_params[TBDynamicsWithHIV.HIV_INITIAL_TIME] = 3.0
+        self.dynamics._restore_run_state(snapshot, fork=True)
+        self.dynamics._set_up_fork(fork_params, 0.5)
+
+        drops = [(t, atts) for t, e, atts in self.dynamics._posted_events if e == '_drop_naive_t_cell_recruitment']
+        # Drop is of the fork's recruitment rate, not that of the burn-in
+        self.assertEqual(drops, [(3.0, [300.0])])
+
+
+class TBDynamicsReducedOutputTestCase(unittest.TestCase):
+
+    def setUp(self):
+        network_config = {TBPulmonaryEnvironment.TOPOLOGY: TBPulmonaryEnvironment.SPACE_FILLING_TREE_2D,
+                          TBPulmonaryEnvironment.BOUNDARY: [(0, 5), (0, 10), (10, 10), (10, 0), (0, 0)],
+                          TBPulmonaryEnvironment.LENGTH_DIVISOR: 2,
+                          TBPulmonaryEnvironment.MINIMUM_AREA: 6}
+        self.dynamics = TBDynamicsReducedOutput(network_config)
+        self.network = TBPulmonaryEnvironment(network_config)
+        self.network.reset()
+        for group, compartments in self.dynamics._output_projection.compartment_groups().iteritems():
+            self.network.add_compartment_group(group, compartments)
+
+    def test_projection(self):
+        alveolar = self.network.get_patches_by_type(TBPulmonaryEnvironment.ALVEOLAR_PATCH)[0]
+        self.network.update_patch(alveolar, {TBPulmonaryEnvironment.BACTERIUM_EXTRACELLULAR_REPLICATING: 3,
+                                             TBPulmonaryEnvironment.BACTERIUM_INTRACELLULAR_MACROPHAGE: 4,
+                                             TBPulmonaryEnvironment.SOLID_CASEUM: 1,
+                                             TBPulmonaryEnvironment.MACROPHAGE_RESTING: 10})
+        self.network.update_patch(TBPulmonaryEnvironment.LYMPH_PATCH, {TBPulmonaryEnvironment.T_CELL_NAIVE: 5,
+                                                                       TBPulmonaryEnvironment.T_CELL_ACTIVATED: 2,
+                                                                       TBPulmonaryEnvironment.MACROPHAGE_RESTING: 3})
+
+        recorder = ResultRecorder()
+        recorder.set_projection(self.dynamics._output_projection)
+        recorder.reset(self.network)
+        recorder.record(0.0, self.network, [TBPulmonaryEnvironment.LYMPH_PATCH, alveolar])
+        snapshot = recorder.results()[0.0]
+
+        self.assertEqual(snapshot[alveolar][TypedEnvironment.COMPARTMENTS],
+                         {TBPulmonaryEnvironment.TOTAL_BACTERIA: 7, TBDynamicsReducedOutput.TOTAL_CASEUM: 1})
+        self.assertEqual(snapshot[alveolar][TypedEnvironment.ATTRIBUTES], {})
+        self.assertEqual(snapshot[TBPulmonaryEnvironment.LYMPH_PATCH][TypedEnvironment.COMPARTMENTS],
+                         {TBPulmonaryEnvironment.TOTAL_BACTERIA: 0, TBDynamicsReducedOutput.TOTAL_MACROPHAGES: 3,
+                          TBDynamicsReducedOutput.TOTAL_DENDRITIC_CELLS: 0, TBDynamicsReducedOutput.TOTAL_T_CELLS: 7})
+        self.assertEqual(snapshot[TBPulmonaryEnvironment.LYMPH_PATCH][TypedEnvironment.ATTRIBUTES], {})
+
 
 if __name__ == '__main__':
     unittest.main()